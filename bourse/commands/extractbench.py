@@ -0,0 +1,198 @@
+#coding=utf-8
+import copy
+import json
+import time
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from scrapy.http import Headers, Request
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.misc import arg_to_iter
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+from bourse.utils.corpus import CORPUS_FIELDS, load_cases
+
+
+def percentile(costs, q):
+    costs = sorted(costs)
+    return costs[min(len(costs) - 1, int(len(costs) * q))]
+
+
+class Command(ScrapyCommand):
+    """
+    离线解析基准测试：用保存下来的详情页样本跑各爬虫的详情回调，
+    统计每个回调的docs/sec、p50/p95耗时和字段准确率，结果可以保存成json跟上次对比
+    """
+    requires_project = True
+
+    def syntax(self):
+        return '[options] [spider ...]'
+
+    def short_desc(self):
+        return 'Benchmark detail callbacks and field accuracy over the saved corpus'
+
+    def add_options(self, parser):
+        ScrapyCommand.add_options(self, parser)
+        parser.add_option("--record", action="store_true",
+                          help="crawl the given spiders and save detail responses into the corpus")
+        parser.add_option("--limit", type="int", default=200,
+                          help="stop each spider after this many items when recording")
+        parser.add_option("-c", "--callback", metavar="NAME",
+                          help="only run cases of this callback")
+        parser.add_option("-n", "--repeat", type="int", default=3,
+                          help="run every case this many times")
+        parser.add_option("-o", "--output", metavar="FILE",
+                          help="write results as json into FILE")
+        parser.add_option("--compare", metavar="FILE",
+                          help="compare results with a previous json result")
+
+    def process_options(self, args, opts):
+        ScrapyCommand.process_options(self, args, opts)
+        if opts.record:
+            # 录制时不入库，只保存样本
+            self.settings.set('ITEM_PIPELINES', {}, priority='cmdline')
+            self.settings.set('SPIDER_MIDDLEWARES', {'bourse.middlewares.CorpusRecorderMiddleware': 950}, priority='cmdline')
+            self.settings.set('CLOSESPIDER_ITEMCOUNT', opts.limit, priority='cmdline')
+        else:
+            # 在当前线程解析，回调返回的Deferred是已经触发的，不用启动reactor；不读缓存，测的是真实解析耗时
+            self.settings.set('PDF_EXTRACT_WORKERS', 0, priority='cmdline')
+            self.settings.set('PDF_CACHE_ENABLED', False, priority='cmdline')
+            self.settings.set('LOG_LEVEL', 'WARNING', priority='cmdline')
+
+    def run(self, args, opts):
+        corpus_dir = self.settings.get('BENCHMARK_CORPUS_DIR')
+        if opts.record:
+            for spidername in args or self.crawler_process.spider_loader.list():
+                self.crawler_process.crawl(spidername)
+            self.crawler_process.start()
+            return
+
+        cases = []
+        for spidername in args or [None]:
+            cases.extend(load_cases(corpus_dir, spidername, opts.callback))
+        if not cases:
+            raise UsageError(f'{corpus_dir}没有样本，先用 scrapy extractbench --record 录制', print_help=False)
+
+        results = self.benchmark(cases, max(opts.repeat, 1))
+        self.print_results(results)
+        if opts.output:
+            with open(opts.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+        if opts.compare:
+            with open(opts.compare, encoding='utf-8') as f:
+                baseline = json.load(f)
+            if not self.compare(baseline, results):
+                self.exitcode = 1
+
+    def benchmark(self, cases, repeat):
+        spiders = {}
+        costs = {}
+        errors = {}
+        fields = {field: {'total': 0, 'correct': 0} for field in CORPUS_FIELDS}
+        failures = []
+        for name, case, body in cases:
+            if case['spider'] not in spiders:
+                crawler = self.crawler_process.create_crawler(case['spider'])
+                spiders[case['spider']] = crawler.spidercls.from_crawler(crawler)
+            spider = spiders[case['spider']]
+            key = f"{case['spider']}.{case['callback']}"
+            for _ in range(repeat):
+                response = self.make_response(case, body)
+                start = time.perf_counter()
+                try:
+                    items = self.run_callback(spider, case['callback'], response)
+                except Exception as e:
+                    errors[key] = errors.get(key, 0) + 1
+                    failures.append(dict(case=name, error=repr(e)))
+                    # 出错的样本字段全部算错
+                    items = []
+                    break
+                costs.setdefault(key, []).append(time.perf_counter() - start)
+            for index, expected in enumerate(case['expected']):
+                actual = items[index] if index < len(items) else {}
+                for field, value in expected.items():
+                    if field not in fields:
+                        continue
+                    fields[field]['total'] += 1
+                    if actual.get(field, '') == value:
+                        fields[field]['correct'] += 1
+                    else:
+                        failures.append(dict(case=name, field=field, expected=value, actual=actual.get(field, '')))
+
+        callbacks = {}
+        for key, values in sorted(costs.items()):
+            callbacks[key] = dict(
+                docs=len(values) // repeat,
+                docs_per_sec=round(len(values) / sum(values), 2) if sum(values) else 0,
+                p50_ms=round(percentile(values, 0.5) * 1000, 2),
+                p95_ms=round(percentile(values, 0.95) * 1000, 2),
+                errors=errors.get(key, 0),
+            )
+        for key, count in errors.items():
+            callbacks.setdefault(key, dict(docs=0, docs_per_sec=0, p50_ms=0, p95_ms=0, errors=count))
+        for value in fields.values():
+            value['accuracy'] = round(value['correct'] / value['total'], 4) if value['total'] else None
+        return dict(
+            time=time.strftime('%Y-%m-%d %H:%M:%S'),
+            cases=len(cases),
+            repeat=repeat,
+            callbacks=callbacks,
+            fields=fields,
+            failures=failures,
+        )
+
+    @staticmethod
+    def make_response(case, body):
+        headers = Headers({'Content-Type': case.get('content_type') or ''})
+        respcls = responsetypes.from_args(headers=headers, url=case['url'], body=body)
+        request = Request(case['url'], meta=copy.deepcopy(case['meta']))
+        return respcls(url=case['url'], body=body, headers=headers, request=request)
+
+    @staticmethod
+    def run_callback(spider, callback, response):
+        result = getattr(spider, callback)(response)
+        if isinstance(result, defer.Deferred):
+            out = []
+            result.addBoth(out.append)
+            if not out:
+                raise RuntimeError('回调返回的Deferred没有触发，PDF_EXTRACT_WORKERS要设为0')
+            result = out[0]
+            if isinstance(result, Failure):
+                result.raiseException()
+        return [i for i in arg_to_iter(result) if isinstance(i, dict)]
+
+    @staticmethod
+    def print_results(results):
+        print(f"样本数: {results['cases']}, 每个样本运行{results['repeat']}次")
+        for key, value in results['callbacks'].items():
+            print(f"{key}: {value['docs']}个, {value['docs_per_sec']} docs/sec, "
+                  f"p50 {value['p50_ms']}ms, p95 {value['p95_ms']}ms, 出错{value['errors']}")
+        for field, value in results['fields'].items():
+            if value['total']:
+                print(f"{field}: 准确率{value['accuracy']:.2%} ({value['correct']}/{value['total']})")
+        for failure in results['failures'][:20]:
+            print(f'不一致: {failure}')
+
+    @staticmethod
+    def compare(baseline, results):
+        """ 跟上次的结果对比，字段准确率下降返回False """
+        print(f"对比 {baseline.get('time')} -> {results['time']}")
+        for key, value in results['callbacks'].items():
+            old = baseline.get('callbacks', {}).get(key)
+            if not old or not old['docs_per_sec']:
+                continue
+            change = (value['docs_per_sec'] - old['docs_per_sec']) / old['docs_per_sec']
+            print(f"{key}: {old['docs_per_sec']} -> {value['docs_per_sec']} docs/sec ({change:+.1%}), "
+                  f"p95 {old['p95_ms']} -> {value['p95_ms']}ms")
+        ok = True
+        for field, value in results['fields'].items():
+            old = baseline.get('fields', {}).get(field)
+            if not old or old.get('accuracy') is None or value['accuracy'] is None:
+                continue
+            if value['accuracy'] < old['accuracy']:
+                ok = False
+                print(f"{field}: 准确率下降 {old['accuracy']:.2%} -> {value['accuracy']:.2%}")
+            elif value['accuracy'] != old['accuracy']:
+                print(f"{field}: 准确率 {old['accuracy']:.2%} -> {value['accuracy']:.2%}")
+        return ok
@@ -0,0 +1,97 @@
+#coding=utf-8
+import os
+import time
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from bourse.utils.bulk_writer import EsBatchWriter
+from bourse.utils.elastic_util import EsObject
+from bourse.utils.filter_fact import get_content_hash
+from bourse.utils.sinks import read_sink_file, sink_files
+
+
+class Command(ScrapyCommand):
+    """
+    把STORAGE_SINK=jsonl/parquet采集下来的文件批量写入ES，采集和入库可以分开跑
+    按ES_WRITE_MODE写入: create库里已有的算已存在，upsert内容变了的局部更新；全部写入成功的文件移到loaded目录，中断后重跑不会重复加载
+    """
+    requires_project = True
+
+    def syntax(self):
+        return '[options] [file ...]'
+
+    def short_desc(self):
+        return 'Bulk load local sink files into Elasticsearch'
+
+    def add_options(self, parser):
+        ScrapyCommand.add_options(self, parser)
+        parser.add_option("-d", "--dir", metavar="DIR",
+                          help="load every finished file in DIR (default: SINK_DIR)")
+        parser.add_option("-b", "--batch", type="int",
+                          help="documents per bulk request (default: ES_BULK_MAX_DOCS)")
+        parser.add_option("--include-partial", action="store_true",
+                          help="also load jsonl files left behind by a crashed crawl")
+        parser.add_option("--keep", action="store_true",
+                          help="do not move loaded files into the loaded directory")
+
+    def run(self, args, opts):
+        directory = opts.dir or self.settings.get('SINK_DIR')
+        paths = args or sink_files(directory, opts.include_partial)
+        if not paths:
+            raise UsageError(f'{directory}没有需要加载的文件', print_help=False)
+        batch_size = opts.batch or self.settings.getint('ES_BULK_MAX_DOCS')
+        es = EsObject(index_name=self.settings.get('INDEX_NAME'), index_type=self.settings.get('INDEX_TYPE'),
+                      host=self.settings.get('ES_HOST'), port=self.settings.getint('ES_PORT'), settings=self.settings)
+        writer = EsBatchWriter.from_settings(es, self.settings)
+
+        total = dict(docs=0, created=0, duplicates=0, updated=0, unchanged=0, failed=0)
+        start = time.time()
+        for path in paths:
+            counts = self.load_file(writer, path, batch_size)
+            for key, value in counts.items():
+                total[key] += value
+            if not counts['failed'] and not opts.keep and not args:
+                self.move_loaded(path)
+        cost = time.time() - start
+        print(f"共{len(paths)}个文件, {total['docs']}条: 新增{total['created']}, 已存在{total['duplicates']}, "
+              f"更新{total['updated']}, 没变化{total['unchanged']}, 失败{total['failed']}, 耗时{cost:.1f}秒, {total['docs'] / cost if cost else 0:.1f} docs/sec")
+        if total['failed']:
+            self.exitcode = 1
+
+    @staticmethod
+    def load_file(writer, path, batch_size):
+        counts = dict(docs=0, created=0, duplicates=0, updated=0, unchanged=0, failed=0)
+        start = time.time()
+        upsert = writer.mode == 'upsert'
+
+        def write(docs):
+            result = writer.write(docs)
+            counts['docs'] += len(docs)
+            for kind, ids in result.items():
+                counts[kind] += len(ids)
+            for _id, error in result['failed'][:10]:
+                print(f'写入失败{_id}: {error}')
+
+        docs = []
+        for _id, item in read_sink_file(path):
+            if upsert and 'content_hash' not in item:
+                item['content_hash'] = get_content_hash(item)
+            # create模式直接写，已存在的返回409；upsert模式都要先查content_hash
+            docs.append((_id, item, upsert))
+            if len(docs) >= batch_size:
+                write(docs)
+                docs = []
+        if docs:
+            write(docs)
+        cost = time.time() - start
+        print(f"{os.path.basename(path)}: {counts['docs']}条, 新增{counts['created']}, 已存在{counts['duplicates']}, "
+              f"更新{counts['updated']}, 没变化{counts['unchanged']}, 失败{counts['failed']}, {counts['docs'] / cost if cost else 0:.1f} docs/sec")
+        return counts
+
+    @staticmethod
+    def move_loaded(path):
+        loaded_dir = os.path.join(os.path.dirname(path), 'loaded')
+        if not os.path.exists(loaded_dir):
+            os.makedirs(loaded_dir)
+        os.replace(path, os.path.join(loaded_dir, os.path.basename(path)))
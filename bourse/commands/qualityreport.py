@@ -0,0 +1,218 @@
+#coding=utf-8
+import hashlib
+import json
+import os
+import time
+
+from scrapy.commands import ScrapyCommand
+
+from bourse.tools.es_client import ESClient
+
+# sj_bs_bj枚举值
+SJ_BS_BJ_CODES = {
+    '0': '正常',
+    '1': '依据 事由结果 都为空',
+    '2': '处罚日期发布日期 都为空',
+    '3': '地区名称为空',
+    '4': '文书号长度超过50',
+    '5': '主体长度超过60',
+    '6': '机关长度超过50',
+    '7': '法人长度超过12',
+    '8': '主体名称包含错误词',
+    '9': '法人名称包含错误词',
+    '10': '文书号包含错误词',
+    '11': '机关包含错误词',
+    '12': '事由 结果 都为空',
+    '13': '处罚日期大于当前日期',
+    '14': '处罚日期为空',
+    '15': '机关名称为空',
+    '16': '主体名称包含码',
+    '17': '主体名称关于，将开始的',
+    '18': '文书号为空',
+    '19': '本地运行的采集',
+    '20': '本地文件上传',
+}
+# 按来源统计，其他字段在每个来源下统计
+SOURCE_FIELD = 'xxly'
+COUNT_FIELDS = ('sj_bs_bj', 'sj_type', 'sj_ztxx')
+
+
+class Command(ScrapyCommand):
+    """
+    数据质量报告: 用聚合统计sj_bs_bj、sj_type、sj_ztxx的分布，以及每个来源(xxly)下的分布，不遍历数据
+    来源多用composite聚合分页，结果按查询条件缓存QUALITY_REPORT_TTL秒
+    """
+    requires_project = True
+
+    def syntax(self):
+        return '[options]'
+
+    def short_desc(self):
+        return 'Report sj_bs_bj / xxly / sj_type / sj_ztxx counts with aggregations'
+
+    def add_options(self, parser):
+        ScrapyCommand.add_options(self, parser)
+        parser.add_option("-x", "--xxly", metavar="SOURCE",
+                          help="only report this source (xxly)")
+        parser.add_option("--qx", action="store_true",
+                          help="report the cleaned index (QX_ES_*) instead of the crawl index (ES_HOST_NAME)")
+        parser.add_option("--top", type="int", default=30,
+                          help="print this many sources, ordered by flagged records")
+        parser.add_option("--refresh", action="store_true",
+                          help="ignore the cached report")
+        parser.add_option("-o", "--output", metavar="FILE",
+                          help="write the full report as json into FILE")
+
+    def run(self, args, opts):
+        if opts.qx:
+            client = ESClient(self.settings.get('QX_ES_HOST'), index_name=self.settings.get('QX_ES_INDEX_NAME'),
+                              index_type=self.settings.get('QX_ES_INDEX_TYPE'), settings=self.settings)
+        else:
+            client = ESClient(self.settings.get('ES_HOST_NAME'), index_name=self.settings.get('ES_INDEX_NAME'),
+                              index_type=self.settings.get('ES_INDEX_TYPE'), settings=self.settings)
+        # 缓存命中时不访问es
+        cache_path = self.cache_path(client.index_name, opts.xxly)
+        report = None if opts.refresh else self.load_cache(cache_path)
+        if report is None:
+            query = {'match_all': {}}
+            if opts.xxly:
+                query = {'term': {self.agg_field(client, SOURCE_FIELD): opts.xxly}}
+            start = time.time()
+            report = self.build_report(client, query)
+            report['seconds'] = round(time.time() - start, 2)
+            self.save_cache(cache_path, report)
+        self.print_report(report, opts.top)
+        if opts.output:
+            with open(opts.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def agg_field(client, name):
+        """ text字段用.keyword子字段聚合 """
+        mapping = client.es.indices.get_field_mapping(index=client.index_name, fields=name)
+        stack = [mapping]
+        while stack:
+            node = stack.pop()
+            if not isinstance(node, dict):
+                continue
+            if 'mapping' in node:
+                for value in node['mapping'].values():
+                    if value.get('type') == 'text' and 'keyword' in value.get('fields', {}):
+                        return f'{name}.keyword'
+                return name
+            stack.extend(node.values())
+        return name
+
+    def build_report(self, client, query):
+        fields = {name: self.agg_field(client, name) for name in (SOURCE_FIELD,) + COUNT_FIELDS}
+        counts_aggs = {name: {'terms': {'field': fields[name], 'size': 200}} for name in COUNT_FIELDS}
+        requests = 1
+        # 总体分布和来源数一次请求
+        body = {
+            'size': 0,
+            'query': query,
+            'aggs': dict(counts_aggs, sources={'cardinality': {'field': fields[SOURCE_FIELD]}}),
+        }
+        if self.es_major_version(client) >= 7:
+            # ES7默认总数最多算到10000
+            body['track_total_hits'] = True
+        result = client.search_by_query(body)
+        total = self.hits_total(result)
+        aggregations = result['aggregations']
+        report = dict(
+            index=client.index_name,
+            query=query,
+            time=time.strftime('%Y-%m-%d %H:%M:%S'),
+            total=total,
+            source_count=aggregations['sources']['value'],
+            overall={name: self.bucket_counts(aggregations[name], total) for name in COUNT_FIELDS},
+            sources=[],
+        )
+
+        # 每个来源下的分布，composite聚合分页
+        page_size = self.settings.getint('QUALITY_REPORT_PAGE_SIZE')
+        after = None
+        while True:
+            composite = {'size': page_size, 'sources': [{SOURCE_FIELD: {'terms': {'field': fields[SOURCE_FIELD]}}}]}
+            if after:
+                composite['after'] = after
+            body = {'size': 0, 'query': query, 'aggs': {'by_source': {'composite': composite, 'aggs': counts_aggs}}}
+            result = client.search_by_query(body)
+            requests += 1
+            agg = result['aggregations']['by_source']
+            for bucket in agg['buckets']:
+                report['sources'].append(dict(
+                    xxly=bucket['key'][SOURCE_FIELD],
+                    total=bucket['doc_count'],
+                    **{name: self.bucket_counts(bucket[name], bucket['doc_count']) for name in COUNT_FIELDS}
+                ))
+            after = agg.get('after_key')
+            if len(agg['buckets']) < page_size or not after:
+                break
+        report['requests'] = requests
+        return report
+
+    @staticmethod
+    def es_major_version(client):
+        return int(client.es.info()['version']['number'].split('.')[0])
+
+    @staticmethod
+    def hits_total(result):
+        total = result['hits']['total']
+        return total['value'] if isinstance(total, dict) else total
+
+    @staticmethod
+    def bucket_counts(agg, doc_count):
+        """ {值: 条数}，没有这个字段的记为'未设置' """
+        counts = {str(bucket['key']): bucket['doc_count'] for bucket in agg['buckets']}
+        missing = doc_count - sum(counts.values()) - agg.get('sum_other_doc_count', 0)
+        if missing > 0:
+            counts['未设置'] = missing
+        return counts
+
+    @staticmethod
+    def flagged(counts):
+        """ sj_bs_bj不是0(正常)的条数 """
+        return sum(count for code, count in counts.items() if code not in ('0', '未设置'))
+
+    def cache_path(self, index_name, xxly):
+        key = hashlib.md5(json.dumps([index_name, xxly], ensure_ascii=False).encode('utf-8')).hexdigest()
+        return os.path.join(self.settings.get('QUALITY_REPORT_CACHE_DIR'), key + '.json')
+
+    def load_cache(self, path):
+        if not os.path.exists(path):
+            return None
+        if time.time() - os.path.getmtime(path) > self.settings.getint('QUALITY_REPORT_TTL'):
+            return None
+        with open(path, encoding='utf-8') as f:
+            report = json.load(f)
+        report['cached'] = True
+        return report
+
+    @staticmethod
+    def save_cache(path, report):
+        dirname = os.path.dirname(path)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def print_report(self, report, top):
+        source = '缓存' if report.get('cached') else f"{report['requests']}次请求"
+        print(f"{report['index']} {report['time']} ({source}, 耗时{report['seconds']}秒)")
+        print(f"共{report['total']}条, 来源{report['source_count']}个")
+        for name in COUNT_FIELDS:
+            print(f'{name}:')
+            for value, count in sorted(report['overall'][name].items(), key=lambda kv: -kv[1]):
+                label = SJ_BS_BJ_CODES.get(value, '') if name == 'sj_bs_bj' else ''
+                print(f"    {value:>6} {count:>10} {count / report['total']:7.2%} {label}" if report['total'] else
+                      f"    {value:>6} {count:>10} {label}")
+        sources = sorted(report['sources'], key=lambda s: (-self.flagged(s['sj_bs_bj']), -s['total']))
+        print(f'问题数据最多的{min(top, len(sources))}个来源:')
+        for item in sources[:top]:
+            flags = ', '.join(f'{code}:{count}' for code, count in sorted(item['sj_bs_bj'].items(), key=lambda kv: -kv[1])
+                              if code not in ('0', '未设置'))
+            status = ', '.join(f'{value}:{count}' for value, count in item['sj_ztxx'].items())
+            print(f"  {item['xxly']}: {item['total']}条, 有问题{self.flagged(item['sj_bs_bj'])} [{flags}], sj_ztxx [{status}]")
@@ -0,0 +1,197 @@
+#coding=utf-8
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from scrapy.commands import ScrapyCommand
+
+from bourse.utils.bulk_writer import EsBatchWriter
+from bourse.utils.elastic_util import EsObject
+from bourse.utils.filter_fact import get_content_hash
+from bourse.utils.spool import SpoolCheckpoint, list_segments, read_frames, segment_key, tail_state
+
+
+class Command(ScrapyCommand):
+    """
+    读STORAGE_SINK=spool写下的段文件，批量写入ES，跟采集各跑各的
+    多个批次同时写入，按顺序提交断点，进程退出或者崩溃后从最后提交的偏移继续
+    按ES_WRITE_MODE写入，create模式重复写入的按已存在(409)处理，upsert模式内容变了的局部更新
+    写完并且已封存的段文件删除，中间有校验不对的记录的段文件移到quarantine目录，写入失败的数据记到failed.jsonl
+    """
+    requires_project = True
+
+    def syntax(self):
+        return '[options]'
+
+    def short_desc(self):
+        return 'Tail the local spool and bulk load it into Elasticsearch'
+
+    def add_options(self, parser):
+        ScrapyCommand.add_options(self, parser)
+        parser.add_option("-w", "--workers", type="int",
+                          help="concurrent bulk requests (default: SPOOL_INDEX_WORKERS)")
+        parser.add_option("-b", "--batch", type="int",
+                          help="documents per bulk request (default: ES_BULK_MAX_DOCS)")
+        parser.add_option("--once", action="store_true",
+                          help="exit when the spool is drained instead of waiting for new data")
+
+    def run(self, args, opts):
+        self.directory = self.settings.get('SPOOL_DIR')
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        self.batch_size = opts.batch or self.settings.getint('ES_BULK_MAX_DOCS')
+        workers = opts.workers or self.settings.getint('SPOOL_INDEX_WORKERS')
+        poll = self.settings.getfloat('SPOOL_POLL_INTERVAL')
+        self.es = EsObject(index_name=self.settings.get('INDEX_NAME'), index_type=self.settings.get('INDEX_TYPE'),
+                           host=self.settings.get('ES_HOST'), port=self.settings.getint('ES_PORT'), settings=self.settings)
+        self.writer = EsBatchWriter.from_settings(self.es, self.settings)
+        self.checkpoint = SpoolCheckpoint(os.path.join(self.directory, 'checkpoint.json'))
+        # 已经读到的位置，比提交的断点靠前
+        self.positions = dict(self.checkpoint.offsets)
+        self.inflight = deque()
+        self.counts = dict(docs=0, created=0, duplicates=0, updated=0, unchanged=0, failed=0)
+        self.start = self.last_report = time.time()
+        # Ctrl-C后写入线程不再重试
+        self.stopping = threading.Event()
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            while True:
+                submitted = self.read_segments(executor, workers)
+                self.commit_done()
+                if not submitted:
+                    if not self.inflight and opts.once:
+                        break
+                    if self.inflight:
+                        self.commit_next()
+                    else:
+                        time.sleep(poll)
+                self.report()
+        except KeyboardInterrupt:
+            print('等待写入中的批次完成后退出')
+            self.stopping.set()
+        finally:
+            executor.shutdown(wait=True)
+            self.commit_done()
+            self.report(force=True)
+
+    def read_segments(self, executor, workers):
+        """ 从每个段文件读到的位置接着读，切成批次提交，在写的批次满了先等最早的一批 """
+        submitted = 0
+        for path, sealed in list_segments(self.directory):
+            key = segment_key(path)
+            position = self.positions.get(key, 0)
+            docs = []
+            try:
+                for _id, item, end in read_frames(path, position):
+                    docs.append((_id, item))
+                    position = end
+                    if len(docs) >= self.batch_size:
+                        self.submit(executor, workers, key, docs, position)
+                        submitted += 1
+                        docs = []
+            except FileNotFoundError:
+                # 读的时候刚好被爬虫封存改名，下一轮读.seg
+                continue
+            if docs:
+                self.submit(executor, workers, key, docs, position)
+                submitted += 1
+            if sealed and not any(batch_key == key for future, batch_key, end in self.inflight):
+                self.finish_segment(path, key, position)
+        return submitted
+
+    def submit(self, executor, workers, key, docs, end):
+        while len(self.inflight) >= workers:
+            self.commit_next()
+        self.positions[key] = end
+        self.inflight.append((executor.submit(self.write, docs), key, end))
+
+    def write(self, docs):
+        """ 在线程池里执行，ES出错一直退避重试，不丢数据；退出时不再重试，返回的结果是None """
+        upsert = self.writer.mode == 'upsert'
+        batch = []
+        for _id, item in docs:
+            if upsert and 'content_hash' not in item:
+                item['content_hash'] = get_content_hash(item)
+            batch.append((_id, item, upsert))
+        delay = 1
+        while not self.stopping.is_set():
+            try:
+                return docs, self.writer.write(batch)
+            except Exception as e:
+                print(f'写入ES出错{repr(e)}，{delay}秒后重试')
+                self.stopping.wait(delay)
+                delay = min(delay * 2, 60)
+        return docs, None
+
+    def commit_next(self):
+        """
+        等最早的一批写完，提交它的偏移
+        提交后才从inflight移除，等待时Ctrl-C这一批还在最前面，退出前的commit_done不会跳过它提交后面的批次
+        """
+        future, key, end = self.inflight[0]
+        docs, result = future.result()
+        if result is None:
+            # 退出时没写入的批次，后面的批次也不能提交，下次从这一批接着写
+            self.inflight.clear()
+            return
+        self.counts['docs'] += len(docs)
+        for kind, ids in result.items():
+            self.counts[kind] += len(ids)
+        if result['failed']:
+            self.save_failed(docs, result['failed'])
+        self.checkpoint.commit(key, end)
+        self.inflight.popleft()
+
+    def commit_done(self):
+        while self.inflight and self.inflight[0][0].done():
+            self.commit_next()
+
+    def finish_segment(self, path, key, position):
+        """
+        已封存的段文件全部写完，删除文件和断点
+        读到一半停下的: 末尾是没写完的记录(意外退出)照常删除，中间有校验不对的记录移到quarantine目录，后面的记录人工处理
+        """
+        if self.checkpoint.get(key) != position:
+            return
+        name = os.path.basename(path)
+        state = tail_state(path, position)
+        if state == 'corrupt':
+            quarantine_dir = os.path.join(self.directory, 'quarantine')
+            if not os.path.exists(quarantine_dir):
+                os.makedirs(quarantine_dir)
+            size = os.path.getsize(path)
+            os.replace(path, os.path.join(quarantine_dir, name))
+            print(f'{name}偏移{position}的记录校验不对，后面{size - position}字节没有写入，已移到{quarantine_dir}')
+        else:
+            if state == 'truncated':
+                print(f'{name}末尾{os.path.getsize(path) - position}字节是没写完的记录，已跳过')
+            os.remove(path)
+        self.checkpoint.remove(key)
+        self.positions.pop(key, None)
+
+    def save_failed(self, docs, failed):
+        items = dict(docs)
+        with open(os.path.join(self.directory, 'failed.jsonl'), 'a', encoding='utf-8') as f:
+            for _id, error in failed:
+                f.write(json.dumps({'_id': _id, 'error': error, '_source': items.get(_id)}, ensure_ascii=False) + '\n')
+
+    def report(self, force=False):
+        now = time.time()
+        if not force and now - self.last_report < 30:
+            return
+        self.last_report = now
+        lag = 0
+        for path, sealed in list_segments(self.directory):
+            try:
+                lag += os.path.getsize(path) - self.checkpoint.get(segment_key(path))
+            except FileNotFoundError:
+                continue
+        cost = now - self.start
+        counts = self.counts
+        print(f"已写入{counts['docs']}条: 新增{counts['created']}, 已存在{counts['duplicates']}, "
+              f"更新{counts['updated']}, 没变化{counts['unchanged']}, 失败{counts['failed']}, "
+              f"{counts['docs'] / cost if cost else 0:.1f} docs/sec, 未写入{lag / 1024 / 1024:.1f}MB")
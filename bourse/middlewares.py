@@ -1,5 +1,17 @@
 # -*- coding: utf-8 -*-
+import logging
+import os
+
 from fake_useragent import UserAgent
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Request
+
+from bourse.signals import item_stored
+from bourse.utils.corpus import save_case
+from bourse.utils.fingerprint_store import FingerprintStore
+
+logger = logging.getLogger(__name__)
 
 
 class RandomUserAgentMiddleware(object):
@@ -19,4 +31,122 @@ class RandomUserAgentMiddleware(object):
     def process_request(self, request, spider):
         def get_user_agent():
             return getattr(self.ua, self.ua_type)
-        request.headers.setdefault(b'User-Agent', get_user_agent())
\ No newline at end of file
+        request.headers.setdefault(b'User-Agent', get_user_agent())
+
+
+class CorpusRecorderMiddleware(object):
+    """
+    录制基准测试样本，extractbench --record时启用
+    回调产出的item里xq_url是当前页面的，就是详情页，每个回调最多保存BENCHMARK_RECORD_PER_CALLBACK个
+    """
+    def __init__(self, corpus_dir, per_callback):
+        self.corpus_dir = corpus_dir
+        self.per_callback = per_callback
+        self.counts = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            corpus_dir=crawler.settings.get('BENCHMARK_CORPUS_DIR'),
+            per_callback=crawler.settings.getint('BENCHMARK_RECORD_PER_CALLBACK', 5),
+        )
+
+    def process_spider_output(self, response, result, spider):
+        items = []
+        for i in result:
+            if isinstance(i, dict) and i.get('xq_url') == response.url:
+                items.append(i)
+            yield i
+        callback = getattr(response.request.callback, '__name__', None)
+        if not items or not callback:
+            return
+        key = (spider.name, callback)
+        if self.counts.get(key, 0) >= self.per_callback:
+            return
+        self.counts[key] = self.counts.get(key, 0) + 1
+        path = save_case(self.corpus_dir, spider.name, response, items)
+        spider.logger.info(f'保存样本:{path}')
+
+
+class PaginationMiddleware(object):
+    """
+    列表页回调产出的结果处理完后，交给PaginationSpiderMixin.finish_page:
+    回调没有走到paginate的也能补上翻页请求，详情请求带上栏目，详情没采集成功时这个栏目不更新高水位
+    回调走完才知道是哪个栏目的列表页，所以先把一页的结果收齐
+    """
+    def process_spider_output(self, response, result, spider):
+        finish_page = getattr(spider, 'finish_page', None)
+        if finish_page is None:
+            yield from result
+            return
+        yield from finish_page(response, list(result))
+
+
+class DeltaFetchMiddleware(object):
+    """
+    增量下载，已入库数据的详情链接(xq_url)记在本地，下次采集不再请求这些详情页，
+    列表页直接产出的doc/docx数据也不再交给文件管道下载
+    存储管道发出item_stored信号才记录，列表页请求(dont_filter或者meta带catalog)不过滤
+    存到本地文件(STORAGE_SINK不是es)时默认不记录，见SINK_RECORD_STORED
+    -a deltafetch_reset=1 清空记录
+    """
+    def __init__(self, store_dir, cache_size, reset, stats):
+        self.store_dir = store_dir
+        self.cache_size = cache_size
+        self.reset = reset
+        self.stats = stats
+        self.store = None
+        # 本次请求过的列表页，没有源文件的数据xq_url是列表页，不能记
+        self.list_urls = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('DELTAFETCH_ENABLED'):
+            raise NotConfigured
+        middleware = cls(
+            store_dir=crawler.settings.get('DELTAFETCH_DIR'),
+            cache_size=crawler.settings.getint('DELTAFETCH_CACHE_SIZE'),
+            reset=crawler.settings.getbool('DELTAFETCH_RESET'),
+            stats=crawler.stats,
+        )
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(middleware.item_stored, signal=item_stored)
+        return middleware
+
+    def spider_opened(self, spider):
+        self.store = FingerprintStore(os.path.join(self.store_dir, f'{spider.name}.db'), self.cache_size)
+        if self.reset or getattr(spider, 'deltafetch_reset', None) in ('1', 'true', 'True'):
+            self.store.clear()
+            logger.info(f'{spider.name}: 已清空增量下载记录')
+
+    def spider_closed(self, spider):
+        self.store.close()
+
+    @staticmethod
+    def is_list_page(request):
+        return request.dont_filter or 'catalog' in request.meta
+
+    def item_stored(self, item, spider):
+        """ 已入库或者库里已有才记录 """
+        if not isinstance(item, dict) or not item.get('xq_url') or item['xq_url'] in self.list_urls:
+            return
+        if self.store.add(item['xq_url']):
+            self.stats.inc_value('deltafetch/stored', spider=spider)
+
+    def process_spider_input(self, response, spider):
+        if self.is_list_page(response.request):
+            self.list_urls.add(response.url)
+
+    def process_spider_output(self, response, result, spider):
+        for i in result:
+            if isinstance(i, Request):
+                if not self.is_list_page(i) and i.url in self.store:
+                    self.stats.inc_value('deltafetch/skipped', spider=spider)
+                    logger.debug(f'已入库，跳过:{i.url}')
+                    continue
+            elif isinstance(i, dict) and i.get('xq_url') and i['xq_url'] != response.url:
+                if i['xq_url'] in self.store:
+                    self.stats.inc_value('deltafetch/skipped', spider=spider)
+                    continue
+            yield i
@@ -1,11 +1,9 @@
 # -*- coding: utf-8 -*-
 import math
 import os
-import re
 import time
 
 import logging
-from functools import reduce
 
 import scrapy
 from scrapy.exceptions import DropItem
@@ -13,8 +11,15 @@ from scrapy.pipelines.images import FilesPipeline
 
 from bourse import settings
 from bourse.settings import FILES_STORE
+from bourse.signals import item_stored
+from bourse.utils.bloom_filter import get_id_filter
+from bourse.utils.bulk_writer import EsBulkWriter
 from bourse.utils.elastic_util import EsObject
-from bourse.utils.filter_fact import cf_filter_fact
+from bourse.utils.es_pool import pool_metrics
+from bourse.utils.field_rules import get_field_rules
+from bourse.utils.filter_fact import cf_filter_fact, get_content_hash
+from bourse.utils.normalize import join_text
+from bourse.utils.sinks import open_file_sink
 
 logger = logging.getLogger(__name__)
 
@@ -58,7 +63,6 @@ class DownloadFilesPipeline(FilesPipeline):
             logger.debug('既不是PDF也不是word纯文本')
 
     def item_completed(self, results, item, info):
-        re_com = re.compile(r'\r|\n|\t|\s')
         image_paths = [x['path'] for ok, x in results if ok]
         if not image_paths:
             item['cf_file_name'] = ''
@@ -69,38 +73,16 @@ class DownloadFilesPipeline(FilesPipeline):
             if image_paths[0].endswith('doc'):
                 docx_list = self.parse_doc2docx(file_path)
                 if docx_list:
-                    docx_text = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in docx_list])
-                    oname_pattern = re.compile(r'(关于对)(.*?公司)')
-                    cf_sy_pattern = re.compile(r'(存在以下问题：|违规事实：|存在以下违规行为：|存在以下违规事实：)(.*?。)')
-                    cf_yj_pattern = re.compile(r'((违反了本所|依据本所|根据).*?规定)')
-                    cf_jg_pattern = re.compile(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：).*?。)')
-                    oname = oname_pattern.search(docx_text)
-                    item['oname'] = oname.group(2) if oname else ''
-                    cf_sy = cf_sy_pattern.search(docx_text)
-                    item['cf_sy'] = cf_sy.group(2) if cf_sy else ''
-                    cf_yj = cf_yj_pattern.search(docx_text)
-                    item['cf_yj'] = cf_yj.group(1) if cf_yj else ''
-                    cf_jg = cf_jg_pattern.search(docx_text)
-                    item['cf_jg'] = cf_jg.group(1) if cf_jg else ''
+                    docx_text = join_text(docx_list)
+                    item.update(get_field_rules('深圳证券交易所', 'doc').extract(docx_text))
                     item['ws_nr_txt'] = docx_text
                 else:
                     logger.info('深圳证券交易所-获取不到word文档里面的内容--只把基本内容存到数据库')
             elif image_paths[0].endswith('docx'):
                 docx_list = self.parse_docx(file_path)
                 if docx_list:
-                    docx_text = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in docx_list])
-                    oname_pattern = re.compile(r'(关于对)(.*?公司)')
-                    cf_sy_pattern = re.compile(r'(存在以下问题：|违规事实：|存在以下违规行为：|董事会 ：|存在以下违规事实：)(.*?。)')
-                    cf_yj_pattern = re.compile(r'((违反了本所|依据本所|根据|是否符合).*?规定)')
-                    cf_jg_pattern = re.compile(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：|请你公司).*?。)')
-                    oname = oname_pattern.search(docx_text)
-                    item['oname'] = oname.group(2) if oname else ''
-                    cf_sy = cf_sy_pattern.search(docx_text)
-                    item['cf_sy'] = cf_sy.group(2) if cf_sy else ''
-                    cf_yj = cf_yj_pattern.search(docx_text)
-                    item['cf_yj'] = cf_yj.group(1) if cf_yj else ''
-                    cf_jg = cf_jg_pattern.search(docx_text)
-                    item['cf_jg'] = cf_jg.group(1) if cf_jg else ''
+                    docx_text = join_text(docx_list)
+                    item.update(get_field_rules('深圳证券交易所', 'docx').extract(docx_text))
                     item['ws_nr_txt'] = docx_text
                 else:
                     logger.info('直接读取docx文件失败')
@@ -169,7 +151,6 @@ class DealShanghaiFilesPipeline(FilesPipeline):
             logger.debug('既不是PDF也不是word纯文本')
 
     def item_completed(self, results, item, info):
-        re_com = re.compile(r'\r|\n|\t|\s')
         image_paths = [x['path'] for ok, x in results if ok]
         if not image_paths:
             item['cf_file_name'] = ''
@@ -182,25 +163,17 @@ class DealShanghaiFilesPipeline(FilesPipeline):
                 if docx_list:
                     cf_cfmc = docx_list[0].replace('标题：', '')
                     cf_sy = docx_list[-1].replace('处理事由：', '')
-                    docx_text = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in docx_list])
-                    cf_sy_second = re.search(r'(经查明|经审核|经查.*?。)', docx_text)
-                    cf_sy_second = cf_sy_second.group(1) if cf_sy_second else ''
-                    oname_one = re.search(r'(关于对|当事人：|关于)(.*?)(名下证券账户)', docx_text)
-                    oname_one = oname_one.group(2) if oname_one else ''
-                    oname_two = re.search(r'(关于对|当事人：|关于)(.*?公司)', docx_text)
-                    oname_two = oname_two.group(2) if oname_two else ''
-                    oname = oname_one if oname_one else oname_two
+                    docx_text = join_text(docx_list)
+                    fields = get_field_rules('上海证券交易所', 'doc').extract(docx_text)
+                    cf_sy_second = fields['cf_sy']
+                    oname = fields['oname_one'] if fields['oname_one'] else fields['oname_two']
                     item['oname'] = oname if oname else item.get('oname')
                     item['cf_cfmc'] = cf_cfmc if cf_cfmc else ''
                     cf_sy = cf_sy if cf_sy else cf_sy_second
                     item['cf_sy'] = cf_sy_second if '年' in cf_sy else cf_sy
                     item['ws_nr_txt'] = docx_text if docx_text else ''
-                    cf_yj = re.search(r'(根据.*?规定)', docx_text)
-                    cf_yj = cf_yj.group(1) if cf_yj else ''
-                    item['cf_yj'] = cf_yj
-                    cf_jg = re.search(r'((做出如下纪律处分决定：|本所决定|决定对).*?。)', docx_text)
-                    cf_jg = cf_jg.group(1) if cf_jg else ''
-                    item['cf_jg'] = cf_jg
+                    item['cf_yj'] = fields['cf_yj']
+                    item['cf_jg'] = fields['cf_jg']
                 else:
                     logger.info("上海证券交易所-读取不到word文件")
 
@@ -260,7 +233,6 @@ class DealNationalFilesPipeline(FilesPipeline):
             logger.debug('既不是PDF也不是word纯文本')
 
     def item_completed(self, results, item, info):
-        re_com = re.compile(r'\r|\n|\t|\s')
         image_paths = [x['path'] for ok, x in results if ok]
         if not image_paths:
             item['cf_file_name'] = ''
@@ -271,48 +243,16 @@ class DealNationalFilesPipeline(FilesPipeline):
             if image_paths[0].endswith('doc'):
                 docx_list = self.parse_doc2docx(file_path)
                 if docx_list:
-                    docx_text = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in docx_list])
-                    cf_wsh_pattern = re.compile(r'(问询函)(半年报问询函.*?号)')
-                    cf_sy_pattern = re.compile(r'((关注到以下情况：|经查明|经审阅|请你公司补充披露以下事项：).*?。)')
-                    cf_yj_pattern = re.compile(r'((公司上述行为违反了|你的上述行为违反了|根据|依据).*?规定)')
-                    cf_jg_pattern = re.compile(r'((做出如下纪律处分决定：|请就上述问题做出书面说明|收到本问询函后).*?。)')
-
-                    cf_wsh = cf_wsh_pattern.search(docx_text)
-                    cf_wsh = cf_wsh.group(2) if cf_wsh else ''
-                    cf_sy = cf_sy_pattern.search(docx_text)
-                    cf_sy = cf_sy.group(1) if cf_sy else ''
-                    cf_yj = cf_yj_pattern.search(docx_text)
-                    cf_yj = cf_yj.group(1) if cf_yj else ''
-                    cf_jg = cf_jg_pattern.search(docx_text)
-                    cf_jg = cf_jg.group(1) if cf_jg else ''
-                    item['cf_wsh'] = cf_wsh
-                    item['cf_sy'] = cf_sy
-                    item['cf_yj'] = cf_yj
-                    item['cf_jg'] = cf_jg
+                    docx_text = join_text(docx_list)
+                    item.update(get_field_rules('全国中小企业股份转让系统', 'doc').extract(docx_text))
                 else:
                     logger.info("全国中小企业股份转让系统-doc转换成docx出错-读取不到word文件")
 
             elif image_paths[0].endswith('docx'):
                 docx_list = self.parse_doc2docx(file_path)
                 if docx_list:
-                    docx_text = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in docx_list])
-                    cf_wsh_pattern = re.compile(r'(问询函)(半年报问询函.*?号)')
-                    cf_sy_pattern = re.compile(r'((关注到以下情况：|经查明|经审阅|请你公司补充披露以下事项：).*?。)')
-                    cf_yj_pattern = re.compile(r'((公司上述行为违反了|你的上述行为违反了|根据|依据).*?规定)')
-                    cf_jg_pattern = re.compile(r'((做出如下纪律处分决定：|请就上述问题做出书面说明|收到本问询函后).*?。)')
-
-                    cf_wsh = cf_wsh_pattern.search(docx_text)
-                    cf_wsh = cf_wsh.group(2) if cf_wsh else ''
-                    cf_sy = cf_sy_pattern.search(docx_text)
-                    cf_sy = cf_sy.group(1) if cf_sy else ''
-                    cf_yj = cf_yj_pattern.search(docx_text)
-                    cf_yj = cf_yj.group(1) if cf_yj else ''
-                    cf_jg = cf_jg_pattern.search(docx_text)
-                    cf_jg = cf_jg.group(1) if cf_jg else ''
-                    item['cf_wsh'] = cf_wsh
-                    item['cf_sy'] = cf_sy
-                    item['cf_yj'] = cf_yj
-                    item['cf_jg'] = cf_jg
+                    docx_text = join_text(docx_list)
+                    item.update(get_field_rules('全国中小企业股份转让系统', 'docx').extract(docx_text))
                 else:
                     logger.info("全国中小企业股份转让系统-读取不到word文件")
 
@@ -355,19 +295,110 @@ class DealNationalFilesPipeline(FilesPipeline):
 
 
 class Save2eEsPipeline(object):
-    """ 存储elasticsearch """
-    def __init__(self):
-        self.es = EsObject(index_name=settings.INDEX_NAME, index_type=settings.INDEX_TYPE, host=settings.ES_HOST, port=settings.ES_PORT)
+    """
+    存储elasticsearch
+    数据交给EsBulkWriter在后台线程批量写入，不阻塞reactor，写入成功或者已存在的发item_stored信号
+    有批次重试完还是写不进ES，这次采集不更新高水位，下次还会采集这些数据
+    ES_WRITE_MODE=upsert时已存在的数据按content_hash比较，内容变了才局部更新
+    STORAGE_SINK=jsonl/parquet时写到本地文件，不连ES，之后用 scrapy loadsink 入库
+    STORAGE_SINK=spool时写到本地段文件，由 scrapy tailspool 同时读出来写ES
+    存到本地时数据还没进ES，默认不发item_stored(增量下载不记录)，SINK_RECORD_STORED=True时写到本地就发
+    """
+    def __init__(self, crawler_settings=None):
+        self.settings = crawler_settings
+        self.sink = crawler_settings.get('STORAGE_SINK') if crawler_settings else 'es'
+        self.es = None
+        self.id_filter = None
+        if self.sink == 'es':
+            self.es = EsObject(index_name=settings.INDEX_NAME, index_type=settings.INDEX_TYPE, host=settings.ES_HOST,
+                               port=settings.ES_PORT, settings=crawler_settings)
+            # ws_pc_id布隆过滤器，不在里面的直接写入，可能在里面的才查ES确认
+            self.id_filter = get_id_filter(crawler_settings, self.es) if crawler_settings else None
+        self.writer = None
+        self.crawler = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings)
+
+    def open_spider(self, spider):
+        self.crawler = spider.crawler
+        if self.sink != 'es':
+            self.writer = open_file_sink(self.settings, spider.name, on_written=self.written)
+            return
+        self.writer = EsBulkWriter(
+            self.es,
+            max_docs=self.settings.getint('ES_BULK_MAX_DOCS'),
+            max_bytes=self.settings.getint('ES_BULK_MAX_BYTES'),
+            interval=self.settings.getfloat('ES_BULK_FLUSH_INTERVAL'),
+            max_inflight=self.settings.getint('ES_BULK_MAX_INFLIGHT'),
+            on_written=self.written,
+            mode=self.settings.get('ES_WRITE_MODE'),
+            hash_cache_size=self.settings.getint('ES_UPSERT_HASH_CACHE_SIZE'),
+            retries=self.settings.getint('ES_BULK_RETRIES'),
+            retry_backoff=self.settings.getfloat('ES_BULK_RETRY_BACKOFF'),
+            on_failed=self.write_failed,
+        )
+
+    def close_spider(self, spider):
+        dfd = self.writer.close()
+        if self.es is not None:
+            dfd.addBoth(self.record_pool_metrics)
+        return dfd
+
+    def record_pool_metrics(self, result):
+        """ 连接池计数写进采集统计，客户端是进程内共用的，crawlall时是所有爬虫合计 """
+        stats = self.crawler.stats
+        for key, value in pool_metrics(self.es.es).items():
+            stats.set_value(f'es_pool/{key}', value)
+        return result
 
     def process_item(self, item, spider):
         if item:
             # 获取唯一ID
             _id = item['ws_pc_id']
-            res1 = self.es.get_data_by_id(_id)
-            if res1.get('found') == True:
-                logger.debug("该数据已存在%s" % _id)
-                # self.es.update_data(dict(item), _id)
-            else:
-                self.es.insert_data(dict(item), _id)
-                logger.debug("----------抓取成功,开始插入数据%s" % _id)
-                return item
\ No newline at end of file
+            maybe_duplicate = self.id_filter is None or _id in self.id_filter
+            if not maybe_duplicate:
+                self.crawler.stats.inc_value('bloom/skipped_lookup')
+            doc = dict(item)
+            doc['content_hash'] = get_content_hash(doc)
+            dfd = self.writer.add(_id, doc, maybe_duplicate)
+            dfd.addCallback(lambda _: item)
+            return dfd
+
+    def written(self, batch, result, cost):
+        """ 一批写完，在reactor线程里调用 """
+        stats = self.crawler.stats
+        for kind, ids in result.items():
+            stats.inc_value(f'es/{kind}', len(ids))
+        stats.inc_value('es/bulk_requests')
+        stats.max_value('es/bulk_max_seconds', round(cost, 3))
+        logger.debug(f"批量写入{len(batch)}条: 新增{len(result['created'])}, 已存在{len(result['duplicates'])}, "
+                     f"更新{len(result['updated'])}, 没变化{len(result['unchanged'])}, 失败{len(result['failed'])}, 耗时{cost:.2f}秒")
+        for _id, error in result['failed']:
+            logger.error(f'写入失败{_id}: {error}')
+        if result['failed']:
+            # 单条重试完还是没写入，和整批失败一样这次不更新高水位
+            stats.inc_value('es/lost', len(result['failed']))
+            self.abort_watermarks()
+        if self.sink != 'es' and not self.settings.getbool('SINK_RECORD_STORED'):
+            return
+        stored = set(result['created']) | set(result['duplicates']) | set(result['updated']) | set(result['unchanged'])
+        if self.id_filter is not None:
+            for _id in stored:
+                self.id_filter.add(_id)
+        for _id, item, maybe_duplicate in batch:
+            if _id in stored:
+                self.crawler.signals.send_catch_log(signal=item_stored, item=item, spider=self.crawler.spider)
+
+    def write_failed(self, batch, failure):
+        """ 一批重试完还是没写入，记到统计里，高水位这次不更新 """
+        stats = self.crawler.stats
+        stats.inc_value('es/failed_batches')
+        stats.inc_value('es/lost', len(batch))
+        self.abort_watermarks()
+
+    def abort_watermarks(self):
+        watermarks = getattr(self.crawler.spider, 'watermarks', None)
+        if watermarks is not None:
+            watermarks.abort()
@@ -18,6 +18,54 @@ project_path = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
 # 文件存储
 FILES_STORE = os.path.join(project_path, 'files')  # 存储路径
 FILES_EXPIRES = 90  # 失效时间
+# 本地状态文件(缓存、断点等)存储路径
+STATE_DIR = os.path.join(project_path, 'state')
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+PDF解析 相关配置
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+# 解析PDF的进程数，pdfminer是纯python计算，放到子进程里不阻塞reactor，0表示在reactor线程里直接解析
+PDF_EXTRACT_WORKERS = os.cpu_count() or 1
+# 先用PyMuPDF解析，文本为空或乱码再用pdfminer，关掉则只用pdfminer
+PDF_FAST_ENGINE = True
+# PDF解析结果缓存，按文件内容sha1缓存文本，重新采集没变化的文件不再解析
+PDF_CACHE_ENABLED = True
+PDF_CACHE_PATH = os.path.join(STATE_DIR, 'pdf_text_cache.db')
+PDF_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 缓存上限2G，超过按最近访问时间淘汰
+# 逐页解析，字段正则全部匹配到就不再解析后面的页
+PDF_EARLY_STOP = True
+# 每个来源(bz)最多解析多少页，ws_nr_txt也只存这些页，例如 {'深圳证券交易所-监管信息公开-问询函件-主板': 5}
+PDF_PAGE_LIMITS = {}
+# ws_nr_txt允许只存提前结束前已解析页的来源(会截断全文，按需开启)，其他来源提前结束后会接着解析剩下的页补全全文
+# 例如 ['深圳证券交易所-监管信息公开-问询函件-主板', '深圳证券交易所-债券信息-问询函']
+PDF_PARTIAL_TEXT_SOURCES = []
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+增量采集 相关配置
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+# 按栏目记录高水位(最新日期+当天的记录id)，翻到全是采集过的页就停，-a full_crawl=1 全量采集
+INCREMENTAL_ENABLED = True
+WATERMARK_DIR = os.path.join(STATE_DIR, 'watermarks')
+# 全量采集时每个栏目同时在请求的列表页数，处理完一页再请求下一页，0表示第一页就请求全部列表页
+PAGINATION_WINDOW = 4
+# 增量下载，已入库的详情链接不再请求，-a deltafetch_reset=1 清空
+# PaginationMiddleware: 列表页没有数据提前返回的，也补上翻页请求；详情没采集成功的栏目不更新高水位
+SPIDER_MIDDLEWARES = {
+    'bourse.middlewares.DeltaFetchMiddleware': 100,
+    'bourse.middlewares.PaginationMiddleware': 110,
+}
+DELTAFETCH_ENABLED = True
+DELTAFETCH_DIR = os.path.join(STATE_DIR, 'deltafetch')
+DELTAFETCH_CACHE_SIZE = 100000  # 内存里缓存的指纹数
+DELTAFETCH_RESET = False
+
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+解析基准测试 相关配置
+"""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
+# 详情页样本目录，scrapy extractbench --record 录制，期望字段人工核对后提交
+BENCHMARK_CORPUS_DIR = os.path.join(project_path, 'corpus')
+# 录制时每个回调最多保存多少个样本
+BENCHMARK_RECORD_PER_CALLBACK = 5
 
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 数据存储 相关配置
@@ -28,6 +76,51 @@ ES_USERNAME = ''
 ES_PASSWORD = ''
 INDEX_NAME = 'cf_index_db'
 INDEX_TYPE = 'xzcf'
+# ES客户端，同一个进程里按地址共用一个客户端，爬虫、crawlall、清洗工具都用get_es_client
+ES_POOL_MAXSIZE = 16  # 每个客户端最多同时在用的连接，超过的请求排队
+ES_TIMEOUT = 30  # 默认请求超时(秒)
+ES_LONG_TIMEOUT = 3600  # 按条件更新/删除等慢请求的超时(秒)
+ES_MAX_RETRIES = 3  # 连接错误、超时的重试次数
+ES_RETRY_429 = 5  # ES返回429(写入队列满)的重试次数，按ES_RETRY_BACKOFF指数退避
+ES_RETRY_BACKOFF = 1.0
+# 工具脚本流式批量写入(ESClient.stream_index)
+ES_STREAM_CHUNK_BYTES = 5 * 1024 * 1024  # 每个bulk请求最多多少字节
+ES_STREAM_THREADS = 4  # 同时在写的bulk请求数
+ES_STREAM_MAX_RETRIES = 5  # 被拒绝(429)的文档重试次数
+# ws_pc_id布隆过滤器，本地没有文件时切片并行扫描索引新建
+BLOOM_ENABLED = True
+BLOOM_PATH = os.path.join(STATE_DIR, 'ws_pc_id.bloom')
+BLOOM_CAPACITY = 5000000
+BLOOM_ERROR_RATE = 0.001
+BLOOM_SCAN_SLICES = 4
+BLOOM_REBUILD = False  # 设为True重新扫描索引
+# 批量写入，条数、字节数或者时间间隔到了就写一批，同时在写的批次达到上限时暂停处理新数据
+ES_BULK_MAX_DOCS = 500
+ES_BULK_MAX_BYTES = 10 * 1024 * 1024
+ES_BULK_FLUSH_INTERVAL = 5
+ES_BULK_MAX_INFLIGHT = 2
+# 整批写入出错(ES连不上、超时、5xx)或者单条返回429/5xx的重试次数，和第一次重试的等待秒数(之后翻倍)，重试完还不行这次不更新高水位
+ES_BULK_RETRIES = 5
+ES_BULK_RETRY_BACKOFF = 2
+# 写入模式: create 已存在的不更新; upsert 按content_hash比较，内容变了的局部更新(不覆盖cj_sj和sj_ztxx)
+ES_WRITE_MODE = 'create'
+ES_UPSERT_HASH_CACHE_SIZE = 200000  # 内存里缓存的content_hash数
+# 数据存到哪里: es 直接写ES; jsonl gzip压缩的jsonl文件; parquet Parquet文件(需要pyarrow);
+# spool 本地段文件队列，另外跑 scrapy tailspool 写入ES，ES慢或者连不上不影响采集
+# 存到本地文件时不连ES，jsonl和parquet之后用 scrapy loadsink 批量写入ES
+STORAGE_SINK = 'es'
+SINK_DIR = os.path.join(project_path, 'sink')
+SINK_MAX_FILE_BYTES = 256 * 1024 * 1024  # 单个文件上限，超过换新文件
+SINK_BATCH_DOCS = 1000  # 多少条写一批(Parquet一个row group)
+SPOOL_DIR = os.path.join(STATE_DIR, 'spool')
+SPOOL_SEGMENT_BYTES = 64 * 1024 * 1024  # 段文件上限，写满封存换新文件
+SPOOL_FSYNC_DOCS = 500  # 攒够多少条fsync一次
+SPOOL_FSYNC_INTERVAL = 1  # 最多隔多少秒fsync一次
+SPOOL_INDEX_WORKERS = 4  # tailspool同时在写ES的批次
+SPOOL_POLL_INTERVAL = 2  # tailspool没有新数据时隔多少秒再看
+# 存到本地(jsonl/parquet/spool)时写到本地就算入库，发item_stored让增量下载记录详情链接；
+# 本地文件丢失或者loadsink/tailspool没写进ES的数据，下次采集也不会再请求，默认不记录
+SINK_RECORD_STORED = False
 
 """""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""
 redis 相关配置
@@ -81,6 +174,24 @@ MYSQL_151_DB = "company_name"
 ES_HOST_NAME = "114.115.154.235:9999"
 ES_INDEX_NAME = "cf_index_db"
 ES_INDEX_TYPE = "xzcf"
+# 清洗时并行遍历的切片数(sliced scroll)，1表示单个游标
+CLEAN_SCAN_SLICES = 4
+# 清洗时攒够多少条批量更新一次
+CLEAN_BATCH_SIZE = 1000
+# 多进程清洗的进程数，0或1表示在当前进程清洗；每块多少条交给子进程
+CLEAN_WORKERS = 0
+CLEAN_CHUNK_SIZE = 500
+# 设置了任务ID的清洗按这个排序用search_after遍历(最后一个字段要唯一)，断点存在这个目录
+CLEAN_CURSOR_SORT = [{"ws_pc_id.keyword": "asc"}]
+CLEAN_CHECKPOINT_DIR = os.path.join(STATE_DIR, 'clean')
+# 只更新固定字段(is_status_only)时按查询在服务端更新: 切片数、每秒最多更新条数(-1不限速)、轮询进度间隔(秒)
+CLEAN_UBQ_SLICES = 'auto'
+CLEAN_UBQ_REQUESTS_PER_SECOND = 2000
+CLEAN_UBQ_POLL_INTERVAL = 5
+# scrapy qualityreport 数据质量报告: 结果缓存时间(秒)、缓存目录、composite聚合每页来源数
+QUALITY_REPORT_TTL = 600
+QUALITY_REPORT_CACHE_DIR = os.path.join(STATE_DIR, 'quality_report')
+QUALITY_REPORT_PAGE_SIZE = 500
 
 # 清洗ES
 QX_ES_HOST = "114.115.129.113:9999"
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+
+# 数据已经写入存储(或者库里已有)，参数: item, spider
+item_stored = object()
@@ -2,23 +2,21 @@
 import json
 import re
 import time
-from functools import reduce
-from io import BytesIO
 from urllib.parse import urljoin
 
 import jsonpath
 import scrapy
 import logging
-from pdfminer.pdfparser import PDFParser, PDFDocument, PDFSyntaxError
-from pdfminer.pdfinterp import PDFTextExtractionNotAllowed
-from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
-from pdfminer.converter import PDFPageAggregator
-from pdfminer.layout import LAParams, LTTextBox
+
+from bourse.utils.field_rules import get_field_rules
+from bourse.utils.normalize import join_text
+from bourse.utils.pdf_pool import PdfSpiderMixin
+from bourse.utils.pagination import PaginationSpiderMixin
 
 logger = logging.getLogger(__name__)
 
 
-class NationalStockSpider(scrapy.Spider):
+class NationalStockSpider(PaginationSpiderMixin, PdfSpiderMixin, scrapy.Spider):
     name = 'national_stock'
     allowed_domains = ['neeq.com.cn']
 
@@ -116,8 +114,9 @@ class NationalStockSpider(scrapy.Spider):
         # 列表解析
         results = response.text.replace('null(', '').replace(')', '')
         results = json.loads(results)
+        fresh = 0
         for result in results:
-            content_list = result.get('page').get('content')
+            content_list = (result.get('page') or {}).get('content') or []
             for content in content_list:
                 companyCode = content.get('companyCode')  # 代码
                 companyName = content.get('companyName')  # 简称
@@ -145,6 +144,7 @@ class NationalStockSpider(scrapy.Spider):
                     cf_jdrq=createTime,
                     bz='全国中小企业股份转让系统-监管公开信息-问询函',
                 )
+                fresh += self.track_record(first_item['bz'], createTime, content)
                 base_item = {**first_item, **self.base_item}
 
                 if xq_url.endswith('pdf') or xq_url.endswith('PDF'):
@@ -163,18 +163,16 @@ class NationalStockSpider(scrapy.Spider):
 
         # 翻页页码
         form_data = response.meta.get('form_data')
-        is_first = response.meta.get('is_first', True)
-        totalPages = jsonpath.jsonpath(results, expr=r'$..page.totalPages')[0]
-        if is_first:
-            for page in range(2, totalPages + 1):
-                form_data['page'] = str(page)
-                yield scrapy.FormRequest(
-                    url='http://www.neeq.com.cn/inquiryLetterController/infoResultse.do',
-                    formdata=form_data,
-                    callback=self.parse_wxh,
-                    meta={'is_first': False, 'form_data': form_data},
-                    priority=3,
-                )
+        totalPages = jsonpath.jsonpath(results, expr=r'$..page.totalPages')
+        if not totalPages:
+            logger.info(f'列表没有分页信息，不再翻页:{response.url}')
+            return
+        totalPages = totalPages[0]
+        yield from self.paginate(
+            response, '全国中小企业股份转让系统-监管公开信息-问询函', totalPages,
+            'http://www.neeq.com.cn/inquiryLetterController/infoResultse.do', self.parse_wxh,
+            fresh=fresh, formdata=form_data,
+        )
 
     def parse_zljgcs(self, response):
         """ 解析-全国中小企业股份转让系统-自律监管措施 """
@@ -182,7 +180,7 @@ class NationalStockSpider(scrapy.Spider):
         results = response.text.replace('null(', '').replace(')', '')
         results = json.loads(results)
         for result in results:
-            content_list = result.get('listInfo').get('content')
+            content_list = (result.get('listInfo') or {}).get('content') or []
             for content in content_list:
                 companyCd = content.get('companyCd')  # 代码
                 companyName = content.get('companyName')  # 简称
@@ -216,20 +214,18 @@ class NationalStockSpider(scrapy.Spider):
                 else:
                     logger.info(f'不是文件格式:{xq_url}')
 
-        # 翻页页码
+        # 翻页页码，列表按地区(xxssdq)排序不是按日期，不能按高水位提前停止翻页，不传fresh
         form_data = response.meta.get('form_data')
-        is_first = response.meta.get('is_first', True)
-        totalPages = jsonpath.jsonpath(results, expr=r'$..listInfo.totalPages')[0]
-        if is_first:
-            for page in range(2, totalPages + 1):
-                form_data['page'] = str(page)
-                yield scrapy.FormRequest(
-                    url='http://www.neeq.com.cn/disclosureInfoController/infoResult.do',
-                    formdata=form_data,
-                    callback=self.parse_zljgcs,
-                    meta={'is_first': False, 'form_data': form_data},
-                    priority=3,
-                )
+        totalPages = jsonpath.jsonpath(results, expr=r'$..listInfo.totalPages')
+        if not totalPages:
+            logger.info(f'列表没有分页信息，不再翻页:{response.url}')
+            return
+        totalPages = totalPages[0]
+        yield from self.paginate(
+            response, '全国中小企业股份转让系统-监管公开信息-自律监管措施', totalPages,
+            'http://www.neeq.com.cn/disclosureInfoController/infoResult.do', self.parse_zljgcs,
+            formdata=form_data,
+        )
 
     def parse_jlvf(self, response):
         """ 解析-全国中小企业股份转让系统-纪律处分 """
@@ -237,7 +233,7 @@ class NationalStockSpider(scrapy.Spider):
         results = response.text.replace('null(', '').replace(')', '')
         results = json.loads(results)
         for result in results:
-            content_list = result.get('pageList').get('content')
+            content_list = (result.get('pageList') or {}).get('content') or []
             for content in content_list:
                 accountabilityType = content.get('accountabilityType')  # 法律身份
                 accountabilityMeasures = content.get('accountabilityMeasures')  # 处分类型
@@ -269,53 +265,32 @@ class NationalStockSpider(scrapy.Spider):
                 else:
                     logger.info(f'不是文件格式:{xq_url}')
 
-            # 翻页页码
-            form_data = response.meta.get('form_data')
-            is_first = response.meta.get('is_first', True)
-            totalPages = jsonpath.jsonpath(results, expr=r'$..pageList.totalPages')[0]
-            if is_first:
-                for page in range(2, totalPages + 1):
-                    form_data['page'] = str(page)
-                    yield scrapy.FormRequest(
-                        url='http://www.neeq.com.cn/PunishmentController/infoResultse.do',
-                        formdata=form_data,
-                        callback=self.parse_jlvf,
-                        meta={'is_first': False, 'form_data': form_data},
-                        priority=3,
-                    )
+        # 翻页页码，列表按地区(xxssdq)排序不是按日期，不能按高水位提前停止翻页，不传fresh
+        form_data = response.meta.get('form_data')
+        totalPages = jsonpath.jsonpath(results, expr=r'$..pageList.totalPages')
+        if not totalPages:
+            logger.info(f'列表没有分页信息，不再翻页:{response.url}')
+            return
+        totalPages = totalPages[0]
+        yield from self.paginate(
+            response, '全国中小企业股份转让系统-监管公开信息-纪律处分', totalPages,
+            'http://www.neeq.com.cn/PunishmentController/infoResultse.do', self.parse_jlvf,
+            formdata=form_data,
+        )
 
     def parse_all_pdf(self, response):
         """ 解析监管公开信息-PDF """
-        re_com = re.compile(r'\r|\n|\t|\s')
+        return self.defer_pdf(response, self.parse_all_content, source=response.meta['base_item']['bz'])
+
+    def parse_all_content(self, response, content_list):
+        """ 解析监管公开信息-PDF-提取字段 """
         base_item = response.meta.get('base_item')
-        try:
-            content_list = self.parse_pdf(response)
-        except Exception as e:
-            logger.error(f'解析出错{repr(e)}')
-            content_list = []
-        try:
-            content = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in content_list])
-        except (TypeError):
-            logger.info('聚合PDF内容出错--返回空列表')
-            content = ''
-        except Exception as e:
-            logger.error(f'聚合出错:{repr(e)}')
-            content = ''
-        cf_wsh_pattern = re.compile(r'(问询函)(半年报问询函.*?号)')
-        cf_wsh_pattern_second = re.compile(r'(文件)(股转系统发.*?号)')
-        cf_sy_pattern = re.compile(r'((有以下违规事实：|关注到以下情况：|经查明|经审阅|请你公司补充披露以下事项：|以下违规事实：).*?。)')
-        cf_yj_pattern = re.compile(r'((公司上述行为违反了|你的上述行为违反了|根据|依据).*?规定)')
-        cf_jg_pattern = re.compile(r'((我司作出如下纪律处分决定：|做出如下纪律处分决定：|请就上述问题做出书面说明|收到本问询函后|做出如下决定：|特此提出警示如下：|我司作出如下决定：).*?。)')
-        cf_wsh_second = cf_wsh_pattern_second.search(content)
-        cf_wsh_second = cf_wsh_second.group(2) if cf_wsh_second else ''
-        cf_wsh_first = cf_wsh_pattern.search(content)
-        cf_wsh = cf_wsh_first.group(2) if cf_wsh_first else cf_wsh_second
-        cf_sy = cf_sy_pattern.search(content)
-        cf_sy = cf_sy.group(1) if cf_sy else ''
-        cf_yj = cf_yj_pattern.search(content)
-        cf_yj = cf_yj.group(1) if cf_yj else ''
-        cf_jg = cf_jg_pattern.search(content)
-        cf_jg = cf_jg.group(1) if cf_jg else ''
+        content = join_text(content_list)
+        fields = get_field_rules(base_item['bz']).extract(content)
+        cf_wsh = fields['cf_wsh'] if fields['cf_wsh'] else fields['cf_wsh_second']
+        cf_sy = fields['cf_sy']
+        cf_yj = fields['cf_yj']
+        cf_jg = fields['cf_jg']
 
         item_detail = dict(
             cf_wsh=cf_wsh,
@@ -329,48 +304,6 @@ class NationalStockSpider(scrapy.Spider):
         # print(item)
         yield item
 
-    def parse_pdf(self, response):
-        """
-        解析PDF文件
-        :param response:
-        :return:
-        """
-        # 用文件对象来创建一个pdf文档分析器
-        praser = PDFParser(BytesIO(response.body))
-        # 创建一个PDF文档
-        doc = PDFDocument()
-        # 连接分析器 与文档对象
-        praser.set_document(doc)
-        doc.set_parser(praser)
-        # 提供初始化密码
-        # 如果没有密码 就创建一个空的字符串
-        doc.initialize()
-        # 检测文档是否提供txt转换，不提供就忽略
-        if not doc.is_extractable:
-            raise PDFTextExtractionNotAllowed
-        else:
-            # 创建PDf 资源管理器 来管理共享资源
-            rsrcmgr = PDFResourceManager()
-            # 创建一个PDF设备对象
-            laparams = LAParams()
-            device = PDFPageAggregator(rsrcmgr, laparams=laparams)
-            # 创建一个PDF解释器对象
-            interpreter = PDFPageInterpreter(rsrcmgr, device)
-            contents_list = []
-            # 循环遍历列表，每次处理一个page的内容
-            for page in doc.get_pages():  # doc.get_pages() 获取page列表
-                # 接受该页面的LTPage对象
-                interpreter.process_page(page)
-                # 这里layout是一个LTPage对象 里面存放着
-                # 这个page解析出的各种对象 一般包括LTTextBox, LTFigure, LTImage, LTTextBoxHorizontal 等等
-                # 想要获取文本就获得对象的text属性
-                layout = device.get_result()
-                for index, out in enumerate(layout):
-                    if isinstance(out, LTTextBox):
-                        contents = out.get_text().strip()
-                        contents_list.append(contents)
-            return contents_list
-
     def handle_timestmp(self, timestamp):
         """ 处理13位时间戳 """
         timestamps = float(timestamp / 1000)
@@ -1,23 +1,21 @@
 # -*- coding: utf-8 -*-
 import json
 import re
-from functools import reduce
-from io import BytesIO
 from urllib.parse import urljoin
 
 import jsonpath
 import scrapy
 import logging
-from pdfminer.pdfparser import PDFParser, PDFDocument, PDFSyntaxError
-from pdfminer.pdfinterp import PDFTextExtractionNotAllowed
-from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
-from pdfminer.converter import PDFPageAggregator
-from pdfminer.layout import LAParams, LTTextBox
+
+from bourse.utils.field_rules import get_field_rules
+from bourse.utils.normalize import join_text
+from bourse.utils.pdf_pool import PdfSpiderMixin
+from bourse.utils.pagination import PaginationSpiderMixin
 
 logger = logging.getLogger(__name__)
 
 
-class ShanghaiStockSpider(scrapy.Spider):
+class ShanghaiStockSpider(PaginationSpiderMixin, PdfSpiderMixin, scrapy.Spider):
     name = 'shanghai_stock'
     allowed_domains = ['sse.com.cn']
 
@@ -117,6 +115,7 @@ class ShanghaiStockSpider(scrapy.Spider):
         result = results.get('result')
         if not result:
             return None
+        fresh = 0
         for item in result:
             extSECURITY_CODE = item.get('extSECURITY_CODE')  # 证券代码
             extGSJC = item.get('extGSJC')  # 证券简称
@@ -141,6 +140,7 @@ class ShanghaiStockSpider(scrapy.Spider):
                 xxly='上海证券交易所-数据补充',
                 bz='上海证券交易所-监管信息公开-公司监管-监管措施',
             )
+            fresh += self.track_record(base_item['bz'], base_item['cf_jdrq'], item)
 
             if docURL.endswith('pdf'):
                 base_item['cf_cfmc'] = docTitle
@@ -161,16 +161,8 @@ class ShanghaiStockSpider(scrapy.Spider):
 
         # 翻页请求
         pageCount = jsonpath.jsonpath(data, expr=r'$..pageCount')[0]
-        is_first = response.meta.get('is_first', True)
-        if is_first:
-            for page in range(2, pageCount + 1):
-                url = 'http://query.sse.com.cn/commonSoaQuery.do?siteId=28&sqlId=BS_KCB_GGLL&channelId=10007%2C10008%2C10009%2C10010&order=createTime%7Cdesc%2Cstockcode%7Casc&isPagination=true&pageHelp.pageSize=15&pageHelp.pageNo={}'.format(page)
-                yield scrapy.Request(
-                    url=url,
-                    callback=self.parse_gsjg_jgcs,
-                    meta={'is_first': False},
-                    priority=3,
-                )
+        url = 'http://query.sse.com.cn/commonSoaQuery.do?siteId=28&sqlId=BS_KCB_GGLL&channelId=10007%2C10008%2C10009%2C10010&order=createTime%7Cdesc%2Cstockcode%7Casc&isPagination=true&pageHelp.pageSize=15&pageHelp.pageNo={}'
+        yield from self.paginate(response, '上海证券交易所-监管信息公开-公司监管-监管措施', pageCount, url, self.parse_gsjg_jgcs, fresh=fresh)
 
     def parse_gsjg_jgwx(self, response):
         """ 解析-监管信息公开-公司监管-监管问询 """
@@ -184,6 +176,7 @@ class ShanghaiStockSpider(scrapy.Spider):
         result = results.get('result')
         if not result:
             return None
+        fresh = 0
         for item in result:
             extSECURITY_CODE = item.get('extSECURITY_CODE')  # 公司代码
             extGSJC = item.get('extGSJC')  # 公司简称
@@ -206,6 +199,7 @@ class ShanghaiStockSpider(scrapy.Spider):
                 xxly='上海证券交易所-数据补充',
                 bz='上海证券交易所-监管信息公开-公司监管-监管问询',
             )
+            fresh += self.track_record(base_item['bz'], base_item['cf_jdrq'], item)
 
             if docURL.endswith('pdf'):
                 base_item['cf_cfmc'] = docTitle
@@ -220,38 +214,24 @@ class ShanghaiStockSpider(scrapy.Spider):
 
         # 翻页请求
         pageCount = jsonpath.jsonpath(data, expr=r'$..pageCount')[0]
-        is_first = response.meta.get('is_first', True)
-        if is_first:
-            for page in range(2, pageCount + 1):
-                url = 'http://query.sse.com.cn/commonSoaQuery.do?siteId=28&sqlId=BS_KCB_GGLL&channelId=10743%2C10744%2C10012&order=createTime%7Cdesc%2Cstockcode%7Casc&isPagination=true&pageHelp.pageSize=15&pageHelp.pageNo={}'.format(page)
-                yield scrapy.Request(
-                    url=url,
-                    callback=self.parse_gsjg_jgwx,
-                    meta={'is_first': False},
-                    priority=3,
-                )
+        url = 'http://query.sse.com.cn/commonSoaQuery.do?siteId=28&sqlId=BS_KCB_GGLL&channelId=10743%2C10744%2C10012&order=createTime%7Cdesc%2Cstockcode%7Casc&isPagination=true&pageHelp.pageSize=15&pageHelp.pageNo={}'
+        yield from self.paginate(response, '上海证券交易所-监管信息公开-公司监管-监管问询', pageCount, url, self.parse_gsjg_jgwx, fresh=fresh)
 
     def parse_detail(self, response):
         """ 解析纯HTML """
         base_item = response.meta.get('base_item')
         cf_cfmc = base_item.get('cf_cfmc')
-        re_com = re.compile(r'\r|\n|\t|\s')
         selector = scrapy.Selector(text=response.text)
         # cf_cfmc = selector.xpath('//div[@class="article-infor"]/h2/text()').get('')
         cf_wsh = selector.css('div[class=allZoom] p:nth-child(1)::text').get('')
         ws_nr_list = selector.xpath('//div[@class="article-infor"]//text()').getall()
-        ws_nr_txt = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in ws_nr_list])
+        ws_nr_txt = join_text(ws_nr_list)
         oname = re.search(r'(关于要求|关于对|关于)(.*?公司)', cf_cfmc)
         oname = oname.group(2) if oname else ''
-        cf_sy_pattern = re.compile(r'(经查明.*?。)')
-        cf_yj_pattern = re.compile(r'((上述行为违反了|违反了|根据).*?(有关|的)规定)')
-        cf_jg_pattern = re.compile(r'((公司应当|公司应|希望公司).*?。)')
-        cf_sy = cf_sy_pattern.search(ws_nr_txt)
-        cf_sy = cf_sy.group(1) if cf_sy else ''
-        cf_yj = cf_yj_pattern.search(ws_nr_txt)
-        cf_yj = cf_yj.group(1) if cf_yj else ''
-        cf_jg = cf_jg_pattern.search(ws_nr_txt)
-        cf_jg = cf_jg.group(1) if cf_jg else ''
+        fields = get_field_rules(base_item['bz'], 'html').extract(ws_nr_txt)
+        cf_sy = fields['cf_sy']
+        cf_yj = fields['cf_yj']
+        cf_jg = fields['cf_jg']
         item_detail = dict(
             oname=oname,
             cf_wsh=cf_wsh,
@@ -270,6 +250,7 @@ class ShanghaiStockSpider(scrapy.Spider):
         # 列表解析
         selector = scrapy.Selector(text=response.text)
         base_table = selector.xpath('//table[@class="table "]/tbody/tr')
+        fresh = 0
         for td in base_table:
             regcode = td.css('td:first-child::text').get('')  # 证券代码
             bzxr = td.css('td:nth-child(2)::text').get('')  # 证券简称
@@ -290,22 +271,21 @@ class ShanghaiStockSpider(scrapy.Spider):
                 regcode=regcode,
                 bzxr=bzxr,
             )
+            fresh += self.track_record('上海证券交易所-债券监管-债券监管措施', cf_jdrq, (cf_cfmc, xq_url))
             if not xq_url:
-                return None
+                continue
             yield scrapy.Request(url=xq_url, callback=self.parse_zqjg_jgcs_detail, meta={'base_item': base_item}, priority=7)
 
         # 列表翻页
-        is_first = response.meta.get('is_first', True)
-        if is_first:
-            for page in range(2, 11):
-                url = 'http://www.sse.com.cn/disclosure/credibility/bonds/regulatory/s_index_{}.htm'.format(page)
-                yield scrapy.Request(url=url, callback=self.parse_zqjg_jgcs, meta={'is_first': False}, priority=3)
+        url = 'http://www.sse.com.cn/disclosure/credibility/bonds/regulatory/s_index_{}.htm'
+        yield from self.paginate(response, '上海证券交易所-债券监管-债券监管措施', 10, url, self.parse_zqjg_jgcs, fresh=fresh)
 
     def parse_zqjg_jlcf(self, response):
         """ 债券监管-债券纪律处分-解析翻页HTML """
         # 列表解析
         selector = scrapy.Selector(text=response.text)
         base_table = selector.xpath('//table[@class="table"]/tbody/tr')
+        fresh = 0
         for td in base_table:
             regcode = td.css('td:first-child::text').get('')  # 证券代码
             bzxr = td.css('td:nth-child(2)::text').get('')  # 证券简称
@@ -325,8 +305,9 @@ class ShanghaiStockSpider(scrapy.Spider):
                 regcode=regcode,
                 bzxr=bzxr,
             )
+            fresh += self.track_record('上海证券交易所-债券监管-债券纪律处分', cf_jdrq, (cf_cfmc, xq_url))
             if not xq_url:
-                return None
+                continue
             if xq_url.endswith('doc') or xq_url.endswith('docx'):
                 base_item['cf_xzjg'] = '上海证券交易所',
                 base_item['site_id'] = 36921,
@@ -338,11 +319,8 @@ class ShanghaiStockSpider(scrapy.Spider):
                 yield scrapy.Request(url=xq_url, callback=self.parse_zqjg_jlcf_detail, meta={'base_item': base_item}, priority=7)
 
         # 列表翻页
-        is_first = response.meta.get('is_first', True)
-        if is_first:
-            for page in range(2, 3):
-                url = 'http://www.sse.com.cn/disclosure/credibility/bonds/disposition/s_index_{}.htm'.format(page)
-                yield scrapy.Request(url=url, callback=self.parse_zqjg_jlcf, meta={'is_first': False}, priority=3)
+        url = 'http://www.sse.com.cn/disclosure/credibility/bonds/disposition/s_index_{}.htm'
+        yield from self.paginate(response, '上海证券交易所-债券监管-债券纪律处分', 2, url, self.parse_zqjg_jlcf, fresh=fresh)
 
     def parse_jyjg_jlcf(self, response):
         """ 交易监管-纪律处分-解析列表HTML与翻页 """
@@ -355,6 +333,7 @@ class ShanghaiStockSpider(scrapy.Spider):
         )
         selector = scrapy.Selector(text=response.text)
         base_div = selector.xpath('//dl/dd')
+        fresh = 0
         for data in base_div:
             cf_jdrq = data.css('span::text').get('')  # 日期
             cf_cfmc = data.css('a::attr(title)').get('')  # 名称
@@ -373,9 +352,10 @@ class ShanghaiStockSpider(scrapy.Spider):
                 cf_type='交易监管-纪律处分',
                 cf_cflb='纪律处分',
             )
+            fresh += self.track_record(base_item['bz'], cf_jdrq, (cf_cfmc, xq_url))
             meta_data = {**base_item, **jlcf_item}
             if not xq_url:
-                return None
+                continue
             if xq_url.endswith('doc') or xq_url.endswith('docx'):
                 meta_data['xq_url'] = xq_url
                 yield meta_data
@@ -383,11 +363,8 @@ class ShanghaiStockSpider(scrapy.Spider):
                 yield scrapy.Request(url=xq_url, callback=self.parse_jyjg_jlcf_detail, meta={'base_item': meta_data}, priority=7)
 
         # 列表翻页
-        is_first = response.meta.get('is_first', True)
-        if is_first:
-            for page in range(2, 5):
-                url = 'http://www.sse.com.cn/disclosure/credibility/regulatory/punishment/s_index_{}.htm'.format(page)
-                yield scrapy.Request(url=url, callback=self.parse_jyjg_jlcf, meta={'is_first': False}, priority=3)
+        url = 'http://www.sse.com.cn/disclosure/credibility/regulatory/punishment/s_index_{}.htm'
+        yield from self.paginate(response, base_item['bz'], 4, url, self.parse_jyjg_jlcf, fresh=fresh)
 
     def parse_huiyuan(self, response):
         """ 会员及其他交易参与人监管-纪律处分-解析 """
@@ -426,37 +403,26 @@ class ShanghaiStockSpider(scrapy.Spider):
 
     def parse_gsjg_jgcs_pdf(self, response):
         """ 解析PDF，提取数据 """
-        re_com = re.compile(r'\r|\n|\t|\s')
+        return self.defer_pdf(response, self.parse_gsjg_jgcs_content, source=response.meta['base_item']['bz'])
+
+    def parse_gsjg_jgcs_content(self, response, content_list):
+        """ 提取PDF文本里的字段 """
         base_item = response.meta.get('base_item')
         cf_cfmc = base_item.get('cf_cfmc')
-        try:
-            content_list = self.parse_pdf(response)
-        except Exception as e:
-            logger.error(f'解析出错{repr(e)}')
-            content_list = []
-        content = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in content_list])
-        oname_pattern = re.compile(r'(当事人：)(.*?)(，)')
-        cf_wsh_pattern = re.compile(r'(.*?号)(关于|关于对)')
-        cf_sy_pattern = re.compile(r'((?:存在以下违规事项：|你的上述行为违反了|经查明).*?。)')
-        cf_yj_pattern = re.compile(r'((公司上述行为违反了|你的上述行为违反了|根据).*?规定)')
-        cf_jg_pattern = re.compile(r'((做出如下纪律处分决定：|公司应当|做出如下监管措施决定：).*?。)')
-        oname = oname_pattern.search(content)
-        oname = oname.group(2) if oname else ''
+        content = join_text(content_list)
+        fields = get_field_rules(base_item['bz']).extract(content)
+        oname = fields['oname']
 
         if oname:
             oname = oname
         else:
             oname = re.search(r'(关于对|关于)(.*?公司)', cf_cfmc)
             oname = oname.group(2) if oname else ''
-        cf_wsh = cf_wsh_pattern.search(content)
-        cf_wsh = cf_wsh.group(1) if cf_wsh else ''
+        cf_wsh = fields['cf_wsh']
         cf_wsh = cf_wsh.replace('上海证券交易所', '') if '上海证券交易所' in cf_wsh else cf_wsh
-        cf_sy = cf_sy_pattern.search(content)
-        cf_sy = cf_sy.group(1) if cf_sy else ''
-        cf_yj = cf_yj_pattern.search(content)
-        cf_yj = cf_yj.group(1) if cf_yj else ''
-        cf_jg = cf_jg_pattern.search(content)
-        cf_jg = cf_jg.group(1) if cf_jg else ''
+        cf_sy = fields['cf_sy']
+        cf_yj = fields['cf_yj']
+        cf_jg = fields['cf_jg']
 
         item_detail = dict(
             oname=oname,
@@ -473,32 +439,23 @@ class ShanghaiStockSpider(scrapy.Spider):
 
     def parse_gsjg_jgwx_pdf(self, response):
         """ 解析-监管信息公开-公司监管-监管问询PDF """
-        re_com = re.compile(r'\r|\n|\t|\s')
+        return self.defer_pdf(response, self.parse_gsjg_jgwx_content, source=response.meta['base_item']['bz'])
+
+    def parse_gsjg_jgwx_content(self, response, content_list):
+        """ 解析-监管信息公开-公司监管-监管问询PDF-提取字段 """
         base_item = response.meta.get('base_item')
         cf_cfmc = base_item.get('cf_cfmc')
-        try:
-            content_list = self.parse_pdf(response)
-        except Exception as e:
-            logger.error(f'解析出错{repr(e)}')
-            content_list = []
-        content = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in content_list])
+        content = join_text(content_list)
+        fields = get_field_rules(base_item['bz']).extract(content)
         oname_pattern = re.compile(r'(关于对|关于)(.*?公司)')
-        cf_wsh_pattern = re.compile(r'(上海证券交易所)(.*?号)(关于)')
-        cf_sy_pattern = re.compile(r'((?:存在以下违规事项：|你的上述行为违反了|经查明|经审阅).*?。)')
-        cf_yj_pattern = re.compile(r'((公司上述行为违反了|你的上述行为违反了|根据|依据).*?规定)')
-        cf_jg_pattern = re.compile(r'((做出如下纪律处分决定：|公司应当|做出如下监管措施决定：|请你公司).*?。)')
         oname = oname_pattern.search(cf_cfmc)
         oname = oname.group(2) if oname else ''
         # 文书号读取有问题
-        cf_wsh = cf_wsh_pattern.search(content)
-        cf_wsh = cf_wsh.group(2) if cf_wsh else ''
+        cf_wsh = fields['cf_wsh']
         cf_wsh = cf_wsh.replace('上海证券交易所', '') if '上海证券交易所' in cf_wsh else cf_wsh
-        cf_sy = cf_sy_pattern.search(content)
-        cf_sy = cf_sy.group(1) if cf_sy else ''
-        cf_yj = cf_yj_pattern.search(content)
-        cf_yj = cf_yj.group(1) if cf_yj else ''
-        cf_jg = cf_jg_pattern.search(content)
-        cf_jg = cf_jg.group(1) if cf_jg else ''
+        cf_sy = fields['cf_sy']
+        cf_yj = fields['cf_yj']
+        cf_jg = fields['cf_jg']
 
         item_detail = dict(
             oname=oname,
@@ -515,27 +472,18 @@ class ShanghaiStockSpider(scrapy.Spider):
 
     def parse_huiyuan_pdf(self, response):
         """ 会员及其他交易参与人监管-纪律处分-解析PDF文件 """
-        re_com = re.compile(r'\r|\n|\t|\s')
+        return self.defer_pdf(response, self.parse_huiyuan_content, source=response.meta['base_item']['bz'])
+
+    def parse_huiyuan_content(self, response, content_list):
+        """ 会员及其他交易参与人监管-纪律处分-解析PDF文件-提取字段 """
         base_item = response.meta.get('base_item')
-        try:
-            content_list = self.parse_pdf(response)
-        except Exception as e:
-            logger.error(f'解析出错{repr(e)}')
-            content_list = []
-        content = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in content_list])
-        cf_wsh_pattern = re.compile(r'纪律处分决定书(.*?号)')
-        cf_sy_pattern = re.compile(r'(根据中国证监会.*?。)')
-        cf_yj_pattern = re.compile(r'((违反了|依据).*?规定)')
-        cf_jg_pattern = re.compile(r'((做出如下纪律处分决定：|公司应当|做出如下监管措施决定：|请你公司).*?。)')
-        cf_sy = cf_sy_pattern.search(content)
-        cf_sy = cf_sy.group(1) if cf_sy else ''
-        cf_yj = cf_yj_pattern.search(content)
-        cf_yj = cf_yj.group(1) if cf_yj else ''
-        cf_jg = cf_jg_pattern.search(content)
-        cf_jg = cf_jg.group(1) if cf_jg else ''
-
-        cf_wsh = cf_wsh_pattern.search(content)
-        cf_wsh = cf_wsh.group(1) if cf_wsh else ''
+        content = join_text(content_list)
+        fields = get_field_rules(base_item['bz']).extract(content)
+        cf_sy = fields['cf_sy']
+        cf_yj = fields['cf_yj']
+        cf_jg = fields['cf_jg']
+
+        cf_wsh = fields['cf_wsh']
 
         item_detail = dict(
             cf_wsh=cf_wsh,
@@ -554,24 +502,18 @@ class ShanghaiStockSpider(scrapy.Spider):
         # 详情解析
         base_item = response.meta.get('base_item')
         selector = scrapy.Selector(text=response.text)
-        re_com = re.compile(r'\r|\n|\t|\s')
         xq_url = response.url
         ws_nr_list = selector.xpath('//div[@class="article-infor"]//text()').getall()
-        ws_nr_text = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in ws_nr_list])
+        ws_nr_text = join_text(ws_nr_list)
         cf_wsh = selector.xpath('//div[@class="allZoom"]/p[2]/text()').get('')
         cf_wsh_second = selector.xpath('//div[@class="allZoom"]/p[1]/text()').get('')
         cf_wsh_third = selector.xpath('//div[@class="allZoom"]/div[1]/text()').get('')
         cf_wsh = cf_wsh_second if '当事人' in cf_wsh else cf_wsh
         cf_wsh = cf_wsh_third if not cf_wsh else cf_wsh
-        cf_sy_pattern = re.compile(r'((经查明|存在以下违规事项：).*?。)')
-        cf_yj_pattern = re.compile(r'((违反了|根据).*?规定)')
-        cf_jg_pattern = re.compile(r'((鉴于上述行为|鉴于你公司上述行为|本所将根据行为性质及情节).*?。)')
-        cf_sy = cf_sy_pattern.search(ws_nr_text)
-        cf_sy = cf_sy.group(1) if cf_sy else ''
-        cf_yj = cf_yj_pattern.search(ws_nr_text)
-        cf_yj = cf_yj.group(1) if cf_yj else ''
-        cf_jg = cf_jg_pattern.search(ws_nr_text)
-        cf_jg = cf_jg.group(1) if cf_jg else ''
+        fields = get_field_rules('上海证券交易所-债券监管-债券监管措施', 'html').extract(ws_nr_text)
+        cf_sy = fields['cf_sy']
+        cf_yj = fields['cf_yj']
+        cf_jg = fields['cf_jg']
         detail_item = dict(
             cf_wsh=cf_wsh,
             cf_sy=cf_sy,
@@ -593,23 +535,14 @@ class ShanghaiStockSpider(scrapy.Spider):
         # 详情解析
         base_item = response.meta.get('base_item')
         selector = scrapy.Selector(text=response.text)
-        re_com = re.compile(r'\r|\n|\t|\s')
         xq_url = response.url
         ws_nr_list = selector.xpath('//div[@class="article-infor"]//text()').getall()
-        ws_nr_txt = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in ws_nr_list])
-        cf_wsh_pattern = re.compile(r'(?:纪律处分决定书)?(纪律处分决定书.*?号)')
-        cf_sy_pattern = re.compile(r'(存在以下违规事实：|经查明.*?。)')
-        cf_yj_pattern = re.compile(r'((根据|依据).*?规定)')
-        cf_jg_pattern = re.compile(r'(做出如下纪律处分决定：.*?。)')
-
-        cf_wsh = cf_wsh_pattern.search(ws_nr_txt)
-        cf_wsh = cf_wsh.group(1) if cf_wsh else ''
-        cf_sy = cf_sy_pattern.search(ws_nr_txt)
-        cf_sy = cf_sy.group(1) if cf_sy else ''
-        cf_yj = cf_yj_pattern.search(ws_nr_txt)
-        cf_yj = cf_yj.group(1) if cf_yj else ''
-        cf_jg = cf_jg_pattern.search(ws_nr_txt)
-        cf_jg = cf_jg.group(1) if cf_jg else ''
+        ws_nr_txt = join_text(ws_nr_list)
+        fields = get_field_rules('上海证券交易所-债券监管-债券纪律处分', 'html').extract(ws_nr_txt)
+        cf_wsh = fields['cf_wsh']
+        cf_sy = fields['cf_sy']
+        cf_yj = fields['cf_yj']
+        cf_jg = fields['cf_jg']
 
         detail_item = dict(
             cf_wsh=cf_wsh,
@@ -632,20 +565,14 @@ class ShanghaiStockSpider(scrapy.Spider):
         # 详情解析
         base_item = response.meta.get('base_item')
         selector = scrapy.Selector(text=response.text)
-        re_com = re.compile(r'\r|\n|\t|\s')
         xq_url = response.url
         ws_nr_list = selector.xpath('//div[@class="article-infor"]//text()').getall()
-        ws_nr_txt = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in ws_nr_list])
-
-        cf_sy_pattern = re.compile(r'(经查明|经审核|经查.*?。)')
-        cf_yj_pattern = re.compile(r'((根据|依据).*?规定)')
-        cf_jg_pattern = re.compile(r'((做出如下纪律处分决定：|本所决定).*?。)')
-        cf_sy = cf_sy_pattern.search(ws_nr_txt)
-        cf_sy = cf_sy.group(1) if cf_sy else ''
-        cf_yj = cf_yj_pattern.search(ws_nr_txt)
-        cf_yj = cf_yj.group(1) if cf_yj else ''
-        cf_jg = cf_jg_pattern.search(ws_nr_txt)
-        cf_jg = cf_jg.group(1) if cf_jg else ''
+        ws_nr_txt = join_text(ws_nr_list)
+
+        fields = get_field_rules(base_item['bz'], 'html').extract(ws_nr_txt)
+        cf_sy = fields['cf_sy']
+        cf_yj = fields['cf_yj']
+        cf_jg = fields['cf_jg']
 
         detail_item = dict(
             cf_sy=cf_sy,
@@ -660,46 +587,4 @@ class ShanghaiStockSpider(scrapy.Spider):
         )
         item = {**base_item, **detail_item}
         # print(item)
-        yield item
-
-    def parse_pdf(self, response):
-        """
-        解析PDF文件
-        :param response:
-        :return:
-        """
-        # 用文件对象来创建一个pdf文档分析器
-        praser = PDFParser(BytesIO(response.body))
-        # 创建一个PDF文档
-        doc = PDFDocument()
-        # 连接分析器 与文档对象
-        praser.set_document(doc)
-        doc.set_parser(praser)
-        # 提供初始化密码
-        # 如果没有密码 就创建一个空的字符串
-        doc.initialize()
-        # 检测文档是否提供txt转换，不提供就忽略
-        if not doc.is_extractable:
-            raise PDFTextExtractionNotAllowed
-        else:
-            # 创建PDf 资源管理器 来管理共享资源
-            rsrcmgr = PDFResourceManager()
-            # 创建一个PDF设备对象
-            laparams = LAParams()
-            device = PDFPageAggregator(rsrcmgr, laparams=laparams)
-            # 创建一个PDF解释器对象
-            interpreter = PDFPageInterpreter(rsrcmgr, device)
-            contents_list = []
-            # 循环遍历列表，每次处理一个page的内容
-            for page in doc.get_pages():  # doc.get_pages() 获取page列表
-                # 接受该页面的LTPage对象
-                interpreter.process_page(page)
-                # 这里layout是一个LTPage对象 里面存放着
-                # 这个page解析出的各种对象 一般包括LTTextBox, LTFigure, LTImage, LTTextBoxHorizontal 等等
-                # 想要获取文本就获得对象的text属性
-                layout = device.get_result()
-                for index, out in enumerate(layout):
-                    if isinstance(out, LTTextBox):
-                        contents = out.get_text().strip()
-                        contents_list.append(contents)
-            return contents_list
\ No newline at end of file
+        yield item
\ No newline at end of file
@@ -1,23 +1,22 @@
 # -*- coding: utf-8 -*-
 import json
 import re
-from functools import reduce
-from io import BytesIO
 from urllib.parse import urljoin
 
 import jsonpath
 import scrapy
 import logging
-from pdfminer.pdfparser import PDFParser, PDFDocument, PDFSyntaxError
-from pdfminer.pdfinterp import PDFTextExtractionNotAllowed
-from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
-from pdfminer.converter import PDFPageAggregator
-from pdfminer.layout import LAParams, LTTextBox
+from pdfminer.pdfparser import PDFSyntaxError
+
+from bourse.utils.field_rules import get_field_rules
+from bourse.utils.normalize import join_text
+from bourse.utils.pdf_pool import PdfSpiderMixin
+from bourse.utils.pagination import PaginationSpiderMixin
 
 logger = logging.getLogger(__name__)
 
 
-class SzJgcsJlcfSpider(scrapy.Spider):
+class SzJgcsJlcfSpider(PaginationSpiderMixin, PdfSpiderMixin, scrapy.Spider):
     name = 'shenzhen_stock'
     allowed_domains = ['szse.cn']
 
@@ -90,6 +89,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
         data = data_list[0].get('data')
         if not data:
             return None
+        fresh = 0
         for item in data:
             gkxx_gsdm = item.get('gkxx_gsdm')  # 公司代码
             gkxx_gsjc = item.get('gkxx_gsjc')  # 公司简称
@@ -110,6 +110,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
                 xxly='深圳证券交易所-数据补充',
                 bz='深圳证券交易所-监管信息公开-监管措施',
             )
+            fresh += self.track_record(jgcs_item['bz'], jgcs_item['cf_jdrq'], item)
 
             if gkxx_jgsy.endswith("</a>"):
                 link = re.search(r'encode-open=\'(.*?)\'', gkxx_jgsy).group(1)
@@ -127,16 +128,8 @@ class SzJgcsJlcfSpider(scrapy.Spider):
 
         # 翻页请求
         pagecount = jsonpath.jsonpath(data_list[0], expr=r'$..pagecount')[0]
-        is_first = response.meta.get('is_first', True)
-        if is_first:
-            for page in range(2, pagecount + 1):
-                url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=1800_jgxxgk&TABKEY=tab1&PAGENO={}&selectBkmc=0'.format(page)
-                yield scrapy.Request(
-                    url=url,
-                    callback=self.parse_jgcs,
-                    meta={'is_first': False},
-                    priority=3,
-                )
+        url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=1800_jgxxgk&TABKEY=tab1&PAGENO={}&selectBkmc=0'
+        yield from self.paginate(response, '深圳证券交易所-监管信息公开-监管措施', pagecount, url, self.parse_jgcs, fresh=fresh)
 
     def parse_jlcf(self, response):
         """解析-纪律处分"""
@@ -145,6 +138,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
         data = results[1].get('data')
         if not data:
             return None
+        fresh = 0
         for item in data:
             xx_gsdm = item.get('xx_gsdm')  # 公司代码
             jc_gsjc = item.get('jc_gsjc')  # 公司简称
@@ -166,6 +160,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
                 xxly='深圳证券交易所-数据补充',
                 bz='深圳证券交易所-监管信息公开-纪律处分',
             )
+            fresh += self.track_record(jlcf_item['bz'], jlcf_item['cf_jdrq'], item)
 
             if ck.endswith("</a>"):
                 link = re.search(r'encode-open=\'(.*?)\'', ck).group(1)
@@ -180,48 +175,29 @@ class SzJgcsJlcfSpider(scrapy.Spider):
 
         # 翻页请求
         pagecount = jsonpath.jsonpath(results[1], expr=r'$..pagecount')[0]
-        is_first = response.meta.get('is_first', True)
-        if is_first:
-            for page in range(2, pagecount + 1):
-                url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=1800_jgxxgk&TABKEY=tab2&PAGENO={}&selectGsbk=0'.format(page)
-                yield scrapy.Request(
-                    url=url,
-                    callback=self.parse_jlcf,
-                    meta={'is_first': False},
-                    priority=3,
-                )
+        url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=1800_jgxxgk&TABKEY=tab2&PAGENO={}&selectGsbk=0'
+        yield from self.paginate(response, '深圳证券交易所-监管信息公开-纪律处分', pagecount, url, self.parse_jlcf, fresh=fresh)
 
     def parse_jgcs_pdf(self, response):
         """解析-监管措施pdf"""
+        return self.defer_pdf(response, self.parse_jgcs_content, source=response.meta['jgcs_item']['bz'])
+
+    def parse_jgcs_content(self, response, content_list):
+        """解析-监管措施pdf-提取字段"""
         jgcs_item = response.meta.get('jgcs_item')
-        try:
-            content_list = self.parse_pdf(response)
-        except Exception as e:
-            logger.error(f'解析出错{repr(e)}')
-            content_list = []
-
-        re_com = re.compile(r'\r|\n|\t|\s')
-        content = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in content_list])
+
+        content = join_text(content_list)
+        fields = get_field_rules(jgcs_item['bz']).extract(content)
         # print(f'pdf文本={content}')
-        oname_pattern = re.compile(r'(关于对)(.*?(公司|的))')
-        cf_wsh_pattern = re.compile(r'(监管函公司部|监管函|关注函|问询函)(.*?号)')
-        cf_sy_pattern = re.compile(r'：(.*?(?:违反了|你的上述行为违反了|你公司的上述行为违反了))')
-        cf_yj_pattern = re.compile(r'((?:违反了|你的上述行为违反了).*?规定)')
-        cf_jg_pattern = re.compile(r'(现对你.*?。)')
-        oname = oname_pattern.search(content)
-        oname = oname.group(2) if oname else ''
+        oname = fields['oname']
         if '的' in oname:
             oname = oname.replace('的', '')
         else:
             oname = oname
-        cf_wsh = cf_wsh_pattern.search(content)
-        cf_wsh = cf_wsh.group(2) if cf_wsh else ''
-        cf_sy = cf_sy_pattern.search(content)
-        cf_sy = cf_sy.group(1) if cf_sy else ''
-        cf_yj = cf_yj_pattern.search(content)
-        cf_yj = cf_yj.group(1) if cf_yj else ''
-        cf_jg = cf_jg_pattern.search(content)
-        cf_jg = cf_jg.group(1) if cf_jg else ''
+        cf_wsh = fields['cf_wsh']
+        cf_sy = fields['cf_sy']
+        cf_yj = fields['cf_yj']
+        cf_jg = fields['cf_jg']
         jgcs_new_item = dict(
             oname=oname,
             cf_wsh=cf_wsh,
@@ -237,32 +213,23 @@ class SzJgcsJlcfSpider(scrapy.Spider):
 
     def parse_jlcf_pdf(self, response):
         '''解析-纪律处分pdf'''
+        return self.defer_pdf(response, self.parse_jlcf_content, source=response.meta['jlcf_item']['bz'])
+
+    def parse_jlcf_content(self, response, content_list):
+        '''解析-纪律处分pdf-提取字段'''
         jlcf_item = response.meta.get('jlcf_item')
-        try:
-            content_list = self.parse_pdf(response)
-        except Exception as e:
-            logger.error(f'解析出错{repr(e)}')
-            content_list = []
-
-        re_com = re.compile(r'\r|\n|\t|\s')
-        content = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in content_list])
+
+        content = join_text(content_list)
+        fields = get_field_rules(jlcf_item['bz']).extract(content)
         # print(f'pdf文本={content}')
-        oname_pattern = re.compile(r'(关于对)(.*?(公司|给予))')
-        cf_sy_pattern = re.compile(r'(存在以下问题：|违规事实：|存在以下违规行为：)(.*?。)')
-        cf_yj_pattern = re.compile(r'((违反了本所|依据本所).*?规定)')
-        cf_jg_pattern = re.compile(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：).*?。)')
-        oname = oname_pattern.search(content)
-        oname = oname.group(2) if oname else ''
+        oname = fields['oname']
         if '给予' in oname:
             oname = oname.replace('给予', '')
         else:
             oname = oname
-        cf_sy = cf_sy_pattern.search(content)
-        cf_sy = cf_sy.group(2) if cf_sy else ''
-        cf_yj = cf_yj_pattern.search(content)
-        cf_yj = cf_yj.group(1) if cf_yj else ''
-        cf_jg = cf_jg_pattern.search(content)
-        cf_jg = cf_jg.group(1) if cf_jg else ''
+        cf_sy = fields['cf_sy']
+        cf_yj = fields['cf_yj']
+        cf_jg = fields['cf_jg']
         jlcf_new_item = dict(
             oname=oname,
             cf_sy=cf_sy,
@@ -281,6 +248,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
         data = results[0].get('data')
         if not data:
             return None
+        fresh = 0
         for item in data:
             gsdm = item.get('gsdm')  # 公司代码
             gsjc = item.get('gsjc')  # 公司简称
@@ -306,6 +274,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
                 xxly='深圳证券交易所-数据补充',
                 bz='深圳证券交易所-监管信息公开-问询函件-主板',
             )
+            fresh += self.track_record(main_item['bz'], main_item['cf_jdrq'], item)
             meta_data = {'main_item': main_item}
 
             if ck.endswith("</a>"):
@@ -323,52 +292,34 @@ class SzJgcsJlcfSpider(scrapy.Spider):
 
         # 翻页请求
         pagecount = jsonpath.jsonpath(results[0], expr=r'$..pagecount')[0]
-        is_first = response.meta.get('is_first', True)
-        if is_first:
-            for page in range(2, pagecount + 1):
-                url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=main_wxhj&TABKEY=tab1&PAGENO={}'.format(page)
-                yield scrapy.Request(
-                    url=url,
-                    callback=self.parse_wxhj_main,
-                    meta={'is_first': False},
-                    priority=3,
-                )
+        url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=main_wxhj&TABKEY=tab1&PAGENO={}'
+        yield from self.paginate(response, '深圳证券交易所-监管信息公开-问询函件-主板', pagecount, url, self.parse_wxhj_main, fresh=fresh)
 
     def parse_main_pdf(self, response):
         """解析-问询函件-主板pdf"""
-        re_com = re.compile(r'\r|\n|\t|\s')
+        return self.defer_pdf(response, self.parse_main_content, source=response.meta['main_item']['bz'])
+
+    def parse_main_content(self, response, content_list):
+        """解析-问询函件-主板pdf-提取字段"""
         main_item = response.meta.get('main_item')
         main_item['xq_url'] = response.url
 
-        try:
-            content_list = self.parse_pdf(response)
-        except Exception as e:
-            logger.error(f'解析出错{repr(e)}')
-            content_list = []
 
-        content = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in content_list])
+        content = join_text(content_list)
+
+        fields = get_field_rules(main_item['bz']).extract(content)
         main_item['ws_nr_txt'] = content
-        oname_pattern = re.compile(r'(关于对)(.*?(公司|给予))')
-        cf_wsh_pattern = re.compile(r'(监管函公司部|监管函|关注函|问询函|补充材料有关事项的函)(.*?号)')
-        cf_sy_pattern = re.compile(r'(存在以下问题：|违规事实：|存在以下违规行为：|董事会：)(.*?。)')
-        cf_yj_pattern = re.compile(r'((违反了本所|依据本所|严格遵守).*?规定)')
-        cf_jg_pattern = re.compile(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：|请你公司说明).*?。)')
-        oname = oname_pattern.search(content)
-        oname = oname.group(2) if oname else ''
+        oname = fields['oname']
         if '给予' in oname:
             oname = oname.replace('给予', '')
         else:
             oname = oname
 
         main_item['oname'] = oname
-        cf_wsh = cf_wsh_pattern.search(content)
-        main_item['cf_wsh'] = cf_wsh.group(2) if cf_wsh else ''
-        cf_sy = cf_sy_pattern.search(content)
-        main_item['cf_sy'] = cf_sy.group(2) if cf_sy else ''
-        cf_yj = cf_yj_pattern.search(content)
-        main_item['cf_yj'] = cf_yj.group(1) if cf_yj else ''
-        cf_jg = cf_jg_pattern.search(content)
-        main_item['cf_jg'] = cf_jg.group(1) if cf_jg else ''
+        main_item['cf_wsh'] = fields['cf_wsh']
+        main_item['cf_sy'] = fields['cf_sy']
+        main_item['cf_yj'] = fields['cf_yj']
+        main_item['cf_jg'] = fields['cf_jg']
 
         yield main_item
 
@@ -379,6 +330,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
         data = results[1].get('data')
         if not data:
             return None
+        fresh = 0
         for item in data:
             gsdm = item.get('gsdm')  # 公司代码
             gsjc = item.get('gsjc')  # 公司简称
@@ -404,6 +356,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
                 xxly='深圳证券交易所-数据补充',
                 bz='深圳证券交易所-监管信息公开-问询函件-中小企业板',
             )
+            fresh += self.track_record(zxqyb_item['bz'], zxqyb_item['cf_jdrq'], item)
 
             meta_data = {'zxqyb_item': zxqyb_item}
             if ck.endswith("</a>"):
@@ -421,49 +374,31 @@ class SzJgcsJlcfSpider(scrapy.Spider):
 
         # 翻页请求
         pagecount = jsonpath.jsonpath(results[1], expr=r'$..pagecount')[0]
-        is_first = response.meta.get('is_first', True)
-        if is_first:
-            for page in range(2, pagecount + 1):
-                url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=main_wxhj&TABKEY=tab2&PAGENO={}'.format(page)
-                yield scrapy.Request(
-                    url=url,
-                    callback=self.parse_zhongxb,
-                    meta={'is_first': False},
-                    priority=3,
-                )
+        url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=main_wxhj&TABKEY=tab2&PAGENO={}'
+        yield from self.paginate(response, '深圳证券交易所-监管信息公开-问询函件-中小企业板', pagecount, url, self.parse_zhongxb, fresh=fresh)
 
     def parse_zhongxb_pdf(self, response):
         """解析-问询函件-中小企业板PDF"""
-        re_com = re.compile(r'\r|\n|\t|\s')
+        return self.defer_pdf(response, self.parse_zhongxb_content, source=response.meta['zxqyb_item']['bz'])
+
+    def parse_zhongxb_content(self, response, content_list):
+        """解析-问询函件-中小企业板PDF-提取字段"""
         zxqyb_item = response.meta.get('zxqyb_item')
 
-        try:
-            content_list = self.parse_pdf(response)
-        except Exception as e:
-            logger.error(f'解析出错{repr(e)}')
-            content_list = []
-
-        content = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in content_list])
-        oname_pattern = re.compile(r'(关于对)(.*?(公司|给予))')
-        cf_wsh_pattern = re.compile(r'(监管函公司部|监管函|关注函|问询函|补充材料有关事项的函)(.*?号)')
-        cf_sy_pattern = re.compile(r'(存在以下问题：|违规事实：|存在以下违规行为：|董事会：)(.*?。)')
-        cf_yj_pattern = re.compile(r'((违反了本所|依据本所|严格遵守|按照国家法律).*?规定)')
-        cf_jg_pattern = re.compile(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：|请你公司说明|请你公司).*?。)')
-        oname = oname_pattern.search(content)
-        oname = oname.group(2) if oname else ''
+
+        content = join_text(content_list)
+
+        fields = get_field_rules(zxqyb_item['bz']).extract(content)
+        oname = fields['oname']
         if '给予' in oname:
             oname = oname.replace('给予', '')
         else:
             oname = oname
 
-        cf_wsh = cf_wsh_pattern.search(content)
-        cf_wsh = cf_wsh.group(2) if cf_wsh else ''
-        cf_sy = cf_sy_pattern.search(content)
-        cf_sy = cf_sy.group(2) if cf_sy else ''
-        cf_yj = cf_yj_pattern.search(content)
-        cf_yj = cf_yj.group(1) if cf_yj else ''
-        cf_jg = cf_jg_pattern.search(content)
-        cf_jg = cf_jg.group(1) if cf_jg else ''
+        cf_wsh = fields['cf_wsh']
+        cf_sy = fields['cf_sy']
+        cf_yj = fields['cf_yj']
+        cf_jg = fields['cf_jg']
         zxqyb_new_item = dict(
             oname=oname,
             cf_wsh=cf_wsh,
@@ -485,6 +420,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
         data = results[2].get('data')
         if not data:
             return None
+        fresh = 0
         for item in data:
             gsdm = item.get('gsdm')  # 公司代码
             gsjc = item.get('gsjc')  # 公司简称
@@ -510,6 +446,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
                 xxly='深圳证券交易所-数据补充',
                 bz='深圳证券交易所-监管信息公开-问询函件-创业板',
             )
+            fresh += self.track_record(cyb_item['bz'], cyb_item['cf_jdrq'], item)
 
             meta_data = {'cyb_item': cyb_item}
             if ck.endswith("</a>"):
@@ -527,51 +464,35 @@ class SzJgcsJlcfSpider(scrapy.Spider):
 
         # 翻页请求
         pagecount = jsonpath.jsonpath(results[2], expr=r'$..pagecount')[0]
-        is_first = response.meta.get('is_first', True)
-        if is_first:
-            for page in range(2, pagecount + 1):
-                url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=main_wxhj&TABKEY=tab3&PAGENO={}'.format(page)
-                yield scrapy.Request(
-                    url=url,
-                    callback=self.parse_chuangyb,
-                    meta={'is_first': False},
-                    priority=3,
-                )
+        url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=main_wxhj&TABKEY=tab3&PAGENO={}'
+        yield from self.paginate(response, '深圳证券交易所-监管信息公开-问询函件-创业板', pagecount, url, self.parse_chuangyb, fresh=fresh)
 
     def parse_chuangyb_pdf(self, response):
         """解析-问询函件-创业板模块PDF"""
-        re_com = re.compile(r'\r|\n|\t|\s')
+        return self.defer_pdf(response, self.parse_chuangyb_content, errback=self.chuangyb_pdf_failed, source=response.meta['cyb_item']['bz'])
+
+    def chuangyb_pdf_failed(self, failure, response):
+        """创业板PDF格式损坏的直接丢弃"""
+        if failure.check(PDFSyntaxError):
+            return None, '', 0, True
+        return self.pdf_failed(failure, response)
+
+    def parse_chuangyb_content(self, response, content_list):
+        """解析-问询函件-创业板模块PDF-提取字段"""
         cyb_item = response.meta.get('cyb_item')
 
-        try:
-            content_list = self.parse_pdf(response)
-        except (PDFSyntaxError):
-            return None
-        except Exception as e:
-            logger.error(f'解析出错{repr(e)}')
-            content_list = []
-
-        content = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in content_list])
-        oname_pattern = re.compile(r'(关于对)(.*?(公司|给予))')
-        cf_wsh_pattern = re.compile(r'(监管函公司部|监管函|关注函|问询函|补充材料有关事项的函)(.*?号)')
-        cf_sy_pattern = re.compile(r'(存在以下问题：|违规事实：|存在以下违规行为：|董事会：)(.*?。)')
-        cf_yj_pattern = re.compile(r'((违反了本所|依据本所|严格遵守|按照国家法律).*?规定)')
-        cf_jg_pattern = re.compile(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：|请你公司说明|请你公司).*?。)')
-        oname = oname_pattern.search(content)
-        oname = oname.group(2) if oname else ''
+        content = join_text(content_list)
+        fields = get_field_rules(cyb_item['bz']).extract(content)
+        oname = fields['oname']
         if '给予' in oname:
             oname = oname.replace('给予', '')
         else:
             oname = oname
 
-        cf_wsh = cf_wsh_pattern.search(content)
-        cf_wsh = cf_wsh.group(2) if cf_wsh else ''
-        cf_sy = cf_sy_pattern.search(content)
-        cf_sy = cf_sy.group(2) if cf_sy else ''
-        cf_yj = cf_yj_pattern.search(content)
-        cf_yj = cf_yj.group(1) if cf_yj else ''
-        cf_jg = cf_jg_pattern.search(content)
-        cf_jg = cf_jg.group(1) if cf_jg else ''
+        cf_wsh = fields['cf_wsh']
+        cf_sy = fields['cf_sy']
+        cf_yj = fields['cf_yj']
+        cf_jg = fields['cf_jg']
         cyb_new_item = dict(
             oname=oname,
             cf_wsh=cf_wsh,
@@ -593,6 +514,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
         data = results[0].get('data')
         if not data:
             return None
+        fresh = 0
         for item in data:
             xx_gsdm = item.get('xx_gsdm')  # 公司代码
             gsjc = item.get('gsjc')  # 公司简称
@@ -615,6 +537,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
                 xxly='深圳证券交易所-数据补充',
                 bz='深圳证券交易所-上市公司信息-上市公司诚信档案-处罚与纪律处分记录',
             )
+            fresh += self.track_record(cfycfjv_item['bz'], cfycfjv_item['cf_jdrq'], item)
             meta_data = {'cfycfjv_item': cfycfjv_item, 'dsr': dsr}
 
             if ck.endswith("</a>"):
@@ -633,16 +556,8 @@ class SzJgcsJlcfSpider(scrapy.Spider):
 
         # 翻页请求
         pagecount = jsonpath.jsonpath(results[0], expr=r'$..pagecount')[0]
-        is_first = response.meta.get('is_first', True)
-        if is_first:
-            for page in range(2, pagecount + 1):
-                url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=1759_cxda&TABKEY=tab1&PAGENO={}'.format(page)
-                yield scrapy.Request(
-                    url=url,
-                    callback=self.parse_cfycfjv,
-                    meta={'is_first': False},
-                    priority=3,
-                )
+        url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=1759_cxda&TABKEY=tab1&PAGENO={}'
+        yield from self.paginate(response, '深圳证券交易所-上市公司信息-上市公司诚信档案-处罚与纪律处分记录', pagecount, url, self.parse_cfycfjv, fresh=fresh)
 
     def parse_zjjgcfycf(self, response):
         """解析-上市公司诚信档案-中介机构处罚与处分信息"""
@@ -695,27 +610,18 @@ class SzJgcsJlcfSpider(scrapy.Spider):
 
     def parse_cfycfjv_pdf(self, response):
         """解析-上市公司诚信档案-处罚与处分记录PDF"""
-        re_com = re.compile(r'\r|\n|\t|\s')
+        return self.defer_pdf(response, self.parse_cfycfjv_content, source=response.meta['cfycfjv_item']['bz'])
+
+    def parse_cfycfjv_content(self, response, content_list):
+        """解析-上市公司诚信档案-处罚与处分记录PDF-提取字段"""
         cfycfjv_item = response.meta.get('cfycfjv_item')
         dsr = response.meta.get('dsr')
-        try:
-            content_list = self.parse_pdf(response)
-        except Exception as e:
-            logger.error(f'解析出错{repr(e)}')
-            content_list = []
-        content = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in content_list])
-        cf_wsh_pattern = re.compile(r'(监管函公司部|监管函|关注函|问询函|补充材料有关事项的函)(.*?号)')
-        cf_sy_pattern = re.compile(r'(存在以下问题：|违规事实：|存在以下违规行为：|董事会：|存在以下违规事实：)(.*?。)')
-        cf_yj_pattern = re.compile(r'((违反了本所|依据本所|严格遵守|按照国家法律).*?规定)')
-        cf_jg_pattern = re.compile(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：).*?。)')
-        cf_wsh = cf_wsh_pattern.search(content)
-        cf_wsh = cf_wsh.group(2) if cf_wsh else ''
-        cf_sy = cf_sy_pattern.search(content)
-        cf_sy = cf_sy.group(2) if cf_sy else ''
-        cf_yj = cf_yj_pattern.search(content)
-        cf_yj = cf_yj.group(1) if cf_yj else ''
-        cf_jg = cf_jg_pattern.search(content)
-        cf_jg = cf_jg.group(1) if cf_jg else ''
+        content = join_text(content_list)
+        fields = get_field_rules(cfycfjv_item['bz']).extract(content)
+        cf_wsh = fields['cf_wsh']
+        cf_sy = fields['cf_sy']
+        cf_yj = fields['cf_yj']
+        cf_jg = fields['cf_jg']
         cfycfjv_new_item = dict(
             cf_wsh=cf_wsh,
             cf_sy=cf_sy,
@@ -737,27 +643,22 @@ class SzJgcsJlcfSpider(scrapy.Spider):
         :param response:
         :return:
         """
-        re_com = re.compile(r'\r|\n|\t|\s')
+        return self.defer_pdf(response, self.parse_zjjgcfycf_content, source=response.meta['zjjgcfycf_item']['bz'])
+
+    def parse_zjjgcfycf_content(self, response, content_list):
+        """
+        解析-上市公司诚信档案-中介机构处罚与处分信息PDF-提取字段
+        :param response:
+        :return:
+        """
         zjjgcfycf_item = response.meta.get('zjjgcfycf_item')
         zj_dsr = response.meta.get('zj_dsr')
-        try:
-            content_list = self.parse_pdf(response)
-        except Exception as e:
-            logger.error(f'解析出错{repr(e)}')
-            content_list = []
-        content = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in content_list])
-        cf_wsh_pattern = re.compile(r'(监管函公司部|监管函|关注函|问询函|补充材料有关事项的函)(.*?号)')
-        cf_sy_pattern = re.compile(r'(存在以下问题：|违规事实：|存在以下违规行为：|董事会：|存在以下违规事实：)(.*?。)')
-        cf_yj_pattern = re.compile(r'((违反了本所|依据本所|严格遵守|按照国家法律).*?规定)')
-        cf_jg_pattern = re.compile(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：).*?。)')
-        cf_wsh = cf_wsh_pattern.search(content)
-        cf_wsh = cf_wsh.group(2) if cf_wsh else ''
-        cf_sy = cf_sy_pattern.search(content)
-        cf_sy = cf_sy.group(2) if cf_sy else ''
-        cf_yj = cf_yj_pattern.search(content)
-        cf_yj = cf_yj.group(1) if cf_yj else ''
-        cf_jg = cf_jg_pattern.search(content)
-        cf_jg = cf_jg.group(1) if cf_jg else ''
+        content = join_text(content_list)
+        fields = get_field_rules(zjjgcfycf_item['bz']).extract(content)
+        cf_wsh = fields['cf_wsh']
+        cf_sy = fields['cf_sy']
+        cf_yj = fields['cf_yj']
+        cf_jg = fields['cf_jg']
         zjjgcfycf_new_item = dict(
             cf_wsh=cf_wsh,
             cf_sy=cf_sy,
@@ -784,6 +685,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
         data = results[0].get('data')
         if not data:
             return None
+        fresh = 0
         for item in data:
             dx = item.get('dx')  # 问询对象
             lx = item.get('lx')  # 类型
@@ -810,6 +712,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
                 xxly='深圳证券交易所-数据补充',
                 bz='深圳证券交易所-债券信息-问询函',
             )
+            fresh += self.track_record(wxh_item['bz'], wxh_item['cf_jdrq'], item)
             meta_data = {'wxh_item': wxh_item}
             if hjbt.endswith("</a>"):
                 link = re.search(r'encode-open=\'(.*?)\'>', hjbt).group(1)
@@ -827,16 +730,8 @@ class SzJgcsJlcfSpider(scrapy.Spider):
 
         # 翻页请求
         pagecount = jsonpath.jsonpath(results[0], expr=r'$..pagecount')[0]
-        is_first = response.meta.get('is_first', True)
-        if is_first:
-            for page in range(2, pagecount + 1):
-                url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=ZQ_WXHJ&TABKEY=tab1&PAGENO={}'.format(page)
-                yield scrapy.Request(
-                    url=url,
-                    callback=self.parse_zqxxwxh,
-                    meta={'is_first': False},
-                    priority=3,
-                )
+        url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=ZQ_WXHJ&TABKEY=tab1&PAGENO={}'
+        yield from self.paginate(response, '深圳证券交易所-债券信息-问询函', pagecount, url, self.parse_zqxxwxh, fresh=fresh)
 
     def parse_zqxxjgcs(self, response):
         """
@@ -849,6 +744,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
         data = results[0].get('data')
         if not data:
             return None
+        fresh = 0
         for item in data:
             dx = item.get('dx')  # 监管对象
             lx = item.get('lx')  # 类型
@@ -876,6 +772,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
                 xxly='深圳证券交易所-数据补充',
                 bz='深圳证券交易所-债券信息-监管措施',
             )
+            fresh += self.track_record(jgcs_item['bz'], jgcs_item['cf_jdrq'], item)
             meta_data = {'jgcs_item': jgcs_item}
             if hjbt.endswith("</a>"):
                 link = re.search(r'encode-open=\'(.*?)\'>', hjbt).group(1)
@@ -893,16 +790,8 @@ class SzJgcsJlcfSpider(scrapy.Spider):
 
         # 翻页请求
         pagecount = jsonpath.jsonpath(results[0], expr=r'$..pagecount')[0]
-        is_first = response.meta.get('is_first', True)
-        if is_first:
-            for page in range(2, pagecount + 1):
-                url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=ZQ_JGCS&TABKEY=tab1&PAGENO={}'.format(page)
-                yield scrapy.Request(
-                    url=url,
-                    callback=self.parse_zqxxjgcs,
-                    meta={'is_first': False},
-                    priority=3,
-                )
+        url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=ZQ_JGCS&TABKEY=tab1&PAGENO={}'
+        yield from self.paginate(response, '深圳证券交易所-债券信息-监管措施', pagecount, url, self.parse_zqxxjgcs, fresh=fresh)
 
     def parse_zqxxjlcf(self, response):
         """
@@ -915,6 +804,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
         data = results[0].get('data')
         if not data:
             return None
+        fresh = 0
         for item in data:
             dx = item.get('dx')  # 处分对象
             lx = item.get('lx')  # 类型
@@ -942,6 +832,7 @@ class SzJgcsJlcfSpider(scrapy.Spider):
                 xxly='深圳证券交易所-数据补充',
                 bz='深圳证券交易所-债券信息-纪律处分',
             )
+            fresh += self.track_record(jlcf_item['bz'], jlcf_item['cf_jdrq'], item)
             meta_data = {'jlcf_item': jlcf_item}
             if hjbt.endswith("</a>"):
                 link = re.search(r'encode-open=\'(.*?)\'>', hjbt).group(1)
@@ -959,16 +850,8 @@ class SzJgcsJlcfSpider(scrapy.Spider):
 
         # 翻页请求
         pagecount = jsonpath.jsonpath(results[0], expr=r'$..pagecount')[0]
-        is_first = response.meta.get('is_first', True)
-        if is_first:
-            for page in range(2, pagecount + 1):
-                url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=ZQ_JLCF&TABKEY=tab1&PAGENO={}'.format(page)
-                yield scrapy.Request(
-                    url=url,
-                    callback=self.parse_zqxxjlcf,
-                    meta={'is_first': False},
-                    priority=3,
-                )
+        url = 'http://www.szse.cn/api/report/ShowReport/data?SHOWTYPE=JSON&CATALOGID=ZQ_JLCF&TABKEY=tab1&PAGENO={}'
+        yield from self.paginate(response, '深圳证券交易所-债券信息-纪律处分', pagecount, url, self.parse_zqxxjlcf, fresh=fresh)
 
     def parse_zqxxwxh_pdf(self, response):
         """
@@ -976,24 +859,21 @@ class SzJgcsJlcfSpider(scrapy.Spider):
         :param response:
         :return:
         """
+        return self.defer_pdf(response, self.parse_zqxxwxh_content, source=response.meta['wxh_item']['bz'])
+
+    def parse_zqxxwxh_content(self, response, content_list):
+        """
+        解析-债券信息-问询函PDF-提取字段
+        :param response:
+        :return:
+        """
 
-        re_com = re.compile(r'\r|\n|\t|\s')
         wxh_item = response.meta.get('wxh_item')
-        try:
-            content_list = self.parse_pdf(response)
-        except Exception as e:
-            logger.error(f'解析出错{repr(e)}')
-            content_list = []
-        content = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in content_list])
-        cf_sy_pattern = re.compile(r'(存在以下问题：|违规事实：|存在以下违规行为：|董事会：|存在以下违规事实：|存在以下不规范事项：|存在以下信息披露不规范事项：|存在以下事项：)(.*?。)')
-        cf_yj_pattern = re.compile(r'((违反了本所|依据本所|严格遵守|按照国家法律|不规范的行为违反了).*?规定)')
-        cf_jg_pattern = re.compile(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：|请你公司高度重视信息披露义务|提醒你公司严格遵守).*?。)')
-        cf_sy = cf_sy_pattern.search(content)
-        cf_sy = cf_sy.group(2) if cf_sy else ''
-        cf_yj = cf_yj_pattern.search(content)
-        cf_yj = cf_yj.group(1) if cf_yj else ''
-        cf_jg = cf_jg_pattern.search(content)
-        cf_jg = cf_jg.group(1) if cf_jg else ''
+        content = join_text(content_list)
+        fields = get_field_rules(wxh_item['bz']).extract(content)
+        cf_sy = fields['cf_sy']
+        cf_yj = fields['cf_yj']
+        cf_jg = fields['cf_jg']
         zqxx_new_item = dict(
             cf_sy=cf_sy,
             cf_yj=cf_yj,
@@ -1011,23 +891,20 @@ class SzJgcsJlcfSpider(scrapy.Spider):
         :param response:
         :return:
         """
-        re_com = re.compile(r'\r|\n|\t|\s')
+        return self.defer_pdf(response, self.parse_zqxxjgcs_content, source=response.meta['jgcs_item']['bz'])
+
+    def parse_zqxxjgcs_content(self, response, content_list):
+        """
+        解析-债券信息-监管措施PDF-提取字段
+        :param response:
+        :return:
+        """
         jgcs_item = response.meta.get('jgcs_item')
-        try:
-            content_list = self.parse_pdf(response)
-        except Exception as e:
-            logger.error(f'解析出错{repr(e)}')
-            content_list = []
-        content = reduce(lambda x, y: x + y, [re_com.sub('', i) for i in content_list])
-        cf_sy_pattern = re.compile(r'(存在以下问题：|违规事实：|存在以下违规行为：|董事会：|存在以下违规事实：|存在以下不规范事项：|存在以下信息披露不规范事项：|存在以下事项：)(.*?。)')
-        cf_yj_pattern = re.compile(r'((违反了本所|依据本所|严格遵守|按照国家法律|不规范的行为违反了|请说明是否按照).*?规定)')
-        cf_jg_pattern = re.compile(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：|请你公司高度重视信息披露义务|提醒你公司严格遵守).*?。)')
-        cf_sy = cf_sy_pattern.search(content)
-        cf_sy = cf_sy.group(2) if cf_sy else ''
-        cf_yj = cf_yj_pattern.search(content)
-        cf_yj = cf_yj.group(1) if cf_yj else ''
-        cf_jg = cf_jg_pattern.search(content)
-        cf_jg = cf_jg.group(1) if cf_jg else ''
+        content = join_text(content_list)
+        fields = get_field_rules(jgcs_item['bz']).extract(content)
+        cf_sy = fields['cf_sy']
+        cf_yj = fields['cf_yj']
+        cf_jg = fields['cf_jg']
         jgcs_new_item = dict(
             cf_sy=cf_sy,
             cf_yj=cf_yj,
@@ -1047,48 +924,6 @@ class SzJgcsJlcfSpider(scrapy.Spider):
         """
         pass
 
-    def parse_pdf(self, response):
-        """
-        解析PDF文件
-        :param response:
-        :return:
-        """
-        # 用文件对象来创建一个pdf文档分析器
-        praser = PDFParser(BytesIO(response.body))
-        # 创建一个PDF文档
-        doc = PDFDocument()
-        # 连接分析器 与文档对象
-        praser.set_document(doc)
-        doc.set_parser(praser)
-        # 提供初始化密码
-        # 如果没有密码 就创建一个空的字符串
-        doc.initialize()
-        # 检测文档是否提供txt转换，不提供就忽略
-        if not doc.is_extractable:
-            raise PDFTextExtractionNotAllowed
-        else:
-            # 创建PDf 资源管理器 来管理共享资源
-            rsrcmgr = PDFResourceManager()
-            # 创建一个PDF设备对象
-            laparams = LAParams()
-            device = PDFPageAggregator(rsrcmgr, laparams=laparams)
-            # 创建一个PDF解释器对象
-            interpreter = PDFPageInterpreter(rsrcmgr, device)
-            contents_list = []
-            # 循环遍历列表，每次处理一个page的内容
-            for page in doc.get_pages():  # doc.get_pages() 获取page列表
-                # 接受该页面的LTPage对象
-                interpreter.process_page(page)
-                # 这里layout是一个LTPage对象 里面存放着
-                # 这个page解析出的各种对象 一般包括LTTextBox, LTFigure, LTImage, LTTextBoxHorizontal 等等
-                # 想要获取文本就获得对象的text属性
-                layout = device.get_result()
-                for index, out in enumerate(layout):
-                    if isinstance(out, LTTextBox):
-                        contents = out.get_text().strip()
-                        contents_list.append(contents)
-            return contents_list
-
     def deal_dsr_oname(self, dsr):
         """
         把当事人拆解开
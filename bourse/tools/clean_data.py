@@ -1,11 +1,79 @@
 # -*- coding: utf-8 -*-
-import copy
+import json
+import multiprocessing
+import os
+import queue
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
+
 import jpype
 
 from bourse import settings
 from bourse.tools.es_client import ESClient
 
+# 子进程里的CleanData，只用来跑modify_data，不连es
+_cleaner = None
+
+
+def init_worker(cleaner):
+    global _cleaner
+    _cleaner = cleaner
+
+
+def clean_chunk(sources):
+    """
+    在子进程里清洗一块数据
+    :return: (修改后的数据, 这块的条数, 耗时, 进程id)
+    """
+    start = time.time()
+    items = []
+    for item in sources:
+        modify_item = _cleaner.modify_data(item)
+        if modify_item:
+            items.append({**item, **modify_item})
+    return items, len(sources), time.time() - start, os.getpid()
+
+
+class CleanCheckpoint(object):
+    """
+    清洗任务断点: 最后写入的数据的sort值、已处理条数、是否跑完，每批写入后保存
+    """
+    def __init__(self, path):
+        self.path = path
+        self.state = {"after": None, "processed": 0, "done": False}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.state.update(json.load(f))
+
+    @property
+    def after(self):
+        return self.state["after"]
+
+    @property
+    def processed(self):
+        return self.state["processed"]
+
+    @property
+    def done(self):
+        return self.state["done"]
+
+    def save(self, after, processed, done=False):
+        self.state.update(after=after, processed=processed, done=done,
+                          updated_at=time.strftime("%Y-%m-%d %H:%M:%S"))
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        self.state = {"after": None, "processed": 0, "done": False}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
 
 class CleanData(object):
 
@@ -29,39 +97,234 @@ class CleanData(object):
         self.is_qx_sj = False
         # self.is_qx_sj = True
 
+        # 只取需要清洗的字段，None取全部字段；要包含modify_data里用到的全部字段，否则会被更新成空值
+        # 调用java接口入库(is_qx_sj)要全部字段，这个设置不生效
+        self.source_includes = None
+        # self.source_includes = ["ws_pc_id", "oname", "cf_cfmc", "cf_jdrq", "cf_wsh", "cf_xzjg", "cf_sy", "cf_jg",
+        #                         "xxly", "xq_url", "sj_type", "cj_sj"]
+
+        # 攒够多少条批量更新一次(bulk或者一次调用java接口)
+        self.batch_size = settings.CLEAN_BATCH_SIZE
+
+        # 多进程清洗的进程数，0或1在当前进程清洗；每块多少条交给子进程
+        self.workers = settings.CLEAN_WORKERS
+        self.chunk_size = settings.CLEAN_CHUNK_SIZE
+
+        # 任务ID，设置后按search_after游标遍历，每批写入后保存断点，中断后接着上次的位置跑；
+        # 同一个ID已经跑完的再运行直接跳过，rerun=True重新跑。测试模式不保存断点
+        self.job_id = None
+        # self.job_id = "浙江省法院公开网-限制招投标-入库"
+        self.rerun = False
+        self.checkpoint = None
+
+        # 只把固定字段改成固定值(status_fields)，例如只更新数据状态时，在es服务端按查询更新，不把数据拉到本地
+        self.is_status_only = False
+        # self.is_status_only = True
+
+    def __getstate__(self):
+        # 传给子进程时不带es连接
+        state = self.__dict__.copy()
+        state.pop("es_client", None)
+        return state
+
+    def open_checkpoint(self):
+        """
+        有任务ID时读取断点
+        :return: 任务已经跑完返回False
+        """
+        if not self.job_id or self.is_test:
+            return True
+        path = os.path.join(settings.CLEAN_CHECKPOINT_DIR, self.job_id.replace("/", "_") + ".json")
+        self.checkpoint = CleanCheckpoint(path)
+        if self.checkpoint.done:
+            if not self.rerun:
+                print("任务{}已经跑完({}条, {})，跳过".format(
+                    self.job_id, self.checkpoint.processed, self.checkpoint.state.get("updated_at")))
+                return False
+            self.checkpoint.reset()
+        if self.checkpoint.after is not None:
+            print("任务{}从断点{}继续，已处理{}条".format(self.job_id, self.checkpoint.after, self.checkpoint.processed))
+        return True
+
+    def save_checkpoint(self, after, num, done=False):
+        if self.checkpoint is not None:
+            self.checkpoint.save(after, self.processed_base + num, done)
+
     def run(self):
         """主程序"""
+        if self.is_status_only:
+            return self.run_status_flip()
+        if not self.open_checkpoint():
+            return
+        self.processed_base = self.checkpoint.processed if self.checkpoint else 0
+        if self.workers > 1:
+            return self.run_parallel()
+
         jclass = self.get_jclass()  # 获取java类的实例
 
         data_iter, total_count = self.query_data()
-        num = 1
+        num = 0
+        scanned = 0
+        batch = []
+        last_sort = self.checkpoint.after if self.checkpoint else None
+        start = time.time()
         for idx, data in enumerate(data_iter):
+            scanned += 1
+            last_sort = data.get("sort", last_sort)
             item = data.get("_source")
-            org_item = copy.deepcopy(item)  # 保存原始数据
+            # modify_data返回新的字典，不修改原始数据，不用再深拷贝
             modify_item = self.modify_data(item)
             # 判断修改字典，如果为None，则跳过不修改
             if not modify_item:
                 continue
 
-            item = {**org_item, **modify_item}
-
-            print("current nums --> {}/{}".format(num, total_count))
+            item = {**item, **modify_item}
             num += 1
             if not self.is_test:
-                if self.is_qx_sj:
-                    # 调用java接口，插入es中
-                    item = self.dict2jmap(item)     # python中的dict对象转化为java中map类型
-                    arrayList = jpype.java.util.ArrayList()
-                    arrayList.add(item)
-                    jclass.data2es_gx(arrayList)
-                    # 调用java接口结束
-                else:
-                    self.update_data(item)
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self.flush_batch(batch, jclass)
+                    batch = []
+                    # 到这条为止的数据都已经写入或者不需要修改
+                    self.save_checkpoint(last_sort, scanned)
+                    print("current nums --> {}/{}, {:.1f}条/秒".format(num, total_count, num / (time.time() - start)))
             else:
                 if idx == 1000:
                     break
+        if batch:
+            self.flush_batch(batch, jclass)
+        self.save_checkpoint(last_sort, scanned, done=True)
+        print("current nums --> {}/{}, 耗时{:.1f}秒".format(num, total_count, time.time() - start))
+        print("连接池: ", self.es_client.pool_metrics())
 
-    def query_data(self):
+    def status_fields(self):
+        """按查询更新时要改的字段和值"""
+        return {
+            "sj_ztxx": 1,  # 数据状态信息，0：未入库，1:入库，-1已删除
+            "xg_sj": int(time.time()),  # 修改时间
+        }
+
+    def run_status_flip(self):
+        """
+        按查询在es服务端更新status_fields里的字段: painless脚本 + 异步update_by_query任务，
+        切片并行、按每秒条数限速，轮询任务进度，数据不经过本地
+        """
+        query_body = self.build_query()
+        fields = self.status_fields()
+        data = self.es_client.search_by_query({"query": query_body["query"], "size": 0})
+        print("总数量为: ", data.get("hits", {}).get("total"), "更新字段: ", fields)
+        if self.is_test:
+            return
+        status = self.es_client.update_by_query_task(
+            query_body["query"], fields,
+            slices=settings.CLEAN_UBQ_SLICES,
+            requests_per_second=settings.CLEAN_UBQ_REQUESTS_PER_SECOND,
+            poll_interval=settings.CLEAN_UBQ_POLL_INTERVAL,
+        )
+        for failure in status.get("failures", [])[:10]:
+            print("更新失败: ", failure)
+
+    def run_parallel(self):
+        """
+        多进程清洗: 遍历到的数据按chunk_size分块交给进程池跑modify_data，
+        结果按提交顺序经过有界队列交回主进程，由主进程攒批写入(bulk或者java接口)
+        """
+        jclass = self.get_jclass()  # 获取java类的实例
+        data_iter, total_count = self.query_data()
+        total = total_count.get("value") if isinstance(total_count, dict) else total_count
+        # 最多这么多块在子进程里排队，写入慢了遍历也跟着停
+        pending = queue.Queue(maxsize=self.workers * 2)
+        finished = object()
+        stats = {"scanned": 0, "modified": 0, "written": 0, "workers": {}}
+        start = last_report = time.time()
+
+        # 主进程里已经有jvm和遍历线程，用spawn启动子进程，不fork这些状态
+        mp_context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=mp_context,
+                                 initializer=init_worker, initargs=(self,)) as executor:
+            def feed():
+                try:
+                    chunk = []
+                    last_sort = None
+                    for idx, data in enumerate(data_iter):
+                        if self.is_test and idx == 1000:
+                            break
+                        chunk.append(data.get("_source"))
+                        last_sort = data.get("sort")
+                        if len(chunk) >= self.chunk_size:
+                            # 跟着这块最后一条的sort值，这块写完后保存断点
+                            pending.put((executor.submit(clean_chunk, chunk), last_sort))
+                            chunk = []
+                    if chunk:
+                        pending.put((executor.submit(clean_chunk, chunk), last_sort))
+                except Exception as e:
+                    pending.put(e)
+                finally:
+                    pending.put(finished)
+
+            feeder = threading.Thread(target=feed, daemon=True)
+            feeder.start()
+            batch = []
+            last_sort = self.checkpoint.after if self.checkpoint else None
+            while True:
+                task = pending.get()
+                if task is finished:
+                    break
+                if isinstance(task, Exception):
+                    raise task
+                future, last_sort = task
+                items, count, seconds, pid = future.result()
+                stats["scanned"] += count
+                stats["modified"] += len(items)
+                worker = stats["workers"].setdefault(pid, {"chunks": 0, "docs": 0, "seconds": 0.0})
+                worker["chunks"] += 1
+                worker["docs"] += count
+                worker["seconds"] += seconds
+                if not self.is_test:
+                    batch.extend(items)
+                    # 按块的边界写入，写完这块之前的数据都处理完了，可以保存断点
+                    if len(batch) >= self.batch_size:
+                        self.flush_batch(batch, jclass)
+                        stats["written"] += len(batch)
+                        batch = []
+                        self.save_checkpoint(last_sort, stats["scanned"])
+                if time.time() - last_report >= 10:
+                    last_report = time.time()
+                    self.report_progress(stats, total, start, pending.qsize())
+            if batch:
+                self.flush_batch(batch, jclass)
+                stats["written"] += len(batch)
+            self.save_checkpoint(last_sort, stats["scanned"], done=True)
+
+        self.report_progress(stats, total, start, 0)
+        for pid, worker in sorted(stats["workers"].items()):
+            print("进程{}: {}块, {}条, 清洗耗时{:.1f}秒, {:.1f}条/秒".format(
+                pid, worker["chunks"], worker["docs"], worker["seconds"],
+                worker["docs"] / worker["seconds"] if worker["seconds"] else 0))
+        print("连接池: ", self.es_client.pool_metrics())
+
+    @staticmethod
+    def report_progress(stats, total, start, queued):
+        cost = time.time() - start
+        print("已遍历{}/{}, 修改{}, 已写入{}, 排队{}块, 耗时{:.1f}秒, {:.1f}条/秒".format(
+            stats["scanned"], total, stats["modified"], stats["written"], queued, cost,
+            stats["scanned"] / cost if cost else 0))
+
+    def flush_batch(self, batch, jclass):
+        """一批数据更新到es"""
+        if self.is_qx_sj:
+            # 调用java接口，插入es中，一批数据放在一个ArrayList里调用一次
+            array_list = jpype.java.util.ArrayList(len(batch))
+            for item in batch:
+                array_list.add(self.dict2jmap(item))     # python中的dict对象转化为java中map类型
+            jclass.data2es_gx(array_list)
+            # 调用java接口结束
+        else:
+            report = self.es_client.bulk_update(batch)
+            for _id, error in report['errors'][:10]:
+                print("更新失败: ", _id, error)
+
+    def build_query(self):
         """
         根据条件筛选站点，数据
         sj_bs_bj: 意义：sj_bs_bj枚举值
@@ -124,11 +387,21 @@ class CleanData(object):
             ],
             "aggs": {}
         }
+        return query_body
 
+    def query_data(self):
+        """遍历筛选出来的数据"""
+        query_body = self.build_query()
         data = self.es_client.search_by_query(query_body)
         print("总数量为: ", data.get("hits", {}).get("total"))
 
-        data_iter = self.es_client.scroll_search(query_body)
+        includes = None if self.is_qx_sj or not self.source_includes else list({"ws_pc_id", *self.source_includes})
+        if self.checkpoint is not None:
+            # 可以续跑的任务按唯一字段排序用search_after遍历，从断点的sort值接着往后
+            data_iter = self.es_client.search_after_scan(query_body, settings.CLEAN_CURSOR_SORT,
+                                                         after=self.checkpoint.after, includes=includes)
+        else:
+            data_iter = self.es_client.scroll_search(query_body, slices=settings.CLEAN_SCAN_SLICES, includes=includes)
         return data_iter, data.get("hits", {}).get("total")
 
     def modify_data(self, item: dict):
@@ -180,7 +453,9 @@ class CleanData(object):
         # ####### 修改字段结束
         # # ####### 修改字段结束
 
-        print(info)
+        # 每条都打印会拖慢清洗，正式跑时进度看report_progress
+        if self.is_test:
+            print(info)
         return info
 
     def update_data(self, item):
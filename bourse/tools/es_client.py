@@ -1,16 +1,47 @@
 # -*- coding: utf-8 -*-
-import elasticsearch
-from elasticsearch import helpers
-from elasticsearch.helpers import bulk
+import json
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from elasticsearch import ConnectionError, TransportError, helpers
+
+from bourse.utils.es_pool import get_es_client, pool_metrics, project_settings
+
+
+def sxlhcj_source(row_obj):
+    """ 失信联合惩戒名单要写入的字段 """
+    return {
+        'oname': row_obj.get('oname', None),
+        'uccode': row_obj.get('uccode', None),
+        'cf_sy': row_obj.get('cf_sy', None),
+        'cf_jg': row_obj.get('cf_jg', None),
+        'cf_cflb': row_obj.get('cf_cflb', None),
+        'cf_jdrq': row_obj.get('cf_jdrq', None),
+        'cf_wsh': row_obj.get('cf_wsh', None),
+        'cf_xzjg': row_obj.get('cf_xzjg', None),
+        'sj_type': '67',
+        "site_id": 20906,
+        "xxly": '中华人民共和国-失信联合惩戒名单',
+        "cf_type": '失信联合惩戒',
+    }
 
 
 class ESClient(object):
 
     # def __init__(self, host="114.115.129.113", port=9999, index_name=None, index_type=None):
-    def __init__(self, host_port, index_name=None, index_type=None):
+    def __init__(self, host_port, index_name=None, index_type=None, settings=None):
         self.index_name = index_name
         self.index_type = index_type
-        self.es = elasticsearch.Elasticsearch(host_port, timeout=3600)
+        self.settings = settings or project_settings()
+        # 共用连接池，默认超时ES_TIMEOUT，按条件更新/删除这类慢请求用ES_LONG_TIMEOUT
+        self.es = get_es_client(host_port, self.settings)
+        self.long_timeout = self.settings.getfloat('ES_LONG_TIMEOUT')
+        # 批量写入的条数和耗时，按是否在backfill里分开统计，用来算提速
+        self.bulk_stats = {False: [0, 0.0], True: [0, 0.0]}
+        self.in_backfill = False
 
     def insert_data(self, item, _id):
         result = self.es.create(index=self.index_name, doc_type=self.index_type, id=_id, body=item)
@@ -21,10 +52,69 @@ class ESClient(object):
         result = self.es.update(index=self.index_name, doc_type=self.index_type, id=_id, body=item)
         return result
 
+    def bulk_update(self, items, id_field='ws_pc_id'):
+        """
+        批量局部更新，没有id_field的跳过
+        :return: stream_index的结果
+        """
+        docs = ({'_id': item[id_field], **item} for item in items if item.get(id_field))
+        return self.stream_index(docs, op_type='update', verbose=False)
+
     def update_by_query(self, query):
-        result = self.es.update_by_query(index=self.index_name, doc_type=self.index_type, body=query)
+        result = self.es.update_by_query(index=self.index_name, doc_type=self.index_type, body=query,
+                                         request_timeout=self.long_timeout)
         return result
 
+    def update_by_query_task(self, query, fields, slices='auto', requests_per_second=-1, poll_interval=5):
+        """
+        按查询把fields里的字段改成固定值，在es服务端执行，数据不经过本地
+        提交成异步任务(wait_for_completion=False)，切片并行，按requests_per_second限速，轮询任务进度直到完成
+        Ctrl-C会取消服务端的任务
+        :param query: 查询条件，即查询语句里query的部分
+        :param fields: {字段: 值}
+        :param slices: 切片数，auto按分片数
+        :param requests_per_second: 每秒最多更新多少条，-1不限速
+        :return: 任务完成后的结果(total, updated, version_conflicts, failures等)
+        """
+        body = {
+            'query': query,
+            'script': {
+                # 脚本不随字段变化，es只编译一次
+                'source': 'for (entry in params.fields.entrySet()) { ctx._source[entry.getKey()] = entry.getValue(); }',
+                'lang': 'painless',
+                'params': {'fields': fields},
+            },
+        }
+        result = self.es.update_by_query(index=self.index_name, doc_type=self.index_type, body=body,
+                                         wait_for_completion=False, slices=slices, conflicts='proceed',
+                                         requests_per_second=requests_per_second)
+        task_id = result['task']
+        print(f'提交按查询更新任务{task_id}')
+        start = time.time()
+        try:
+            while True:
+                task = self.es.tasks.get(task_id=task_id)
+                status = task['task']['status']
+                done = status.get('updated', 0) + status.get('version_conflicts', 0) + status.get('noops', 0)
+                total = status.get('total', 0)
+                cost = time.time() - start
+                print(f"进度{done}/{total}, 更新{status.get('updated', 0)}, 冲突{status.get('version_conflicts', 0)}, "
+                      f"{status.get('batches', 0)}批, 限速等待{status.get('throttled_millis', 0) / 1000:.1f}秒, "
+                      f"{done / cost if cost else 0:.1f}条/秒")
+                if task.get('completed'):
+                    break
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            self.es.tasks.cancel(task_id=task_id)
+            print(f'已取消任务{task_id}')
+            raise
+        if task.get('error'):
+            raise RuntimeError(f"按查询更新任务{task_id}出错: {task['error']}")
+        response = task.get('response', status)
+        print(f"任务完成, 共{response.get('total')}条, 更新{response.get('updated')}, "
+              f"冲突{response.get('version_conflicts')}, 失败{len(response.get('failures', []))}, 耗时{time.time() - start:.1f}秒")
+        return response
+
     # 单条查询
     def search_by_query(self, query):
         result = self.es.search(index=self.index_name, body=query)
@@ -46,48 +136,178 @@ class ESClient(object):
         row_obj.pop("_id")
         self.es.index(index=self.index_name, doc_type=self.index_type, body=row_obj, id=_id)
 
-    def add_data_bulk(self, row_obj_list):
-        """
-        批量插入ES
-        """
-        load_data = []
-        i = 1
-        bulk_num = 20000  # 2000条为一批
-        for row_obj in row_obj_list:
-            action = {
-                "_index": self.index_name,
-                "_type": self.index_type,
-                "_id": row_obj.get('_id', 'None'),
-                "_source": {
-                    'oname': row_obj.get('oname', None),
-                    'uccode': row_obj.get('uccode', None),
-                    'cf_sy': row_obj.get('cf_sy', None),
-                    'cf_jg': row_obj.get('cf_jg', None),
-                    'cf_cflb': row_obj.get('cf_cflb', None),
-                    'cf_jdrq': row_obj.get('cf_jdrq', None),
-                    'cf_wsh': row_obj.get('cf_wsh', None),
-                    'cf_xzjg': row_obj.get('cf_xzjg', None),
-                    'sj_type': '67',
-                    "site_id": 20906,
-                    "xxly": '中华人民共和国-失信联合惩戒名单',
-                    "cf_type": '失信联合惩戒',
-                }
-            }
-            load_data.append(action)
-            i += 1
-            # 批量处理
-            if len(load_data) == bulk_num:
-                print('批量插入')
-                success, failed = bulk(self.es, load_data, index=self.index_name, raise_on_error=True)
-                del load_data[0:len(load_data)]
-                print(success, failed)
-                # print("一次共插入:%s条数据" % (len(load_data)))
-
-        if len(load_data) > 0:
-            success, failed = bulk(self.es, load_data, index=self.index_name, raise_on_error=True)
-            print("插入成功")
-            del load_data[0:len(load_data)]
-            print(success, failed)
+    def add_data_bulk(self, row_obj_list, to_source=None):
+        """
+        批量插入ES，row_obj_list可以是生成器
+        :param to_source: 原始数据转成要写入的字段，默认是失信联合惩戒名单的字段
+        """
+        to_source = to_source or sxlhcj_source
+        docs = ({'_id': row_obj.get('_id', 'None'), **to_source(row_obj)} for row_obj in row_obj_list)
+        report = self.stream_index(docs)
+        print("插入成功", report['success'], "失败", report['failed'])
+        return report
+
+    def stream_index(self, docs, op_type='index', chunk_bytes=None, threads=None, max_retries=None, verbose=True):
+        """
+        流式批量写入，docs是任意可迭代的数据，'_id'字段作为文档id(没有由ES生成)，不会把整批数据放在内存里
+        按字节数切块，线程池里最多threads个bulk请求同时在写，被拒绝(429)的文档指数退避重试
+        :param op_type: index 覆盖; create 已存在的算失败(409); update 局部更新，只改数据里有的字段
+        :param chunk_bytes: 每块最多多少字节，默认ES_STREAM_CHUNK_BYTES
+        :param threads: 同时在写的块数，默认ES_STREAM_THREADS
+        :param max_retries: 429重试次数，默认ES_STREAM_MAX_RETRIES
+        :param verbose: 打印每块的条数、耗时和失败数
+        :return: {'docs', 'success', 'failed', 'retries', 'chunks', 'docs_per_sec', 'p50_ms', 'p95_ms', 'max_ms', 'errors'}
+        """
+        chunk_bytes = chunk_bytes or self.settings.getint('ES_STREAM_CHUNK_BYTES')
+        threads = threads or self.settings.getint('ES_STREAM_THREADS')
+        max_retries = self.settings.getint('ES_STREAM_MAX_RETRIES') if max_retries is None else max_retries
+        report = dict(docs=0, success=0, failed=0, retries=0, chunks=0, errors=[])
+        latencies = []
+        start = time.time()
+
+        def collect(future):
+            result = future.result()
+            report['chunks'] += 1
+            for key in ('docs', 'success', 'failed', 'retries'):
+                report[key] += result[key]
+            # 失败明细最多保留1000条
+            report['errors'].extend(result['errors'][:1000 - len(report['errors'])])
+            latencies.append(result['seconds'])
+            if verbose:
+                print(f"第{report['chunks']}块: {result['docs']}条, {result['seconds'] * 1000:.0f}ms, "
+                      f"重试{result['retries']}次, 失败{result['failed']}")
+
+        inflight = set()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for chunk in self.iter_chunks(docs, op_type, chunk_bytes):
+                if len(inflight) >= threads:
+                    done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future)
+                inflight.add(executor.submit(self.send_chunk, chunk, max_retries))
+            for future in inflight:
+                collect(future)
+
+        cost = time.time() - start
+        stats = self.bulk_stats[self.in_backfill]
+        stats[0] += report['success']
+        stats[1] += cost
+        latencies.sort()
+        report['docs_per_sec'] = round(report['docs'] / cost, 1) if cost else 0
+        for name, q in (('p50_ms', 0.5), ('p95_ms', 0.95), ('max_ms', 1)):
+            report[name] = round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000) if latencies else 0
+        print(f"共{report['docs']}条, 成功{report['success']}, 失败{report['failed']}, 重试{report['retries']}次, "
+              f"{report['chunks']}块, {report['docs_per_sec']} docs/sec, "
+              f"每块p50 {report['p50_ms']}ms, p95 {report['p95_ms']}ms, 最长{report['max_ms']}ms")
+        return report
+
+    def iter_chunks(self, docs, op_type, chunk_bytes):
+        """ 按字节数切块，每条是(_id, 操作行, 数据行) """
+        chunk = []
+        size = 0
+        for doc in docs:
+            doc = dict(doc)
+            _id = doc.pop('_id', None)
+            meta = {'_index': self.index_name}
+            if self.index_type:
+                meta['_type'] = self.index_type
+            if _id is not None:
+                meta['_id'] = _id
+            action_line = json.dumps({op_type: meta}, ensure_ascii=False)
+            source_line = json.dumps({'doc': doc} if op_type == 'update' else doc, ensure_ascii=False)
+            line_bytes = len(action_line.encode('utf-8')) + len(source_line.encode('utf-8')) + 2
+            if chunk and size + line_bytes > chunk_bytes:
+                yield chunk
+                chunk = []
+                size = 0
+            chunk.append((_id, action_line, source_line))
+            size += line_bytes
+        if chunk:
+            yield chunk
+
+    def send_chunk(self, chunk, max_retries):
+        """ 在线程池里执行，写一块，被拒绝(429)的文档退避后重试 """
+        result = dict(docs=len(chunk), success=0, failed=0, retries=0, errors=[])
+        backoff = self.settings.getfloat('ES_RETRY_BACKOFF')
+        start = time.time()
+        attempt = 0
+        while chunk:
+            body = ''.join(f'{action_line}\n{source_line}\n' for _id, action_line, source_line in chunk)
+            try:
+                response = self.es.bulk(body=body, request_timeout=self.long_timeout)
+            except TransportError as e:
+                # 连接出错和整个请求被拒绝(429)才重试
+                if attempt >= max_retries or not (isinstance(e, ConnectionError) or e.status_code == 429):
+                    result['failed'] += len(chunk)
+                    result['errors'].extend((_id, repr(e)) for _id, action_line, source_line in chunk)
+                    break
+                rejected = chunk
+            else:
+                rejected = []
+                for line, item in zip(chunk, response['items']):
+                    info = next(iter(item.values()))
+                    status = info.get('status', 500)
+                    if status < 300:
+                        result['success'] += 1
+                    elif status == 429 and attempt < max_retries:
+                        rejected.append(line)
+                    else:
+                        result['failed'] += 1
+                        result['errors'].append((info.get('_id'), info.get('error')))
+            if rejected:
+                result['retries'] += 1
+                time.sleep(backoff * 2 ** attempt)
+                attempt += 1
+            chunk = rejected
+        result['seconds'] = time.time() - start
+        return result
+
+    def bulk_rate(self, backfill):
+        docs, seconds = self.bulk_stats[backfill]
+        return docs / seconds if seconds else None
+
+    @contextmanager
+    def backfill(self, baseline_rate=None):
+        """
+        大批量导入: 暂停刷新(refresh_interval=-1)、副本数改成0，结束后(出错也一样)恢复原来的设置并刷新一次
+        用法:
+            with es_client.backfill():
+                es_client.add_data_bulk(rows)
+        :param baseline_rate: 正常设置下的docs/sec，不传用这个客户端之前在正常设置下bulk写入的速度
+        """
+        index_name = self.index_name
+        current = self.es.indices.get_settings(index=index_name, flat_settings=True)[index_name]['settings']
+        # 没设置过refresh_interval的恢复成null(默认1s)
+        original = {
+            'index.refresh_interval': current.get('index.refresh_interval'),
+            'index.number_of_replicas': current.get('index.number_of_replicas'),
+        }
+        baseline_rate = baseline_rate or self.bulk_rate(False)
+        self.bulk_stats[True] = [0, 0.0]
+        self.es.indices.put_settings(index=index_name, body={
+            'index.refresh_interval': '-1',
+            'index.number_of_replicas': 0,
+        })
+        print(f'{index_name}进入批量导入模式，原设置: {original}')
+        self.in_backfill = True
+        start = time.time()
+        try:
+            yield self
+        finally:
+            self.in_backfill = False
+            cost = time.time() - start
+            try:
+                self.es.indices.put_settings(index=index_name, body=original)
+            finally:
+                self.es.indices.refresh(index=index_name, request_timeout=self.long_timeout)
+            print(f'{index_name}恢复设置{original}并刷新，副本会在后台重新复制')
+            docs = self.bulk_stats[True][0]
+            rate = self.bulk_rate(True)
+            if rate:
+                message = f'批量导入{docs}条, 耗时{cost:.1f}秒, bulk写入{rate:.1f} docs/sec'
+                if baseline_rate:
+                    message += f', 正常设置下{baseline_rate:.1f} docs/sec, 提速{rate / baseline_rate:.2f}倍'
+                print(message)
 
     def get_es_id(self):
         """
@@ -106,19 +326,97 @@ class ESClient(object):
             _id = items.get("_id")
             yield _id
 
-    def scroll_search(self, query_body, scroll='10m'):
+    def scroll_search(self, query_body, scroll='10m', slices=1, includes=None, size=1000, queue_size=None):
         """
         游标遍历es库，返回的是生成器类型
-        :param query_body: 查询数据语句
+        slices大于1时用sliced scroll把查询切成slices份，每份一个线程并行遍历，通过有界队列交给调用方
+        :param query_body: 查询数据语句，from、size、aggs会去掉
+        :param slices: 并行的切片数，不超过索引的分片数效果最好
+        :param includes: 只返回这些字段，None返回全部
+        :param size: 每次scroll取多少条
+        :param queue_size: 队列最多放多少条，默认slices * size
         :return: 查询的生成器
         """
-        es_result = helpers.scan(
-            client=self.es,
-            query=query_body,
-            scroll=scroll,
-            index=self.index_name,
-        )
-        return es_result
+        query_body = {key: value for key, value in query_body.items() if key not in ('from', 'size', 'aggs')}
+        if includes:
+            query_body['_source'] = includes
+        if slices <= 1:
+            return helpers.scan(
+                client=self.es,
+                query=query_body,
+                scroll=scroll,
+                size=size,
+                index=self.index_name,
+            )
+        return self.sliced_scan(query_body, scroll, slices, size, queue_size or slices * size)
+
+    def search_after_scan(self, query_body, sort, after=None, size=1000, includes=None):
+        """
+        按sort排序用search_after逐页遍历，每条结果带sort值，记下最后一条的sort值可以从那里接着遍历
+        不占用scroll上下文，中断多久都能接着遍历
+        :param query_body: 查询数据语句，from、size、aggs、sort会去掉
+        :param sort: 排序，要能唯一确定一条数据，例如 [{"ws_pc_id.keyword": "asc"}]
+        :param after: 上次最后一条的sort值，None从头开始
+        :param includes: 只返回这些字段，None返回全部
+        :return: 查询的生成器
+        """
+        body = {key: value for key, value in query_body.items() if key not in ('from', 'size', 'aggs', 'sort')}
+        body.update(size=size, sort=sort)
+        if includes:
+            body['_source'] = includes
+        while True:
+            if after is not None:
+                body['search_after'] = after
+            result = self.es.search(index=self.index_name, body=body, request_timeout=self.long_timeout)
+            hits = result['hits']['hits']
+            if not hits:
+                return
+            for hit in hits:
+                yield hit
+            after = hits[-1]['sort']
+
+    def sliced_scan(self, query_body, scroll, slices, size, queue_size):
+        hits = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+        finished = object()
+
+        def put(value):
+            # 调用方不再读了(stop)就不再往队列里放
+            while not stop.is_set():
+                try:
+                    hits.put(value, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def scan_slice(slice_id):
+            try:
+                body = dict(query_body, slice={'id': slice_id, 'max': slices})
+                for hit in helpers.scan(client=self.es, query=body, scroll=scroll, size=size, index=self.index_name):
+                    if not put(hit):
+                        return
+                put(finished)
+            except Exception as e:
+                put(e)
+
+        workers = [threading.Thread(target=scan_slice, args=(slice_id,), daemon=True) for slice_id in range(slices)]
+        for worker in workers:
+            worker.start()
+        try:
+            running = slices
+            while running:
+                hit = hits.get()
+                if hit is finished:
+                    running -= 1
+                elif isinstance(hit, Exception):
+                    raise hit
+                else:
+                    yield hit
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join()
 
     def delete_by_id(self, _id):
         """通过住建id删除文档"""
@@ -126,7 +424,11 @@ class ESClient(object):
 
     def delete_by_query(self, query_body):
         """删除搜索的数据"""
-        self.es.delete_by_query(index=self.index_name, body=query_body)
+        self.es.delete_by_query(index=self.index_name, body=query_body, request_timeout=self.long_timeout)
+
+    def pool_metrics(self):
+        """ 连接池计数: 在用、等待的连接数等 """
+        return pool_metrics(self.es)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import math
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from twisted.internet import reactor
+
+logger = logging.getLogger(__name__)
+
+_id_filter = None
+
+
+class BloomFilter(object):
+    """
+    布隆过滤器，判断不在里面的一定不在，判断在里面的有error_rate的概率误判
+    位数组存成文件: 文件头(标识, 位数, 哈希次数, 元素数) + 位数组
+    """
+    MAGIC = b'BLM1'
+    HEADER = struct.Struct('>4sQIQ')
+
+    def __init__(self, capacity=None, error_rate=None, num_bits=None, num_hashes=None):
+        if num_bits is None:
+            num_bits = int(-capacity * math.log(error_rate) / math.log(2) ** 2)
+            num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray((num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # 双重哈希: 第i个位置 = h1 + i * h2
+        digest = hashlib.sha1(key.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:16], 'big') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        """ :return: 原来可能已经在里面返回True """
+        existed = True
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                existed = False
+                self.bits[position >> 3] |= mask
+        if not existed:
+            self.count += 1
+        return existed
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def union(self, other):
+        """ 合并同样参数的另一个过滤器 """
+        merged = int.from_bytes(self.bits, 'big') | int.from_bytes(other.bits, 'big')
+        self.bits = bytearray(merged.to_bytes(len(self.bits), 'big'))
+        self.count += other.count
+
+    def save(self, path):
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.num_bits, self.num_hashes, self.count))
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            magic, num_bits, num_hashes, count = cls.HEADER.unpack(f.read(cls.HEADER.size))
+            if magic != cls.MAGIC:
+                raise ValueError(f'不是布隆过滤器文件:{path}')
+            bloom = cls(num_bits=num_bits, num_hashes=num_hashes)
+            bloom.bits = bytearray(f.read())
+            bloom.count = count
+        return bloom
+
+
+def build_from_es(es, capacity, error_rate, slices):
+    """
+    切片scroll并行扫描索引，每个切片一个线程各自建过滤器，最后合并
+    :param es: EsObject
+    :param slices: 切片数
+    :return: BloomFilter
+    """
+    def scan_slice(slice_id):
+        bloom = BloomFilter(capacity, error_rate)
+        for _id in es.scan_ids(slice_id, slices):
+            bloom.add(_id)
+        return bloom
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=slices) as executor:
+        blooms = list(executor.map(scan_slice, range(slices)))
+    bloom = blooms[0]
+    for other in blooms[1:]:
+        bloom.union(other)
+    logger.info(f'扫描索引建布隆过滤器: {bloom.count}条, 耗时{time.time() - start:.1f}秒')
+    return bloom
+
+
+def get_id_filter(settings, es):
+    """
+    ws_pc_id布隆过滤器，同一个进程里的爬虫共用一个，本地没有就扫描索引新建，进程退出前保存
+    没开启返回None
+    """
+    global _id_filter
+    if not settings.getbool('BLOOM_ENABLED'):
+        return None
+    if _id_filter is None:
+        path = settings.get('BLOOM_PATH')
+        if os.path.exists(path) and not settings.getbool('BLOOM_REBUILD'):
+            _id_filter = BloomFilter.load(path)
+            logger.info(f'加载布隆过滤器: {_id_filter.count}条')
+        else:
+            _id_filter = build_from_es(
+                es,
+                capacity=settings.getint('BLOOM_CAPACITY'),
+                error_rate=settings.getfloat('BLOOM_ERROR_RATE'),
+                slices=settings.getint('BLOOM_SCAN_SLICES'),
+            )
+            _id_filter.save(path)
+        if _id_filter.count > settings.getint('BLOOM_CAPACITY'):
+            logger.warning('布隆过滤器元素数超过容量，误判率会升高，调大BLOOM_CAPACITY后设置BLOOM_REBUILD重建')
+        reactor.addSystemEventTrigger('before', 'shutdown', _id_filter.save, path)
+    return _id_filter
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from twisted.internet import defer, reactor, task, threads
+from twisted.python.threadpool import ThreadPool
+
+from bourse.utils.filter_fact import get_content_hash
+
+logger = logging.getLogger(__name__)
+
+# 更新已有数据时不覆盖的字段：第一次采集时间、清洗状态
+UPSERT_KEEP_FIELDS = ('cj_sj', 'sj_ztxx')
+
+
+class EsBatchWriter(object):
+    """
+    按ES_WRITE_MODE写入一批数据，阻塞执行，EsBulkWriter、loadsink、tailspool共用
+    create: op_type=create，409算已存在，可能重复的先mget确认
+    upsert: 比较数据的content_hash，已存在且内容变了的才发局部更新，内容没变的不发送
+    """
+    def __init__(self, es, mode='create', hash_cache_size=0, retries=0, retry_backoff=1.0):
+        """
+        :param es: EsObject
+        :param mode: create 已存在的不更新; upsert 内容变了的局部更新
+        :param hash_cache_size: upsert模式在内存里缓存多少个已知的content_hash，缓存里有的不用再查ES
+        :param retries: 单条返回429/5xx的重试次数，见EsObject.bulk_write
+        :param retry_backoff: 第一次重试前等多少秒，之后每次翻倍
+        """
+        self.es = es
+        self.mode = mode
+        self.hash_cache_size = hash_cache_size
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.hash_cache = OrderedDict()
+        self.hash_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, es, settings):
+        return cls(es, mode=settings.get('ES_WRITE_MODE'), hash_cache_size=settings.getint('ES_UPSERT_HASH_CACHE_SIZE'),
+                   retries=settings.getint('ES_BULK_RETRIES'), retry_backoff=settings.getfloat('ES_BULK_RETRY_BACKOFF'))
+
+    def write(self, batch):
+        """
+        :param batch: [(_id, 数据, 是否可能已存在)]，upsert模式数据要带content_hash
+        :return: {'created': [], 'duplicates': [], 'updated': [], 'unchanged': [], 'failed': [(_id, 错误)]}
+        """
+        if self.mode == 'upsert':
+            return self.write_upsert(batch)
+        return self.write_create(batch)
+
+    def write_create(self, batch):
+        maybe = [_id for _id, item, maybe_duplicate in batch if maybe_duplicate]
+        existing = self.es.exists_ids(maybe) if maybe else set()
+        docs = [(_id, item) for _id, item, maybe_duplicate in batch if _id not in existing]
+        created, duplicates, failed = self.es.bulk_create(docs, self.retries, self.retry_backoff) if docs else ([], [], [])
+        return dict(created=created, duplicates=list(existing) + duplicates, updated=[], unchanged=[], failed=failed)
+
+    def write_upsert(self, batch):
+        """ 先查已有数据的content_hash，再决定新建、局部更新还是跳过 """
+        known = {}
+        with self.hash_lock:
+            for _id, item, maybe_duplicate in batch:
+                if _id in self.hash_cache:
+                    known[_id] = self.hash_cache[_id]
+                    self.hash_cache.move_to_end(_id)
+        lookup = [_id for _id, item, maybe_duplicate in batch if maybe_duplicate and _id not in known]
+        remote = self.es.get_sources(lookup, ['content_hash']) if lookup else {}
+        # 以前写入的数据没有content_hash，读全文算一次
+        no_hash = [_id for _id, source in remote.items() if source is not None and not source.get('content_hash')]
+        full = self.es.get_sources(no_hash) if no_hash else {}
+
+        actions = []
+        kinds = {}
+        result = dict(created=[], duplicates=[], updated=[], unchanged=[], failed=[])
+        for _id, item, maybe_duplicate in batch:
+            content_hash = item['content_hash']
+            if _id in known:
+                old_hash = known[_id]
+            elif remote.get(_id) is None:
+                old_hash = None
+            else:
+                old_hash = remote[_id].get('content_hash') or get_content_hash(full[_id])
+            if old_hash is None:
+                actions.append(self.es.create_action(_id, item))
+                kinds[_id] = 'created'
+            elif old_hash != content_hash:
+                fields = {key: value for key, value in item.items() if key not in UPSERT_KEEP_FIELDS}
+                fields['xg_sj'] = int(time.time())
+                actions.append(self.es.update_action(_id, fields))
+                kinds[_id] = 'updated'
+            elif _id in full:
+                # 内容没变，只补上content_hash
+                actions.append(self.es.update_action(_id, {'content_hash': content_hash}))
+                kinds[_id] = 'unchanged'
+            else:
+                result['unchanged'].append(_id)
+        succeeded, conflicts, failed = self.es.bulk_write(actions, self.retries, self.retry_backoff) if actions else ([], [], [])
+        for _id in succeeded:
+            result[kinds[_id]].append(_id)
+        result['duplicates'].extend(conflicts)
+        result['failed'].extend(failed)
+
+        stored = set(succeeded) | set(result['unchanged'])
+        with self.hash_lock:
+            for _id, item, maybe_duplicate in batch:
+                if _id in stored:
+                    self.hash_cache[_id] = item['content_hash']
+                    self.hash_cache.move_to_end(_id)
+            while len(self.hash_cache) > self.hash_cache_size:
+                self.hash_cache.popitem(last=False)
+        return result
+
+
+class EsBulkWriter(object):
+    """
+    ES批量写入
+    数据先放在缓冲区，条数、字节数到上限或者定时器到了，整批交给后台线程用EsBatchWriter写入
+    同时在写的批次达到max_inflight时add返回还没触发的Deferred，等有批次写完再继续，ES变慢时采集跟着慢下来
+    整个请求出错的批次按指数退避重试，重试期间一直算在写，采集保持暂停；重试完还不行调用on_failed
+    单条返回429/5xx的由EsBatchWriter用同样的次数只重发这几条，重试完还不行放在结果的failed里
+    """
+    def __init__(self, es, max_docs, max_bytes, interval, max_inflight, on_written, mode='create', hash_cache_size=0,
+                 retries=0, retry_backoff=1.0, on_failed=None):
+        """
+        :param es: EsObject
+        :param max_docs: 一批最多多少条
+        :param max_bytes: 一批最多多少字节
+        :param interval: 定时写入间隔(秒)
+        :param max_inflight: 最多同时在写的批次
+        :param on_written: 每批写完在reactor线程里调用 on_written(批次, 结果, 耗时)，结果同EsBatchWriter.write
+        :param mode: 同EsBatchWriter
+        :param hash_cache_size: 同EsBatchWriter
+        :param retries: 整个请求出错(ES连不上、超时、5xx)和单条429/5xx的重试次数
+        :param retry_backoff: 第一次重试前等多少秒，之后每次翻倍，最多60秒
+        :param on_failed: 重试完还是出错时在reactor线程里调用 on_failed(批次, failure)
+        """
+        self.batch_writer = EsBatchWriter(es, mode, hash_cache_size, retries, retry_backoff)
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.max_inflight = max_inflight
+        self.on_written = on_written
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.on_failed = on_failed
+        self.buffer = []
+        self.buffer_bytes = 0
+        self.inflight = 0
+        self.pending = []
+        self.waiters = []
+        self.pool = ThreadPool(minthreads=1, maxthreads=max_inflight, name='es-bulk-writer')
+        self.pool.start()
+        self.loop = task.LoopingCall(self.flush)
+        self.loop.start(interval, now=False)
+
+    def add(self, _id, item, maybe_duplicate=True):
+        """
+        :param _id: ws_pc_id
+        :param item: 要写入的数据，upsert模式要带content_hash
+        :param maybe_duplicate: 可能已存在，写入前先mget确认
+        :return: Deferred，需要等待时在有批次写完后触发
+        """
+        self.buffer.append((_id, item, maybe_duplicate))
+        self.buffer_bytes += len(json.dumps(item, ensure_ascii=False).encode('utf-8'))
+        if len(self.buffer) >= self.max_docs or self.buffer_bytes >= self.max_bytes:
+            self.flush()
+        if self.inflight < self.max_inflight:
+            return defer.succeed(None)
+        waiter = defer.Deferred()
+        self.waiters.append(waiter)
+        return waiter
+
+    def flush(self):
+        if not self.buffer:
+            return
+        batch = self.buffer
+        self.buffer = []
+        self.buffer_bytes = 0
+        self.inflight += 1
+        dfd = threads.deferToThreadPool(reactor, self.pool, self.write, batch)
+        dfd.addCallbacks(self._written, self._write_failed, errbackArgs=(batch,))
+        dfd.addBoth(self._flushed, dfd)
+        self.pending.append(dfd)
+
+    def write(self, batch):
+        """ 在后台线程里执行，整个请求出错按指数退避重试 """
+        start = time.time()
+        delay = self.retry_backoff
+        for attempt in range(self.retries + 1):
+            try:
+                return batch, self.batch_writer.write(batch), time.time() - start
+            except Exception as e:
+                if attempt >= self.retries:
+                    raise
+                logger.warning(f'批量写入ES出错{repr(e)}，{delay}秒后第{attempt + 1}次重试')
+                time.sleep(delay)
+                delay = min(delay * 2, 60)
+
+    def _written(self, result):
+        self.on_written(*result)
+
+    def _write_failed(self, failure, batch):
+        logger.error(f'批量写入ES重试{self.retries}次后还是出错，{len(batch)}条没有写入: {repr(failure.value)}')
+        if self.on_failed is not None:
+            self.on_failed(batch, failure)
+
+    def _flushed(self, result, dfd):
+        self.inflight -= 1
+        self.pending.remove(dfd)
+        while self.waiters and self.inflight < self.max_inflight:
+            self.waiters.pop(0).callback(None)
+
+    def close(self):
+        """ 写完缓冲区和在写的批次，返回Deferred """
+        if self.loop.running:
+            self.loop.stop()
+        self.flush()
+        dfd = defer.DeferredList(list(self.pending))
+        dfd.addBoth(lambda _: self.pool.stop())
+        return dfd
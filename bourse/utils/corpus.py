@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+
+# 参与准确率统计的字段
+CORPUS_FIELDS = ('oname', 'cf_wsh', 'cf_sy', 'cf_yj', 'cf_jg')
+# 不需要保存的scrapy内部meta
+SKIP_META = {'depth', 'download_slot', 'download_latency', 'download_timeout', 'retry_times', 'is_first'}
+
+
+def case_name(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+
+
+def save_case(corpus_dir, spider_name, response, items):
+    """
+    保存一个详情页样本：<爬虫>/<回调>/<url的hash>.json + 同名.body
+    期望字段取当时解析出来的结果，入库前要人工核对
+    :param corpus_dir: 样本目录
+    :param spider_name: 爬虫名称
+    :param response: 详情页响应
+    :param items: 回调产出的item
+    :return: 样本json路径
+    """
+    callback = response.request.callback.__name__
+    path = os.path.join(corpus_dir, spider_name, callback)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    meta = {}
+    for key, value in response.meta.items():
+        if key in SKIP_META:
+            continue
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            continue
+        meta[key] = value
+    name = case_name(response.url)
+    case = dict(
+        spider=spider_name,
+        callback=callback,
+        url=response.url,
+        content_type=response.headers.get('Content-Type', b'').decode('latin-1'),
+        meta=meta,
+        expected=[{field: item.get(field, '') for field in CORPUS_FIELDS} for item in items],
+    )
+    with open(os.path.join(path, name + '.body'), 'wb') as f:
+        f.write(response.body)
+    case_path = os.path.join(path, name + '.json')
+    with open(case_path, 'w', encoding='utf-8') as f:
+        json.dump(case, f, ensure_ascii=False, indent=2)
+    return case_path
+
+
+def load_cases(corpus_dir, spider_name=None, callback=None):
+    """
+    读取样本
+    :return: [(样本名, 样本信息, 响应内容)]
+    """
+    cases = []
+    for parents, dirnames, filenames in os.walk(corpus_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.endswith('.json'):
+                continue
+            with open(os.path.join(parents, filename), encoding='utf-8') as f:
+                case = json.load(f)
+            if spider_name and case['spider'] != spider_name:
+                continue
+            if callback and case['callback'] != callback:
+                continue
+            with open(os.path.join(parents, filename[:-5] + '.body'), 'rb') as f:
+                body = f.read()
+            name = os.path.relpath(os.path.join(parents, filename[:-5]), corpus_dir)
+            cases.append((name, case, body))
+    return cases
@@ -1,13 +1,21 @@
 # -*- coding: utf-8 -*-
-from elasticsearch import Elasticsearch
+import logging
+import time
+
+from elasticsearch import helpers
+
+from bourse.utils.es_pool import get_es_client
+
+logger = logging.getLogger(__name__)
 
 
 class EsObject:
 
-    def __init__(self, index_name, index_type, host, port):
+    def __init__(self, index_name, index_type, host, port, settings=None):
         self.index_name = index_name
         self.index_type = index_type
-        self.es = Elasticsearch([{'host': host, 'port': port}], timeout=3600)
+        # 同一个地址的EsObject共用一个客户端和连接池
+        self.es = get_es_client(f'{host}:{port}', settings)
 
     def insert_data(self, item, _id):
         result = self.es.create(index=self.index_name, doc_type=self.index_type, id=_id, body=item)
@@ -20,4 +28,81 @@ class EsObject:
 
     def get_data_by_id(self, _id):
         result = self.es.get(index=self.index_name, doc_type=self.index_type, id=_id, ignore=[404])
-        return result
\ No newline at end of file
+        return result
+
+    def scan_ids(self, slice_id=0, slices=1, size=5000):
+        """
+        遍历索引里的全部_id，slices大于1时只遍历第slice_id个切片
+        """
+        query = {'_source': False, 'query': {'match_all': {}}}
+        if slices > 1:
+            query['slice'] = {'id': slice_id, 'max': slices}
+        for hit in helpers.scan(self.es, query=query, index=self.index_name, doc_type=self.index_type, size=size):
+            yield hit['_id']
+
+    def exists_ids(self, ids):
+        """ mget批量查询，返回已存在的_id """
+        result = self.es.mget(index=self.index_name, doc_type=self.index_type, body={'ids': ids}, _source=False)
+        return {doc['_id'] for doc in result['docs'] if doc.get('found')}
+
+    def get_sources(self, ids, includes=None):
+        """
+        mget批量读取
+        :param includes: 只返回这些字段，None返回全部
+        :return: {_id: _source}，不存在的是None
+        """
+        body = {'docs': [{'_id': _id, '_source': includes or True} for _id in ids]}
+        result = self.es.mget(index=self.index_name, doc_type=self.index_type, body=body)
+        return {doc['_id']: doc.get('_source', {}) if doc.get('found') else None for doc in result['docs']}
+
+    def bulk_write(self, actions, retries=0, retry_backoff=1.0):
+        """
+        bulk批量执行create/update等操作
+        整个请求出错(连不上、超时、5xx)直接抛出异常，由调用方重试，不当成每条都失败
+        单条返回429或5xx的按指数退避只重发这几条，重试完还不行算失败
+        :param actions: bulk操作列表
+        :param retries: 单条429/5xx的重试次数
+        :param retry_backoff: 第一次重试前等多少秒，之后每次翻倍，最多60秒
+        :return: (成功的_id列表, 冲突(409)的_id列表, 失败的[(_id, 错误)])
+        """
+        succeeded, conflicts, failed = [], [], []
+        delay = retry_backoff
+        for attempt in range(retries + 1):
+            by_id = {action['_id']: action for action in actions}
+            retry = []
+            for ok, result in helpers.streaming_bulk(
+                    self.es, actions, chunk_size=max(len(actions), 1), raise_on_error=False, raise_on_exception=True):
+                op_type, info = result.popitem()
+                status = info.get('status') or 0
+                if ok:
+                    succeeded.append(info['_id'])
+                elif status == 409:
+                    conflicts.append(info['_id'])
+                elif attempt < retries and (status == 429 or status >= 500):
+                    retry.append(by_id[info['_id']])
+                else:
+                    failed.append((info['_id'], info.get('error')))
+            if not retry:
+                break
+            logger.warning(f'批量写入有{len(retry)}条返回429/5xx，{delay}秒后第{attempt + 1}次重发')
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+            actions = retry
+        return succeeded, conflicts, failed
+
+    def create_action(self, _id, item):
+        return {'_op_type': 'create', '_index': self.index_name, '_type': self.index_type, '_id': _id, '_source': item}
+
+    def update_action(self, _id, fields):
+        """ 局部更新，只覆盖fields里的字段 """
+        return {'_op_type': 'update', '_index': self.index_name, '_type': self.index_type, '_id': _id, 'doc': fields}
+
+    def bulk_create(self, docs, retries=0, retry_backoff=1.0):
+        """
+        bulk批量写入，op_type=create，已存在的返回409
+        :param docs: [(_id, 数据)]
+        :param retries: 同bulk_write
+        :param retry_backoff: 同bulk_write
+        :return: (写入成功的_id列表, 已存在的_id列表, 失败的[(_id, 错误)])
+        """
+        return self.bulk_write([self.create_action(_id, item) for _id, item in docs], retries, retry_backoff)
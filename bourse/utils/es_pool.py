@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+
+from elasticsearch import Elasticsearch, TransportError, Urllib3HttpConnection
+from scrapy.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+# 同一个进程里按地址共用客户端: {(地址, 用户名): Elasticsearch}
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class PoolMetrics(object):
+    """ 连接池计数，同一个客户端的所有连接共用 """
+    def __init__(self, size):
+        self.size = size
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.in_use = 0
+        self.waiting = 0
+        self.max_in_use = 0
+        self.max_waiting = 0
+        self.requests = 0
+        self.retries_429 = 0
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'size': self.size,
+                'in_use': self.in_use,
+                'waiting': self.waiting,
+                'max_in_use': self.max_in_use,
+                'max_waiting': self.max_waiting,
+                'requests': self.requests,
+                'retries_429': self.retries_429,
+            }
+
+
+class PooledConnection(Urllib3HttpConnection):
+    """
+    同时在用的连接不超过连接池大小，超过的请求排队等待，不再新建用完就丢的连接
+    ES返回429(队列满)时退避重试
+    """
+    def __init__(self, metrics=None, retry_429=3, retry_backoff=1.0, **kwargs):
+        super(PooledConnection, self).__init__(**kwargs)
+        self.metrics = metrics
+        self.retry_429 = retry_429
+        self.retry_backoff = retry_backoff
+
+    def perform_request(self, *args, **kwargs):
+        metrics = self.metrics
+        with metrics.lock:
+            metrics.waiting += 1
+            metrics.max_waiting = max(metrics.max_waiting, metrics.waiting)
+        metrics.slots.acquire()
+        with metrics.lock:
+            metrics.waiting -= 1
+            metrics.in_use += 1
+            metrics.max_in_use = max(metrics.max_in_use, metrics.in_use)
+            metrics.requests += 1
+        try:
+            attempt = 0
+            while True:
+                try:
+                    return super(PooledConnection, self).perform_request(*args, **kwargs)
+                except TransportError as e:
+                    if e.status_code != 429 or attempt >= self.retry_429:
+                        raise
+                    attempt += 1
+                    with metrics.lock:
+                        metrics.retries_429 += 1
+                    delay = self.retry_backoff * 2 ** (attempt - 1)
+                    logger.warning(f'ES返回429，{delay}秒后第{attempt}次重试')
+                    time.sleep(delay)
+        finally:
+            with metrics.lock:
+                metrics.in_use -= 1
+            metrics.slots.release()
+
+
+def project_settings():
+    """ 工具脚本不经过scrapy命令启动，直接读项目配置 """
+    settings = Settings()
+    settings.setmodule('bourse.settings', priority='project')
+    return settings
+
+
+def get_es_client(hosts=None, settings=None):
+    """
+    进程内共用的ES客户端，爬虫、crawlall、清洗工具都从这里拿
+    :param hosts: 地址，'host:port'或者它们的列表，不传用ES_HOST和ES_PORT
+    :param settings: scrapy Settings，不传读项目配置
+    :return: Elasticsearch
+    """
+    if settings is None:
+        settings = project_settings()
+    if hosts is None:
+        hosts = [f"{settings.get('ES_HOST')}:{settings.getint('ES_PORT')}"]
+    elif isinstance(hosts, str):
+        hosts = [hosts]
+    username = settings.get('ES_USERNAME')
+    key = (tuple(hosts), username)
+    with _clients_lock:
+        if key not in _clients:
+            size = settings.getint('ES_POOL_MAXSIZE')
+            kwargs = {}
+            if username:
+                kwargs['http_auth'] = (username, settings.get('ES_PASSWORD'))
+            _clients[key] = Elasticsearch(
+                hosts,
+                connection_class=PooledConnection,
+                metrics=PoolMetrics(size),
+                maxsize=size,
+                timeout=settings.getfloat('ES_TIMEOUT'),
+                retry_429=settings.getint('ES_RETRY_429'),
+                retry_backoff=settings.getfloat('ES_RETRY_BACKOFF'),
+                max_retries=settings.getint('ES_MAX_RETRIES'),
+                retry_on_timeout=True,
+                sniff_on_start=False,
+                sniff_on_connection_fail=False,
+                sniffer_timeout=None,
+                **kwargs
+            )
+        return _clients[key]
+
+
+def pool_metrics(es):
+    """ 客户端连接池的计数 """
+    connection = es.transport.connection_pool.connections[0]
+    return connection.metrics.snapshot()
+
+
+def all_pool_metrics():
+    """ {地址: 计数} """
+    with _clients_lock:
+        clients = dict(_clients)
+    return {','.join(hosts): pool_metrics(es) for (hosts, username), es in clients.items()}
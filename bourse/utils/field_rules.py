@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+import re
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+# 前缀组合超过这个数量就不再往后展开，用已经拿到的短前缀
+MAX_ANCHORS = 64
+
+
+def _leading_literals(items):
+    """
+    求正则开头的固定文字，匹配结果一定以其中一个开头
+    :param items: sre_parse解析出来的序列
+    :return: (还能继续往后拼的前缀列表, 已经结束的前缀列表)
+    """
+    opened = ['']
+    closed = []
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            opened = [prefix + chr(av) for prefix in opened]
+            continue
+        if op is sre_constants.SUBPATTERN:
+            sub_opened, sub_closed = _leading_literals(av[-1])
+        elif op is sre_constants.BRANCH:
+            sub_opened, sub_closed = [], []
+            for branch in av[1]:
+                branch_opened, branch_closed = _leading_literals(branch)
+                sub_opened.extend(branch_opened)
+                sub_closed.extend(branch_closed)
+        else:
+            break
+        if len(opened) * (len(sub_opened) + len(sub_closed)) > MAX_ANCHORS:
+            break
+        closed.extend(prefix + suffix for prefix in opened for suffix in sub_closed)
+        opened = [prefix + suffix for prefix in opened for suffix in sub_opened]
+        if not opened:
+            return opened, closed
+    closed.extend(opened)
+    return [], closed
+
+
+def get_anchors(pattern):
+    """ 正则开头的固定文字(锚点)，开头不固定的返回None """
+    if pattern.flags & re.IGNORECASE:
+        return None
+    opened, closed = _leading_literals(sre_parse.parse(pattern.pattern))
+    anchors = set(opened + closed)
+    if not anchors or '' in anchors:
+        return None
+    return tuple(sorted(anchors))
+
+
+class FieldRule(object):
+    """
+    单个字段的提取规则
+    :param pattern: 正则
+    :param group: 取第几个分组
+    :param required: 是否参与PDF提前结束的判断
+    """
+    def __init__(self, pattern, group=1, required=True):
+        self.pattern = re.compile(pattern)
+        self.group = group
+        self.required = required
+        self.anchors = get_anchors(self.pattern)
+
+
+class RuleSet(object):
+    """
+    一个数据来源的全部字段规则，导入时编译好
+    extract一次扫描找出所有字段的锚点位置(经查明、违反了、本所决定...)，
+    只在锚点处尝试匹配，结果跟每个字段分别search一致
+    """
+    def __init__(self, **rules):
+        self.rules = rules
+        self.anchored = [(name, rule) for name, rule in rules.items() if rule.anchors]
+        self.unanchored = [(name, rule) for name, rule in rules.items() if not rule.anchors]
+        anchors = sorted({anchor for name, rule in self.anchored for anchor in rule.anchors}, key=len, reverse=True)
+        self.scanner = re.compile('|'.join(re.escape(anchor) for anchor in anchors)) if anchors else None
+
+    @property
+    def required(self):
+        """ PDF提前结束用的正则 """
+        return [rule.pattern for rule in self.rules.values() if rule.required]
+
+    def extract(self, text):
+        """
+        :param text: 去掉空白的全文
+        :return: {字段名: 匹配内容}，没匹配到的是空字符串
+        """
+        result = dict.fromkeys(self.rules, '')
+        pending = list(self.anchored)
+        pos = 0
+        while pending:
+            anchor = self.scanner.search(text, pos)
+            if anchor is None:
+                break
+            start = anchor.start()
+            for field in pending[:]:
+                name, rule = field
+                if not text.startswith(rule.anchors, start):
+                    continue
+                match = rule.pattern.match(text, start)
+                if match:
+                    result[name] = match.group(rule.group)
+                    pending.remove(field)
+            # 锚点之间可能重叠，从下一个字符接着找
+            pos = start + 1
+        for name, rule in self.unanchored:
+            match = rule.pattern.search(text)
+            if match:
+                result[name] = match.group(rule.group)
+        return result
+
+
+# 深交所-问询函件字段规则
+SZSE_WXH_RULES = RuleSet(
+    oname=FieldRule(r'(关于对)(.*?(公司|给予))', 2),
+    cf_wsh=FieldRule(r'(监管函公司部|监管函|关注函|问询函|补充材料有关事项的函)(.*?号)', 2),
+    cf_sy=FieldRule(r'(存在以下问题：|违规事实：|存在以下违规行为：|董事会：)(.*?。)', 2),
+    cf_yj=FieldRule(r'((违反了本所|依据本所|严格遵守|按照国家法律).*?规定)'),
+    cf_jg=FieldRule(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：|请你公司说明|请你公司).*?。)'),
+)
+
+# 深交所-上市公司诚信档案字段规则
+SZSE_CXDA_RULES = RuleSet(
+    cf_wsh=FieldRule(r'(监管函公司部|监管函|关注函|问询函|补充材料有关事项的函)(.*?号)', 2),
+    cf_sy=FieldRule(r'(存在以下问题：|违规事实：|存在以下违规行为：|董事会：|存在以下违规事实：)(.*?。)', 2),
+    cf_yj=FieldRule(r'((违反了本所|依据本所|严格遵守|按照国家法律).*?规定)'),
+    cf_jg=FieldRule(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：).*?。)'),
+)
+
+# 全国中小企业股份转让系统-监管公开信息字段规则，三个栏目共用
+NEEQ_RULES = RuleSet(
+    cf_wsh=FieldRule(r'(问询函)(半年报问询函.*?号)', 2),
+    cf_wsh_second=FieldRule(r'(文件)(股转系统发.*?号)', 2, required=False),
+    cf_sy=FieldRule(r'((有以下违规事实：|关注到以下情况：|经查明|经审阅|请你公司补充披露以下事项：|以下违规事实：).*?。)'),
+    cf_yj=FieldRule(r'((公司上述行为违反了|你的上述行为违反了|根据|依据).*?规定)'),
+    cf_jg=FieldRule(r'((我司作出如下纪律处分决定：|做出如下纪律处分决定：|请就上述问题做出书面说明|收到本问询函后|做出如下决定：|特此提出警示如下：|我司作出如下决定：).*?。)'),
+)
+
+# 全国中小企业股份转让系统-word文件字段规则
+NEEQ_WORD_RULES = RuleSet(
+    cf_wsh=FieldRule(r'(问询函)(半年报问询函.*?号)', 2),
+    cf_sy=FieldRule(r'((关注到以下情况：|经查明|经审阅|请你公司补充披露以下事项：).*?。)'),
+    cf_yj=FieldRule(r'((公司上述行为违反了|你的上述行为违反了|根据|依据).*?规定)'),
+    cf_jg=FieldRule(r'((做出如下纪律处分决定：|请就上述问题做出书面说明|收到本问询函后).*?。)'),
+)
+
+# 字段规则，按数据来源bz和文件格式取；下载管道里的word文件按交易所取
+FIELD_RULES = {
+    '深圳证券交易所-监管信息公开-监管措施': dict(
+        pdf=RuleSet(
+            oname=FieldRule(r'(关于对)(.*?(公司|的))', 2),
+            cf_wsh=FieldRule(r'(监管函公司部|监管函|关注函|问询函)(.*?号)', 2),
+            cf_sy=FieldRule(r'：(.*?(?:违反了|你的上述行为违反了|你公司的上述行为违反了))'),
+            cf_yj=FieldRule(r'((?:违反了|你的上述行为违反了).*?规定)'),
+            cf_jg=FieldRule(r'(现对你.*?。)'),
+        ),
+    ),
+    '深圳证券交易所-监管信息公开-纪律处分': dict(
+        pdf=RuleSet(
+            oname=FieldRule(r'(关于对)(.*?(公司|给予))', 2),
+            cf_sy=FieldRule(r'(存在以下问题：|违规事实：|存在以下违规行为：)(.*?。)', 2),
+            cf_yj=FieldRule(r'((违反了本所|依据本所).*?规定)'),
+            cf_jg=FieldRule(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：).*?。)'),
+        ),
+    ),
+    '深圳证券交易所-监管信息公开-问询函件-主板': dict(
+        pdf=RuleSet(
+            oname=FieldRule(r'(关于对)(.*?(公司|给予))', 2),
+            cf_wsh=FieldRule(r'(监管函公司部|监管函|关注函|问询函|补充材料有关事项的函)(.*?号)', 2),
+            cf_sy=FieldRule(r'(存在以下问题：|违规事实：|存在以下违规行为：|董事会：)(.*?。)', 2),
+            cf_yj=FieldRule(r'((违反了本所|依据本所|严格遵守).*?规定)'),
+            cf_jg=FieldRule(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：|请你公司说明).*?。)'),
+        ),
+    ),
+    '深圳证券交易所-监管信息公开-问询函件-中小企业板': dict(pdf=SZSE_WXH_RULES),
+    '深圳证券交易所-监管信息公开-问询函件-创业板': dict(pdf=SZSE_WXH_RULES),
+    '深圳证券交易所-上市公司信息-上市公司诚信档案-处罚与纪律处分记录': dict(pdf=SZSE_CXDA_RULES),
+    '深圳证券交易所-上市公司信息-上市公司诚信档案-中介机构处罚与处分信息': dict(pdf=SZSE_CXDA_RULES),
+    '深圳证券交易所-债券信息-问询函': dict(
+        pdf=RuleSet(
+            cf_sy=FieldRule(r'(存在以下问题：|违规事实：|存在以下违规行为：|董事会：|存在以下违规事实：|存在以下不规范事项：|存在以下信息披露不规范事项：|存在以下事项：)(.*?。)', 2),
+            cf_yj=FieldRule(r'((违反了本所|依据本所|严格遵守|按照国家法律|不规范的行为违反了).*?规定)'),
+            cf_jg=FieldRule(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：|请你公司高度重视信息披露义务|提醒你公司严格遵守).*?。)'),
+        ),
+    ),
+    '深圳证券交易所-债券信息-监管措施': dict(
+        pdf=RuleSet(
+            cf_sy=FieldRule(r'(存在以下问题：|违规事实：|存在以下违规行为：|董事会：|存在以下违规事实：|存在以下不规范事项：|存在以下信息披露不规范事项：|存在以下事项：)(.*?。)', 2),
+            cf_yj=FieldRule(r'((违反了本所|依据本所|严格遵守|按照国家法律|不规范的行为违反了|请说明是否按照).*?规定)'),
+            cf_jg=FieldRule(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：|请你公司高度重视信息披露义务|提醒你公司严格遵守).*?。)'),
+        ),
+    ),
+    '深圳证券交易所': dict(
+        doc=RuleSet(
+            oname=FieldRule(r'(关于对)(.*?公司)', 2),
+            cf_sy=FieldRule(r'(存在以下问题：|违规事实：|存在以下违规行为：|存在以下违规事实：)(.*?。)', 2),
+            cf_yj=FieldRule(r'((违反了本所|依据本所|根据).*?规定)'),
+            cf_jg=FieldRule(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：).*?。)'),
+        ),
+        docx=RuleSet(
+            oname=FieldRule(r'(关于对)(.*?公司)', 2),
+            cf_sy=FieldRule(r'(存在以下问题：|违规事实：|存在以下违规行为：|董事会 ：|存在以下违规事实：)(.*?。)', 2),
+            cf_yj=FieldRule(r'((违反了本所|依据本所|根据|是否符合).*?规定)'),
+            cf_jg=FieldRule(r'((本所决定|本所作出如下处分：|本所作出如下处分决定：|请你公司).*?。)'),
+        ),
+    ),
+    '上海证券交易所-监管信息公开-公司监管-监管措施': dict(
+        pdf=RuleSet(
+            oname=FieldRule(r'(当事人：)(.*?)(，)', 2),
+            cf_wsh=FieldRule(r'(.*?号)(关于|关于对)'),
+            cf_sy=FieldRule(r'((?:存在以下违规事项：|你的上述行为违反了|经查明).*?。)'),
+            cf_yj=FieldRule(r'((公司上述行为违反了|你的上述行为违反了|根据).*?规定)'),
+            cf_jg=FieldRule(r'((做出如下纪律处分决定：|公司应当|做出如下监管措施决定：).*?。)'),
+        ),
+        html=RuleSet(
+            cf_sy=FieldRule(r'(经查明.*?。)'),
+            cf_yj=FieldRule(r'((上述行为违反了|违反了|根据).*?(有关|的)规定)'),
+            cf_jg=FieldRule(r'((公司应当|公司应|希望公司).*?。)'),
+        ),
+    ),
+    '上海证券交易所-监管信息公开-公司监管-监管问询': dict(
+        pdf=RuleSet(
+            cf_wsh=FieldRule(r'(上海证券交易所)(.*?号)(关于)', 2),
+            cf_sy=FieldRule(r'((?:存在以下违规事项：|你的上述行为违反了|经查明|经审阅).*?。)'),
+            cf_yj=FieldRule(r'((公司上述行为违反了|你的上述行为违反了|根据|依据).*?规定)'),
+            cf_jg=FieldRule(r'((做出如下纪律处分决定：|公司应当|做出如下监管措施决定：|请你公司).*?。)'),
+        ),
+    ),
+    '上海证券交易所-会员及其他交易参与人监管-纪律处分': dict(
+        pdf=RuleSet(
+            cf_wsh=FieldRule(r'纪律处分决定书(.*?号)'),
+            cf_sy=FieldRule(r'(根据中国证监会.*?。)'),
+            cf_yj=FieldRule(r'((违反了|依据).*?规定)'),
+            cf_jg=FieldRule(r'((做出如下纪律处分决定：|公司应当|做出如下监管措施决定：|请你公司).*?。)'),
+        ),
+    ),
+    '上海证券交易所-债券监管-债券监管措施': dict(
+        html=RuleSet(
+            cf_sy=FieldRule(r'((经查明|存在以下违规事项：).*?。)'),
+            cf_yj=FieldRule(r'((违反了|根据).*?规定)'),
+            cf_jg=FieldRule(r'((鉴于上述行为|鉴于你公司上述行为|本所将根据行为性质及情节).*?。)'),
+        ),
+    ),
+    '上海证券交易所-债券监管-债券纪律处分': dict(
+        html=RuleSet(
+            cf_wsh=FieldRule(r'(?:纪律处分决定书)?(纪律处分决定书.*?号)'),
+            cf_sy=FieldRule(r'(存在以下违规事实：|经查明.*?。)'),
+            cf_yj=FieldRule(r'((根据|依据).*?规定)'),
+            cf_jg=FieldRule(r'(做出如下纪律处分决定：.*?。)'),
+        ),
+    ),
+    '上海证券交易所-交易监管-纪律处分': dict(
+        html=RuleSet(
+            cf_sy=FieldRule(r'(经查明|经审核|经查.*?。)'),
+            cf_yj=FieldRule(r'((根据|依据).*?规定)'),
+            cf_jg=FieldRule(r'((做出如下纪律处分决定：|本所决定).*?。)'),
+        ),
+    ),
+    '上海证券交易所': dict(
+        doc=RuleSet(
+            cf_sy=FieldRule(r'(经查明|经审核|经查.*?。)'),
+            oname_one=FieldRule(r'(关于对|当事人：|关于)(.*?)(名下证券账户)', 2),
+            oname_two=FieldRule(r'(关于对|当事人：|关于)(.*?公司)', 2),
+            cf_yj=FieldRule(r'(根据.*?规定)'),
+            cf_jg=FieldRule(r'((做出如下纪律处分决定：|本所决定|决定对).*?。)'),
+        ),
+    ),
+    '全国中小企业股份转让系统-监管公开信息-问询函': dict(pdf=NEEQ_RULES),
+    '全国中小企业股份转让系统-监管公开信息-自律监管措施': dict(pdf=NEEQ_RULES),
+    '全国中小企业股份转让系统-监管公开信息-纪律处分': dict(pdf=NEEQ_RULES),
+    '全国中小企业股份转让系统': dict(doc=NEEQ_WORD_RULES, docx=NEEQ_WORD_RULES),
+}
+
+
+def get_field_rules(source, fmt='pdf'):
+    """
+    :param source: 数据来源bz，word文件用交易所名称
+    :param fmt: pdf/html/doc/docx
+    :return: RuleSet
+    """
+    return FIELD_RULES[source][fmt]
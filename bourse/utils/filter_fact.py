@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import hashlib
-import re
+import json
+
+from bourse.utils.normalize import normalize_cf_wsh, normalize_other
 
 
 def get_md5_value(_str):
@@ -13,22 +15,22 @@ def get_md5_value(_str):
         return None
 
 
+# 不参与内容哈希的字段：采集时间、状态标记、解析引擎等每次采集都可能变的
+CONTENT_HASH_IGNORE = ('cj_sj', 'xg_sj', 'sj_ztxx', 'sj_type', 'pdf_engine', 'content_hash')
+
+
+def get_content_hash(item, ignore=CONTENT_HASH_IGNORE):
+    """ 数据内容的md5，重新采集的数据内容变了才需要更新 """
+    content = {key: value for key, value in item.items() if key not in ignore}
+    return get_md5_value(json.dumps(content, ensure_ascii=False, sort_keys=True, default=str))
+
+
 def deal_with_cf_wsh(cf_wsh):
-    if cf_wsh:
-        cf_wsh = re.sub(r'\r|\?|\n|\t| |　', '', cf_wsh)
-        cf_wsh = re.sub(r'〔|\[|【|（|﹝|{　', '(', cf_wsh)
-        cf_wsh = re.sub(r'〕|]|】|）|﹞|}', ')', cf_wsh)
-        return cf_wsh
-    else:
-        return ""
+    return normalize_cf_wsh(cf_wsh)
 
 
 def deal_with_other(_str):
-    if _str:
-        _str = re.sub(r'\r|\?|\n|\t| |　', '', str(_str))
-        return _str
-    else:
-        return ""
+    return normalize_other(_str)
 
 
 def cf_15_filter(item):
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+import sqlite3
+from collections import OrderedDict
+
+from w3lib.url import canonicalize_url
+
+logger = logging.getLogger(__name__)
+
+
+def url_fingerprint(url):
+    return hashlib.sha1(canonicalize_url(url).encode('utf-8')).hexdigest()
+
+
+class FingerprintStore(object):
+    """
+    已入库详情链接的指纹，用sqlite存在本地，前面挡一层LRU
+    查过的指纹(有或没有)都放进LRU，同一个链接再查不用访问sqlite
+    """
+    # 每写入多少条提交一次
+    COMMIT_EVERY = 100
+
+    def __init__(self, path, cache_size):
+        self.path = path
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS fingerprint (key TEXT PRIMARY KEY) WITHOUT ROWID')
+        self.conn.commit()
+        self.uncommitted = 0
+
+    def _remember(self, key, value):
+        self.cache[key] = value
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def __contains__(self, url):
+        key = url_fingerprint(url)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        found = self.conn.execute('SELECT 1 FROM fingerprint WHERE key = ?', (key,)).fetchone() is not None
+        self._remember(key, found)
+        return found
+
+    def add(self, url):
+        """ :return: 新加的返回True """
+        key = url_fingerprint(url)
+        if self.cache.get(key):
+            return False
+        self.conn.execute('INSERT OR IGNORE INTO fingerprint (key) VALUES (?)', (key,))
+        self._remember(key, True)
+        self.uncommitted += 1
+        if self.uncommitted >= self.COMMIT_EVERY:
+            self.conn.commit()
+            self.uncommitted = 0
+        return True
+
+    def clear(self):
+        self.conn.execute('DELETE FROM fingerprint')
+        self.conn.commit()
+        self.cache.clear()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM fingerprint').fetchone()[0]
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import re
+import sys
+import time
+from functools import reduce
+
+# 跟filter_fact原来的三次re.sub一致：去掉\r ? \n \t 半角空格 全角空格，各种括号统一成半角
+OTHER_TABLE = dict.fromkeys(map(ord, '\r?\n\t 　'))
+CF_WSH_TABLE = {
+    **OTHER_TABLE,
+    **dict.fromkeys(map(ord, '〔[【（﹝'), '('),
+    **dict.fromkeys(map(ord, '〕]】）﹞}'), ')'),
+}
+
+
+def strip_whitespace(text):
+    """
+    去掉空白字符，跟正则 \\r|\\n|\\t|\\s 一致
+    str.split()按同样的空白字符切分，比translate和re.sub都快
+    """
+    return ''.join(text.split())
+
+
+def join_text(fragments):
+    """
+    文本框/段落列表拼成去掉空白的全文，先整体join再去空白
+    :param fragments: 字符串列表，可以是生成器
+    :return: 全文，列表为空返回空字符串
+    """
+    return strip_whitespace(''.join(fragments))
+
+
+def normalize_cf_wsh(cf_wsh):
+    """ 文书号：去掉空白和问号，括号统一成半角 """
+    if cf_wsh:
+        return cf_wsh.translate(CF_WSH_TABLE)
+    return ''
+
+
+def normalize_other(_str):
+    """ 其他字段：去掉空白和问号 """
+    if _str:
+        return str(_str).translate(OTHER_TABLE)
+    return ''
+
+
+def benchmark(number=200):
+    """ 跟原来reduce+正则的写法对比耗时 """
+    re_com = re.compile(r'\r|\n|\t|\s')
+    fragments = ['经查明，你公司 存在以下违规行为：\n', '未及时披露\t重大事项。 ', '深证上〔2019〕第 123 号\r\n'] * 300
+    values = ['深证上〔2019〕 第123号？', '【2020】 ?12号', '某某 股份有限公司\t'] * 1000
+
+    def old_deal_with_cf_wsh(cf_wsh):
+        cf_wsh = re.sub(r'\r|\?|\n|\t| |　', '', cf_wsh)
+        cf_wsh = re.sub(r'〔|\[|【|（|﹝|{　', '(', cf_wsh)
+        cf_wsh = re.sub(r'〕|]|】|）|﹞|}', ')', cf_wsh)
+        return cf_wsh
+
+    cases = [
+        ('拼接全文', lambda: reduce(lambda x, y: x + y, [re_com.sub('', i) for i in fragments]),
+         lambda: join_text(fragments)),
+        ('文书号', lambda: [old_deal_with_cf_wsh(i) for i in values],
+         lambda: [normalize_cf_wsh(i) for i in values]),
+    ]
+    for name, old, new in cases:
+        assert old() == new(), name
+        start = time.perf_counter()
+        for _ in range(number):
+            old()
+        old_cost = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(number):
+            new()
+        new_cost = time.perf_counter() - start
+        print(f'{name}: 原来{old_cost / number * 1000:.3f}ms, 现在{new_cost / number * 1000:.3f}ms, {old_cost / new_cost:.1f}倍')
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import datetime
+
+import scrapy
+from scrapy import signals
+
+from bourse.utils.watermark import IncrementalSpiderMixin
+
+logger = logging.getLogger(__name__)
+
+
+class PaginationSpiderMixin(IncrementalSpiderMixin):
+    """
+    爬虫混入类，列表翻页
+    全量采集时每个栏目最多同时请求PAGINATION_WINDOW个列表页，一页处理完再请求下一页，
+    不再第一页就把几千个翻页请求塞进调度器，PDF详情请求也不会被列表请求挤在后面
+    有高水位的栏目按增量采集一页一页翻
+    列表回调没有数据提前返回、没走到paginate的，由PaginationMiddleware调用finish_page补一页
+    """
+    # 列表页请求的优先级，详情页是7
+    page_priority = 3
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(PaginationSpiderMixin, cls).from_crawler(crawler, *args, **kwargs)
+        spider.page_window = crawler.settings.getint('PAGINATION_WINDOW')
+        spider.page_states = {}
+        crawler.signals.connect(spider.page_callback_error, signal=signals.spider_error)
+        crawler.signals.connect(spider.first_item_scraped, signal=signals.item_scraped)
+        return spider
+
+    def paginate(self, response, catalog, page_count, url, callback, fresh=None, formdata=None):
+        """
+        列表翻页，在列表解析回调的最后调用
+        :param response: 当前列表页
+        :param catalog: 栏目
+        :param page_count: 总页数
+        :param url: 列表地址，GET请求是带{}的页码模板
+        :param callback: 列表解析回调
+        :param fresh: 当前页没采集过的记录数，没有记录高水位的栏目不传
+        :param formdata: POST表单，页码放在表单的page字段
+        :return: 翻页请求
+        """
+        response.meta['paginated'] = catalog
+        state = self.page_states.setdefault(catalog, {'next': 2})
+        state.update(count=page_count, url=url, callback=callback, formdata=formdata)
+        incremental = fresh is not None and self.watermarks is not None and self.watermarks.has_mark(catalog)
+        if incremental or not self.page_window:
+            pages = self.next_pages(response, catalog, page_count, fresh)
+        else:
+            # 第一页补满窗口，之后每处理完一页补一页
+            pages = self.take_pages(catalog, self.page_window if response.meta.get('is_first', True) else 1)
+        for page in pages:
+            yield self.page_request(catalog, page)
+
+    def take_pages(self, catalog, count):
+        state = self.page_states[catalog]
+        pages = []
+        while len(pages) < count and state['next'] <= state['count']:
+            pages.append(state['next'])
+            state['next'] += 1
+        return pages
+
+    def page_request(self, catalog, page):
+        state = self.page_states[catalog]
+        meta = {'is_first': False, 'page': page, 'catalog': catalog}
+        self.crawler.stats.inc_value('pagination/requests')
+        if state['formdata'] is not None:
+            meta['form_data'] = state['formdata']
+            return scrapy.FormRequest(
+                url=state['url'],
+                formdata={**state['formdata'], 'page': str(page)},
+                callback=state['callback'],
+                errback=self.page_failed,
+                meta=meta,
+                priority=self.page_priority,
+            )
+        return scrapy.Request(
+            url=state['url'].format(page),
+            callback=state['callback'],
+            errback=self.page_failed,
+            meta=meta,
+            priority=self.page_priority,
+        )
+
+    def finish_page(self, response, output):
+        """
+        列表页回调处理完，详情请求交给watch_details带上栏目
+        没有调用paginate的(这一页没有数据提前返回了)窗口里补一页，不然窗口少一页，少满了后面的页都不会请求
+        :param output: 回调产出的全部结果
+        :return: 要交给scrapy的结果
+        """
+        catalog = response.meta.get('paginated') or response.meta.get('catalog')
+        if catalog is None:
+            return output
+        output = self.watch_details(catalog, output)
+        if catalog not in self.page_states or response.meta.get('paginated'):
+            return output
+        self.crawler.stats.inc_value('pagination/empty')
+        if not self.page_window or (self.watermarks is not None and self.watermarks.has_mark(catalog)):
+            return output
+        return output + [self.page_request(catalog, page) for page in self.take_pages(catalog, 1)]
+
+    def refill_pages(self, catalog):
+        """ 列表页请求失败或者解析出错，窗口里补一页，增量采集的栏目这次不更新高水位 """
+        if self.watermarks is not None:
+            incremental = self.watermarks.has_mark(catalog)
+            self.watermarks.discard(catalog)
+            if incremental:
+                return []
+        if not self.page_window:
+            return []
+        return [self.page_request(catalog, page) for page in self.take_pages(catalog, 1)]
+
+    def page_failed(self, failure):
+        request = failure.request
+        catalog = request.meta['catalog']
+        logger.error(f'{catalog}: 第{request.meta["page"]}页请求失败{repr(failure.value)}')
+        self.crawler.stats.inc_value('pagination/failed')
+        return self.refill_pages(catalog)
+
+    def page_callback_error(self, failure, response, spider):
+        catalog = response.meta.get('catalog')
+        if spider is not self or catalog not in self.page_states:
+            return
+        for request in self.refill_pages(catalog):
+            self.crawler.engine.crawl(request, self)
+
+    def first_item_scraped(self, item, response, spider):
+        """ 记录第一条数据入库用了多少秒，跟memusage/max一起对比翻页窗口的效果 """
+        stats = self.crawler.stats
+        if spider is not self or stats.get_value('pagination/first_item_seconds') is not None:
+            return
+        start_time = stats.get_value('start_time')
+        if start_time:
+            stats.set_value('pagination/first_item_seconds', round((datetime.utcnow() - start_time).total_seconds(), 2))
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import os
+import math
+import sqlite3
+import threading
+import time
+
+from twisted.internet import reactor
+
+logger = logging.getLogger(__name__)
+
+_pdf_cache = None
+
+
+class PdfTextCache(object):
+    """
+    PDF解析结果缓存，用sqlite存在本地
+    key是response.body的sha1，文件没变化重新采集时直接拿缓存的文本框列表，不用再解析
+    超过max_bytes按最近访问时间淘汰
+    读写都是阻塞的，在reactor线程里要用deferToThread调用，多个线程共用一个连接，用锁串行
+    """
+    # 每写入多少条检查一次容量
+    EVICT_EVERY = 200
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS pdf_text ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, atime REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_pdf_text_atime ON pdf_text (atime)')
+        self.conn.commit()
+        self.lock = threading.Lock()
+        self.puts = 0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            path=settings.get('PDF_CACHE_PATH'),
+            max_bytes=settings.getint('PDF_CACHE_MAX_BYTES'),
+        )
+
+    @staticmethod
+    def make_key(body):
+        return hashlib.sha1(body).hexdigest()
+
+    def get(self, key):
+        """
+        :return: (文本框列表, 解析引擎)，没有缓存返回None
+        """
+        with self.lock:
+            if self.conn is None:
+                return None
+            row = self.conn.execute('SELECT value FROM pdf_text WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute('UPDATE pdf_text SET atime = ? WHERE key = ?', (time.time(), key))
+            self.conn.commit()
+        content_list, engine = json.loads(row[0])
+        return content_list, engine
+
+    def put(self, key, content_list, engine):
+        value = json.dumps([content_list, engine], ensure_ascii=False)
+        with self.lock:
+            if self.conn is None:
+                return
+            self.conn.execute(
+                'INSERT OR REPLACE INTO pdf_text (key, value, size, atime) VALUES (?, ?, ?, ?)',
+                (key, value, len(value.encode('utf-8')), time.time()),
+            )
+            self.conn.commit()
+            self.puts += 1
+            if self.puts % self.EVICT_EVERY == 0:
+                self.evict()
+
+    def evict(self):
+        """ 超过容量时按平均大小估算条数，用atime索引删除最久没访问的，删到容量的90% """
+        count, total = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pdf_text').fetchone()
+        if total <= self.max_bytes:
+            return
+        target = total - int(self.max_bytes * 0.9)
+        limit = math.ceil(target / (total / count))
+        removed = self.conn.execute(
+            'DELETE FROM pdf_text WHERE key IN (SELECT key FROM pdf_text ORDER BY atime LIMIT ?)', (limit,)
+        ).rowcount
+        self.conn.commit()
+        logger.info(f'PDF缓存淘汰{removed}条')
+
+    def close(self):
+        with self.lock:
+            if self.conn is None:
+                return
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+            logger.info(f'PDF缓存命中{self.hits}次, 未命中{self.misses}次')
+
+
+def get_pdf_cache(settings):
+    """ 同一个进程里的爬虫共用一个缓存，没开启返回None """
+    global _pdf_cache
+    if not settings.getbool('PDF_CACHE_ENABLED'):
+        return None
+    if _pdf_cache is None:
+        _pdf_cache = PdfTextCache.from_settings(settings)
+        reactor.addSystemEventTrigger('before', 'shutdown', _pdf_cache.close)
+    return _pdf_cache
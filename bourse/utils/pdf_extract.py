@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import unicodedata
+from io import BytesIO
+
+from pdfminer.pdfparser import PDFParser, PDFDocument
+from pdfminer.pdfinterp import PDFTextExtractionNotAllowed
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams, LTTextBox
+from pdfminer.cmapdb import CMapDB
+
+from bourse.utils.normalize import join_text
+
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+ENGINE_FITZ = 'fitz'
+ENGINE_PDFMINER = 'pdfminer'
+# 乱码字符(替换符、私有区、控制符)超过这个比例就认为快速引擎解析失败
+GARBLED_RATIO = 0.1
+# 交易所PDF基本都是中文CID字体，进程启动时预先加载这些CMap
+CJK_CMAPS = ['UniGB-UCS2-H', 'UniGB-UTF16-H', 'GBK-EUC-H', 'GB-EUC-H', 'UniGB-UCS2-V', 'UniGB-UTF16-V']
+CJK_UNICODE_MAPS = ['Adobe-GB1']
+
+# 每个进程一份，跨文档复用
+_interpreter = None
+
+
+def init_worker():
+    """
+    进程池子进程启动时执行：预加载中文CMap，创建常驻的资源管理器和解释器
+    CMapDB的缓存是类属性，加载一次后整个进程的文档都能用
+    """
+    for name in CJK_CMAPS:
+        try:
+            CMapDB.get_cmap(name)
+        except CMapDB.CMapNotFound:
+            pass
+    for name in CJK_UNICODE_MAPS:
+        for vertical in (False, True):
+            try:
+                CMapDB.get_unicode_map(name, vertical)
+            except CMapDB.CMapNotFound:
+                pass
+    get_interpreter()
+
+
+def get_interpreter():
+    """ 进程内常驻的PDF解释器 """
+    global _interpreter
+    if _interpreter is None:
+        # 创建PDf 资源管理器 来管理共享资源
+        rsrcmgr = PDFResourceManager()
+        # 创建一个PDF设备对象
+        laparams = LAParams()
+        device = PDFPageAggregator(rsrcmgr, laparams=laparams)
+        # 创建一个PDF解释器对象
+        _interpreter = PDFPageInterpreter(rsrcmgr, device)
+    return _interpreter
+
+
+def iter_pdf_pages(body, start_page=0):
+    """
+    pdfminer逐页解析PDF文件，每次返回一页的文本框列表
+    模块级函数，可以直接交给进程池执行
+    :param body: PDF文件字节，response.body
+    :param start_page: 从第几页开始(0开始)，前面的页不做版面分析
+    :return:
+    """
+    # 用文件对象来创建一个pdf文档分析器
+    praser = PDFParser(BytesIO(body))
+    # 创建一个PDF文档
+    doc = PDFDocument()
+    # 连接分析器 与文档对象
+    praser.set_document(doc)
+    doc.set_parser(praser)
+    # 提供初始化密码
+    # 如果没有密码 就创建一个空的字符串
+    doc.initialize()
+    # 检测文档是否提供txt转换，不提供就忽略
+    if not doc.is_extractable:
+        raise PDFTextExtractionNotAllowed
+    else:
+        # 复用进程内的资源管理器，CMap不用每个文档重新加载
+        interpreter = get_interpreter()
+        device = interpreter.device
+        # 字体缓存按文档内的对象id存的，不同文档的id会重复，换文档要清掉
+        interpreter.rsrcmgr._cached_fonts.clear()
+        # 循环遍历列表，每次处理一个page的内容
+        for page_num, page in enumerate(doc.get_pages()):  # doc.get_pages() 获取page列表
+            if page_num < start_page:
+                continue
+            # 接受该页面的LTPage对象
+            interpreter.process_page(page)
+            # 这里layout是一个LTPage对象 里面存放着
+            # 这个page解析出的各种对象 一般包括LTTextBox, LTFigure, LTImage, LTTextBoxHorizontal 等等
+            # 想要获取文本就获得对象的text属性
+            layout = device.get_result()
+            contents_list = []
+            for index, out in enumerate(layout):
+                if isinstance(out, LTTextBox):
+                    contents = out.get_text().strip()
+                    contents_list.append(contents)
+            yield contents_list
+
+
+def iter_pdf_pages_fitz(body, start_page=0):
+    """
+    PyMuPDF逐页解析PDF文件，按文本块返回，格式跟iter_pdf_pages一致
+    :param body: PDF文件字节
+    :param start_page: 从第几页开始(0开始)
+    :return:
+    """
+    pdf_document = fitz.open(stream=body, filetype='pdf')
+    try:
+        for page_num, pdf_page in enumerate(pdf_document):
+            if page_num < start_page:
+                continue
+            contents_list = []
+            # 新版本是get_text，老版本是getText
+            get_text = getattr(pdf_page, 'get_text', None) or pdf_page.getText
+            for block in get_text('blocks'):
+                # (x0, y0, x1, y1, text, block_no, block_type)，block_type为1是图片
+                if len(block) > 6 and block[6] != 0:
+                    continue
+                contents = block[4].strip()
+                if contents:
+                    contents_list.append(contents)
+            yield contents_list
+    finally:
+        pdf_document.close()
+
+
+def parse_pdf(body):
+    """ pdfminer解析PDF文件，返回全部页的文本框列表 """
+    contents_list = []
+    for page_contents in iter_pdf_pages(body):
+        contents_list.extend(page_contents)
+    return contents_list
+
+
+def parse_pdf_fitz(body):
+    """ PyMuPDF解析PDF文件，返回全部页的文本块列表 """
+    contents_list = []
+    for page_contents in iter_pdf_pages_fitz(body):
+        contents_list.extend(page_contents)
+    return contents_list
+
+
+def is_garbled(contents_list):
+    """ 文本为空或者乱码比例过高 """
+    chars = [c for c in ''.join(contents_list) if not c.isspace()]
+    if not chars:
+        return True
+    bad = 0
+    for c in chars:
+        if c == '\ufffd' or '\ue000' <= c <= '\uf8ff' or unicodedata.category(c) == 'Cc':
+            bad += 1
+    return bad / len(chars) > GARBLED_RATIO
+
+
+def read_pages(pages, stop_patterns=None, max_pages=None):
+    """
+    逐页读取，stop_patterns全部匹配到或者读满max_pages页就不再往后解析
+    :param pages: iter_pdf_pages返回的生成器
+    :param stop_patterns: 编译好的正则，在去掉空白的文本上匹配，跟爬虫里拼接ws_nr_txt的方式一致
+    :param max_pages: 最多解析多少页
+    :return: (文本框列表, 读了几页, 是否读完)
+    """
+    contents_list = []
+    text = ''
+    page_count = 0
+    try:
+        for page_contents in pages:
+            contents_list.extend(page_contents)
+            page_count += 1
+            if stop_patterns:
+                text += join_text(page_contents)
+                if all(pattern.search(text) for pattern in stop_patterns):
+                    return contents_list, page_count, False
+            if max_pages and page_count >= max_pages:
+                return contents_list, page_count, False
+    finally:
+        pages.close()
+    return contents_list, page_count, True
+
+
+def extract_pdf(body, fast=True, stop_patterns=None, max_pages=None, start_page=0, engine=None):
+    """
+    先用PyMuPDF快速解析，文本为空或乱码再用pdfminer兜底
+    :param body: PDF文件字节
+    :param fast: 是否启用PyMuPDF
+    :param stop_patterns: 字段正则全部匹配到就提前结束
+    :param max_pages: 最多解析多少页
+    :param start_page: 从第几页开始，接着上次提前结束的位置补全文本时使用
+    :param engine: 指定引擎，补全文本时要跟前面的页用同一个引擎
+    :return: (文本框列表, 使用的引擎, 解析到第几页, 是否读完全部页)
+    """
+    if engine is None:
+        engine = ENGINE_FITZ if fast and fitz is not None else ENGINE_PDFMINER
+        if engine == ENGINE_FITZ:
+            try:
+                contents_list, page_count, complete = read_pages(
+                    iter_pdf_pages_fitz(body, start_page), stop_patterns, max_pages)
+            except Exception:
+                contents_list, page_count, complete = [], 0, False
+            if not is_garbled(contents_list):
+                return contents_list, ENGINE_FITZ, start_page + page_count, complete
+            engine = ENGINE_PDFMINER
+    iter_pages = iter_pdf_pages_fitz if engine == ENGINE_FITZ else iter_pdf_pages
+    contents_list, page_count, complete = read_pages(iter_pages(body, start_page), stop_patterns, max_pages)
+    return contents_list, engine, start_page + page_count, complete
+
+
+def benchmark(pdf_dir):
+    """
+    对比两个引擎的速度，pdf_dir放交易所的PDF样本
+    :param pdf_dir:
+    :return:
+    """
+    bodies = []
+    for parents, dirnames, filenames in os.walk(pdf_dir):
+        for filename in filenames:
+            if filename.lower().endswith('.pdf'):
+                with open(os.path.join(parents, filename), 'rb') as f:
+                    bodies.append(f.read())
+    print(f'PDF数量: {len(bodies)}')
+    if not bodies:
+        return
+
+    engines = [(ENGINE_PDFMINER, parse_pdf)]
+    if fitz is not None:
+        engines.append((ENGINE_FITZ, parse_pdf_fitz))
+    for engine, func in engines:
+        failed = 0
+        start = time.perf_counter()
+        for body in bodies:
+            try:
+                func(body)
+            except Exception:
+                failed += 1
+        cost = time.perf_counter() - start
+        print(f'{engine}: {len(bodies) / cost:.2f} docs/sec, 总耗时{cost:.2f}s, 失败{failed}')
+
+    benchmark_latency(bodies)
+
+    used = {ENGINE_FITZ: 0, ENGINE_PDFMINER: 0}
+    start = time.perf_counter()
+    for body in bodies:
+        try:
+            used[extract_pdf(body)[1]] += 1
+        except Exception:
+            pass
+    cost = time.perf_counter() - start
+    print(f'extract_pdf: {len(bodies) / cost:.2f} docs/sec, 引擎使用次数{used}')
+
+
+def benchmark_latency(bodies):
+    """
+    pdfminer单文档耗时：冷启动(每个文档清空CMap缓存、新建资源管理器) 对比 常驻资源管理器+预加载CMap
+    样本用深交所问询函件PDF
+    """
+    global _interpreter
+    cold = []
+    for body in bodies:
+        CMapDB._cmap_cache.clear()
+        CMapDB._umap_cache.clear()
+        _interpreter = None
+        start = time.perf_counter()
+        try:
+            parse_pdf(body)
+        except Exception:
+            continue
+        cold.append(time.perf_counter() - start)
+
+    init_worker()
+    warm = []
+    for body in bodies:
+        start = time.perf_counter()
+        try:
+            parse_pdf(body)
+        except Exception:
+            continue
+        warm.append(time.perf_counter() - start)
+
+    for name, costs in (('冷启动', cold), ('预加载', warm)):
+        if not costs:
+            continue
+        costs.sort()
+        avg = sum(costs) / len(costs)
+        p50 = costs[len(costs) // 2]
+        p95 = costs[min(len(costs) - 1, int(len(costs) * 0.95))]
+        print(f'pdfminer{name}: 平均{avg * 1000:.1f}ms, p50 {p50 * 1000:.1f}ms, p95 {p95 * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else './')
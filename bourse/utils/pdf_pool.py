@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from scrapy.utils.misc import arg_to_iter
+from twisted.internet import defer, reactor, threads
+from twisted.python.failure import Failure
+
+from bourse.utils.field_rules import FIELD_RULES
+from bourse.utils.pdf_cache import get_pdf_cache
+from bourse.utils.normalize import join_text
+from bourse.utils.pdf_extract import extract_pdf, init_worker
+
+logger = logging.getLogger(__name__)
+
+_pdf_pool = None
+
+
+class PdfExtractPool(object):
+    """
+    PDF解析进程池
+    pdfminer版面分析是纯python计算，放在reactor线程里会卡住下载、调度和管道，
+    这里把解析丢到子进程，回调里拿到Deferred
+    """
+    def __init__(self, workers):
+        self.workers = workers
+        # workers为0时直接在当前线程解析，方便调试
+        # 子进程启动时预加载中文CMap
+        # reactor进程里已经有线程池、ES写入线程和sqlite连接，用spawn启动子进程，不fork这些锁和内存
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=init_worker
+        ) if workers > 0 else None
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(workers=settings.getint('PDF_EXTRACT_WORKERS', 0))
+
+    def submit(self, func, *args):
+        """
+        提交任务，返回Deferred，任务完成后在reactor线程里触发
+        :param func: 模块级函数，需要能被pickle
+        :return: Deferred
+        """
+        if self.executor is None:
+            return defer.maybeDeferred(func, *args)
+        dfd = defer.Deferred()
+        future = self.executor.submit(func, *args)
+        future.add_done_callback(lambda f: reactor.callFromThread(self._fire, dfd, f))
+        return dfd
+
+    @staticmethod
+    def _fire(dfd, future):
+        exception = future.exception()
+        if exception is not None:
+            dfd.errback(Failure(exception))
+        else:
+            dfd.callback(future.result())
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+def get_pdf_pool(settings):
+    """ 同一个进程里的爬虫共用一个进程池(crawlall同时跑三个交易所) """
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = PdfExtractPool.from_settings(settings)
+        reactor.addSystemEventTrigger('before', 'shutdown', _pdf_pool.close)
+        logger.info(f'PDF解析进程数:{_pdf_pool.workers}')
+    return _pdf_pool
+
+
+class PdfSpiderMixin(object):
+    """
+    爬虫混入类，PDF解析交给进程池
+    回调直接返回defer_pdf的Deferred，scrapy会等它触发后再处理产出的item
+    """
+    def defer_pdf(self, response, callback, errback=None, required=None, source=None):
+        """
+        解析PDF，完成后调用 callback(response, content_list)，产出的item记录解析引擎pdf_engine
+        文件内容没变的直接用本地缓存，不再解析
+        :param response:
+        :param callback: 提取字段的方法
+        :param errback: 解析出错的处理，默认记录日志，返回的文本框列表是None时不调用callback，不产出item
+        :param required: 必须匹配到的字段正则，全部匹配到后面的页就不解析了，默认用source的PDF字段规则
+        :param source: 数据来源bz，对应FIELD_RULES、PDF_PAGE_LIMITS页数上限和PDF_PARTIAL_TEXT_SOURCES
+        :return: Deferred
+        """
+        cache = get_pdf_cache(self.settings)
+        key = cache.make_key(response.body) if cache else None
+        # 查缓存是sqlite读写，放到线程里，不阻塞reactor
+        dfd = threads.deferToThread(cache.get, key) if cache else defer.succeed(None)
+        dfd.addErrback(self._cache_failed)
+        dfd.addCallback(self._extract_or_cached, response, errback, required, source, cache, key)
+        dfd.addCallback(self._call_with_content, response, callback, source, cache, key)
+        return dfd
+
+    def _extract_or_cached(self, cached, response, errback, required, source, cache, key):
+        if cached is not None:
+            content_list, engine = cached
+            return content_list, engine, len(content_list), True
+        fast = self.settings.getbool('PDF_FAST_ENGINE', True)
+        if required is None and 'pdf' in FIELD_RULES.get(source, {}):
+            required = FIELD_RULES[source]['pdf'].required
+        stop_patterns = tuple(required) if required and self.settings.getbool('PDF_EARLY_STOP') else None
+        max_pages = self.settings.getdict('PDF_PAGE_LIMITS').get(source)
+        dfd = get_pdf_pool(self.settings).submit(extract_pdf, response.body, fast, stop_patterns, max_pages)
+        if cache:
+            dfd.addCallback(self._save_cache, cache, key)
+        dfd.addErrback(errback or self.pdf_failed, response)
+        return dfd
+
+    @staticmethod
+    def _cache_failed(failure):
+        logger.error(f'读取PDF缓存出错{repr(failure.value)}')
+        return None
+
+    @staticmethod
+    def _save_cache(result, cache, key):
+        # 提前结束的只有部分页，不缓存
+        content_list, engine, page_count, complete = result
+        if complete:
+            PdfSpiderMixin._put_cache(cache, key, content_list, engine)
+        return result
+
+    @staticmethod
+    def _put_cache(cache, key, full_list, engine):
+        """ 写缓存放到线程里，不等写完 """
+        dfd = threads.deferToThread(cache.put, key, full_list, engine)
+        dfd.addErrback(lambda failure: logger.error(f'写入PDF缓存出错{repr(failure.value)}'))
+
+    def _call_with_content(self, result, response, callback, source, cache, key):
+        content_list, engine, page_count, complete = result
+        if not content_list:
+            # 解析失败或者没有文本，不产出空字段的item，也就不会入库、不会被增量下载记下来
+            if content_list is not None:
+                logger.warning(f'PDF没有解析出文本:{response.url}')
+            else:
+                # 解析失败的记录下次增量采集还要再试，栏目不更新高水位
+                discard_detail = getattr(self, 'discard_detail', None)
+                if discard_detail is not None:
+                    discard_detail(response.meta)
+            return []
+        items = []
+        for item in arg_to_iter(callback(response, content_list)):
+            if isinstance(item, dict) and engine:
+                item['pdf_engine'] = engine
+            items.append(item)
+        if complete or source in self.settings.getlist('PDF_PARTIAL_TEXT_SOURCES'):
+            return items
+        # PDF_PAGE_LIMITS同样限制全文，已经读满上限的不再补
+        max_pages = self.settings.getdict('PDF_PAGE_LIMITS').get(source)
+        if max_pages and page_count >= max_pages:
+            return items
+        # ws_nr_txt要存全文，从提前结束的那一页接着解析剩下的页
+        dfd = get_pdf_pool(self.settings).submit(
+            extract_pdf, response.body, True, None, max_pages - page_count if max_pages else None, page_count, engine)
+        dfd.addCallback(self._fill_full_text, items, content_list, cache, key)
+        dfd.addErrback(self._full_text_failed, items)
+        return dfd
+
+    @staticmethod
+    def _fill_full_text(result, items, content_list, cache, key):
+        rest_list, engine, page_count, complete = result
+        full_list = content_list + rest_list
+        if cache and complete:
+            PdfSpiderMixin._put_cache(cache, key, full_list, engine)
+        ws_nr_txt = join_text(full_list)
+        for item in items:
+            if isinstance(item, dict) and 'ws_nr_txt' in item:
+                item['ws_nr_txt'] = ws_nr_txt
+        return items
+
+    @staticmethod
+    def _full_text_failed(failure, items):
+        logger.error(f'补全PDF全文出错{repr(failure.value)}')
+        return items
+
+    def pdf_failed(self, failure, response):
+        logger.error(f'解析出错{repr(failure.value)}:{response.url}')
+        return None, '', 0, True
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+import glob
+import gzip
+import json
+import logging
+import os
+import time
+import zlib
+
+from scrapy.exceptions import NotConfigured
+from twisted.internet import defer
+
+from bourse.utils.spool import SpoolSink
+
+logger = logging.getLogger(__name__)
+
+# 写入中的文件后缀，写完改名，加载命令只读写完的文件
+PART_SUFFIX = '.part'
+
+
+class FileSink(object):
+    """
+    本地文件存储，跟EsBulkWriter一样的接口: add返回Deferred, close返回Deferred, 写完的一批调用on_written
+    每条存成 {'_id': ws_pc_id, '_source': 数据}，之后用 scrapy loadsink 批量写入ES
+    文件到max_bytes换新文件，文件名: <爬虫>-<时间>-<序号><后缀>
+    """
+    suffix = ''
+
+    def __init__(self, directory, name, max_bytes, batch_docs, on_written):
+        """
+        :param directory: 存储目录
+        :param name: 文件名前缀，一般是爬虫名称
+        :param max_bytes: 单个文件最大字节数
+        :param batch_docs: 多少条写一批
+        :param on_written: 同EsBulkWriter，on_written(批次, 结果, 耗时)
+        """
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.batch_docs = batch_docs
+        self.on_written = on_written
+        self.buffer = []
+        self.path = None
+        self.seq = 0
+
+    def new_path(self):
+        self.seq += 1
+        filename = f"{self.name}-{time.strftime('%Y%m%d%H%M%S')}-{self.seq:04d}{self.suffix}"
+        return os.path.join(self.directory, filename)
+
+    def add(self, _id, item, maybe_duplicate=True):
+        self.buffer.append((_id, item, maybe_duplicate))
+        if len(self.buffer) >= self.batch_docs:
+            self.flush()
+        return defer.succeed(None)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        batch = self.buffer
+        self.buffer = []
+        start = time.time()
+        if self.path is None:
+            self.path = self.new_path()
+            self.open_file(self.path + PART_SUFFIX)
+        self.write(batch)
+        self.written(batch, time.time() - start)
+        if os.path.getsize(self.path + PART_SUFFIX) >= self.max_bytes:
+            self.rotate()
+
+    def written(self, batch, cost):
+        result = dict(created=[_id for _id, item, maybe_duplicate in batch], duplicates=[], updated=[],
+                      unchanged=[], failed=[])
+        self.on_written(batch, result, cost)
+
+    def rotate(self):
+        """ 写完当前文件，改成正式文件名 """
+        if self.path is None:
+            return
+        self.close_file()
+        os.replace(self.path + PART_SUFFIX, self.path)
+        logger.info(f'写完文件{self.path}')
+        self.path = None
+
+    def close(self):
+        self.flush()
+        self.rotate()
+        return defer.succeed(None)
+
+    def open_file(self, path):
+        raise NotImplementedError
+
+    def write(self, batch):
+        raise NotImplementedError
+
+    def close_file(self):
+        raise NotImplementedError
+
+
+class JsonlSink(FileSink):
+    """
+    gzip压缩的jsonl，一行一条
+    每批写完做一次同步刷新(Z_SYNC_FLUSH)，进程意外退出时写入中的文件也能读到最后一批
+    """
+    suffix = '.jsonl.gz'
+
+    def open_file(self, path):
+        self.file = gzip.open(path, 'wb')
+
+    def write(self, batch):
+        for _id, item, maybe_duplicate in batch:
+            line = json.dumps({'_id': _id, '_source': item}, ensure_ascii=False)
+            self.file.write(line.encode('utf-8') + b'\n')
+        self.file.flush(zlib.Z_SYNC_FLUSH)
+
+    def close_file(self):
+        self.file.close()
+
+
+class ParquetSink(FileSink):
+    """
+    Parquet列存，每批写一个row group
+    文件尾部在关闭时才写，写入中的文件读不了，所以一个文件关闭后才对这个文件的数据调用on_written
+    字段取所有批次的并集，类型按值推断: 整数int64，小数float64，布尔bool，字符串string，
+    列表、字典和类型不一致的字段整列存JSON字符串(字段元数据json=1)，读取时还原；全是None的字段按字符串
+    新的一批有新字段或者类型变了，当前文件写完，合并后的字段写到新文件
+    """
+    suffix = '.parquet'
+    # 整列存JSON的字段在self.types里的类型
+    JSON = 'json'
+
+    def __init__(self, *args, **kwargs):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise NotConfigured('STORAGE_SINK=parquet需要安装pyarrow')
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.writer = None
+        # {字段: pyarrow类型}，换文件后保留，后面的文件不用再换
+        self.types = {}
+        self.unconfirmed = []
+        self.unconfirmed_cost = 0
+        super(ParquetSink, self).__init__(*args, **kwargs)
+
+    def open_file(self, path):
+        self.writer = None
+        self.part_path = path
+
+    def write(self, batch):
+        rows = [{'_id': _id, **item} for _id, item, maybe_duplicate in batch]
+        try:
+            table = self.make_table(rows)
+        except self.pa.ArrowException as e:
+            logger.warning(f'Parquet字段类型转换出错{repr(e)}，这批的字段都按JSON存')
+            table = self.make_table(rows, as_json=True)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.part_path, table.schema, compression='zstd')
+        self.writer.write_table(table)
+
+    def make_table(self, rows, as_json=False):
+        """ 按合并后的字段类型生成表，字段有变化先换文件 """
+        pa = self.pa
+        columns = {}
+        for row in rows:
+            for key, value in row.items():
+                columns.setdefault(key, []).append(value)
+        types = dict(self.types)
+        for key, values in columns.items():
+            new_type = self.JSON if as_json else self.column_type(values)
+            types[key] = self.merge_type(types.get(key), new_type)
+        types = {key: value or pa.string() for key, value in types.items()}
+        if self.writer is not None and types != self.types:
+            self.rotate()
+            self.path = self.new_path()
+            self.open_file(self.path + PART_SUFFIX)
+        self.types = types
+        schema = pa.schema([
+            pa.field(key, pa.string(), nullable=True, metadata={'json': '1'}) if value == self.JSON
+            else pa.field(key, value, nullable=True)
+            for key, value in types.items()
+        ])
+        return pa.Table.from_pylist(
+            [{key: self.to_value(row.get(key), value) for key, value in types.items()} for row in rows], schema=schema)
+
+    def column_type(self, values):
+        """ :return: 一批里一个字段的类型，全是None返回None """
+        values = [value for value in values if value is not None]
+        if not values:
+            return None
+        if all(isinstance(value, bool) for value in values):
+            return self.pa.bool_()
+        if all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+            return self.pa.int64()
+        if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+            return self.pa.float64()
+        if all(isinstance(value, str) for value in values):
+            return self.pa.string()
+        return self.JSON
+
+    def merge_type(self, old, new):
+        if old is None or new is None or old == new:
+            return old or new
+        if {old, new} == {self.pa.int64(), self.pa.float64()}:
+            return self.pa.float64()
+        return self.JSON
+
+    def to_value(self, value, value_type):
+        if value is None:
+            return None
+        if value_type == self.JSON:
+            return json.dumps(value, ensure_ascii=False)
+        if value_type == self.pa.float64():
+            return float(value)
+        return value
+
+    def written(self, batch, cost):
+        # 只保留_id和xq_url，文件关闭后再通知
+        self.unconfirmed.extend((_id, {'xq_url': item.get('xq_url')}, maybe_duplicate) for _id, item, maybe_duplicate in batch)
+        self.unconfirmed_cost += cost
+
+    def close_file(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        batch, self.unconfirmed = self.unconfirmed, []
+        cost, self.unconfirmed_cost = self.unconfirmed_cost, 0
+        if batch:
+            super(ParquetSink, self).written(batch, cost)
+
+
+SINKS = {
+    'jsonl': JsonlSink,
+    'parquet': ParquetSink,
+}
+
+
+def open_file_sink(settings, name, on_written):
+    """ 按STORAGE_SINK创建本地存储 """
+    sink = settings.get('STORAGE_SINK')
+    if sink == 'spool':
+        return SpoolSink.from_settings(settings, name, on_written)
+    if sink not in SINKS:
+        raise NotConfigured(f'不支持的STORAGE_SINK: {sink}')
+    return SINKS[sink](
+        directory=settings.get('SINK_DIR'),
+        name=name,
+        max_bytes=settings.getint('SINK_MAX_FILE_BYTES'),
+        batch_docs=settings.getint('SINK_BATCH_DOCS'),
+        on_written=on_written,
+    )
+
+
+def sink_files(directory, include_partial=False):
+    """
+    写完的存储文件，按文件名(时间)排序
+    :param include_partial: 包括进程意外退出留下的jsonl文件(.part)，Parquet没写文件尾读不了
+    """
+    patterns = ['*' + JsonlSink.suffix, '*' + ParquetSink.suffix]
+    if include_partial:
+        patterns.append('*' + JsonlSink.suffix + PART_SUFFIX)
+    paths = []
+    for pattern in patterns:
+        paths.extend(glob.glob(os.path.join(directory, pattern)))
+    return sorted(paths)
+
+
+def read_sink_file(path):
+    """
+    读取存储文件
+    :return: 生成器 (_id, 数据)
+    """
+    if path.endswith(ParquetSink.suffix):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        json_keys = {field.name for field in parquet_file.schema_arrow if (field.metadata or {}).get(b'json') == b'1'}
+        for batch in parquet_file.iter_batches():
+            for row in batch.to_pylist():
+                _id = row.pop('_id')
+                # 同一个文件里其他数据有、这条没有的字段是None
+                yield _id, {key: json.loads(value) if key in json_keys else value
+                            for key, value in row.items() if value is not None}
+        return
+    with gzip.open(path, 'rb') as f:
+        try:
+            for line in f:
+                record = json.loads(line)
+                yield record['_id'], record['_source']
+        except (EOFError, ValueError):
+            # 进程意外退出留下的文件没有gzip结尾，读到最后一次同步刷新为止
+            logger.warning(f'{path}没有正常结束，只读到最后写完的一批')
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+import glob
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+
+from twisted.internet import defer, task
+
+logger = logging.getLogger(__name__)
+
+# 每条记录: 长度 + crc32 + json
+FRAME_HEADER = struct.Struct('>II')
+# 正在写的段文件，写满或者爬虫结束改成SEALED_SUFFIX
+ACTIVE_SUFFIX = '.active'
+SEALED_SUFFIX = '.seg'
+
+
+def encode_frame(_id, item):
+    payload = json.dumps({'_id': _id, '_source': item}, ensure_ascii=False).encode('utf-8')
+    return FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_frames(path, offset=0):
+    """
+    从offset开始读段文件
+    :return: 生成器 (_id, 数据, 这条记录结束的偏移)，读到不完整或者校验不对的记录就停
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            header = f.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            length, crc = FRAME_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            offset += FRAME_HEADER.size + length
+            record = json.loads(payload)
+            yield record['_id'], record['_source'], offset
+
+
+def tail_state(path, offset):
+    """
+    read_frames停下的位置后面是什么
+    :return: 'end' 读完了; 'truncated' 最后一条记录没写完(意外退出); 'corrupt' 后面的记录完整但是校验不对
+    """
+    size = os.path.getsize(path)
+    if offset >= size:
+        return 'end'
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        header = f.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return 'truncated'
+    length, crc = FRAME_HEADER.unpack(header)
+    if offset + FRAME_HEADER.size + length > size:
+        return 'truncated'
+    return 'corrupt'
+
+
+def segment_key(path):
+    """ 段文件名去掉后缀，封存前后不变，用来记断点 """
+    name = os.path.basename(path)
+    for suffix in (ACTIVE_SUFFIX, SEALED_SUFFIX):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def list_segments(directory):
+    """ :return: [(段文件路径, 是否已封存)]，按文件名(爬虫-时间-序号)排序 """
+    segments = [(path, False) for path in glob.glob(os.path.join(directory, '*' + ACTIVE_SUFFIX))]
+    segments += [(path, True) for path in glob.glob(os.path.join(directory, '*' + SEALED_SUFFIX))]
+    return sorted(segments, key=lambda segment: segment_key(segment[0]))
+
+
+class SpoolSink(object):
+    """
+    本地只追加的段文件队列，采集只管写盘，由 scrapy tailspool 另外读出来写ES，ES慢或者连不上不影响采集
+    接口跟EsBulkWriter一样，攒够fsync_docs条或者定时器到了才fsync一次，fsync之后的数据才调用on_written
+    每个爬虫写自己的段文件: <爬虫>-<时间>-<序号>.active，写到segment_bytes或者爬虫结束封存成.seg
+    """
+    def __init__(self, directory, name, segment_bytes, fsync_docs, fsync_interval, on_written):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.name = name
+        self.segment_bytes = segment_bytes
+        self.fsync_docs = fsync_docs
+        self.on_written = on_written
+        self.buffer = []
+        self.file = None
+        self.path = None
+        self.seq = 0
+        self.seal_stale()
+        self.loop = task.LoopingCall(self.sync)
+        self.loop.start(fsync_interval, now=False)
+
+    @classmethod
+    def from_settings(cls, settings, name, on_written):
+        return cls(
+            directory=settings.get('SPOOL_DIR'),
+            name=name,
+            segment_bytes=settings.getint('SPOOL_SEGMENT_BYTES'),
+            fsync_docs=settings.getint('SPOOL_FSYNC_DOCS'),
+            fsync_interval=settings.getfloat('SPOOL_FSYNC_INTERVAL'),
+            on_written=on_written,
+        )
+
+    def seal_stale(self):
+        """ 上次意外退出没封存的段文件，末尾可能有写了一半的记录，直接封存，读的时候读到完整的记录为止 """
+        for path in glob.glob(os.path.join(self.directory, f'{self.name}-*{ACTIVE_SUFFIX}')):
+            self.seal(path)
+
+    @staticmethod
+    def seal(path):
+        sealed = path[:-len(ACTIVE_SUFFIX)] + SEALED_SUFFIX
+        os.replace(path, sealed)
+        logger.info(f'封存段文件{sealed}')
+
+    def add(self, _id, item, maybe_duplicate=True):
+        if self.file is None:
+            self.seq += 1
+            filename = f"{self.name}-{time.strftime('%Y%m%d%H%M%S')}-{self.seq:06d}{ACTIVE_SUFFIX}"
+            self.path = os.path.join(self.directory, filename)
+            self.file = open(self.path, 'ab')
+        self.file.write(encode_frame(_id, item))
+        self.buffer.append((_id, item, maybe_duplicate))
+        if len(self.buffer) >= self.fsync_docs:
+            self.sync()
+        return defer.succeed(None)
+
+    def sync(self):
+        """ 刷到磁盘，之后的数据才算写入成功 """
+        if not self.buffer:
+            return
+        start = time.time()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        batch = self.buffer
+        self.buffer = []
+        result = dict(created=[_id for _id, item, maybe_duplicate in batch], duplicates=[], updated=[],
+                      unchanged=[], failed=[])
+        self.on_written(batch, result, time.time() - start)
+        if self.file.tell() >= self.segment_bytes:
+            self.rotate()
+
+    def rotate(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        self.seal(self.path)
+
+    def close(self):
+        if self.loop.running:
+            self.loop.stop()
+        self.sync()
+        self.rotate()
+        return defer.succeed(None)
+
+
+class SpoolCheckpoint(object):
+    """
+    已经写入ES的偏移 {段文件名: 偏移}，整个文件写完再替换，进程中途退出不会留下写了一半的断点
+    """
+    def __init__(self, path):
+        self.path = path
+        self.offsets = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.offsets = json.load(f)
+
+    def get(self, key):
+        return self.offsets.get(key, 0)
+
+    def commit(self, key, offset):
+        self.offsets[key] = offset
+        self.save()
+
+    def remove(self, key):
+        if self.offsets.pop(key, None) is not None:
+            self.save()
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.offsets, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
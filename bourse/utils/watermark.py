@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+
+from scrapy import Request, signals
+
+from bourse.utils.filter_fact import get_md5_value
+
+logger = logging.getLogger(__name__)
+
+
+def record_id(row):
+    """ 列表里一条记录的id，列表接口返回的字典或者html列表的标题+链接 """
+    if isinstance(row, (dict, list, tuple)):
+        row = json.dumps(row, ensure_ascii=False, sort_keys=True)
+    return get_md5_value(str(row))
+
+
+class WatermarkStore(object):
+    """
+    各栏目的高水位，每个爬虫一个json文件: {栏目: {'cf_jdrq': 最新日期, 'ids': [最新日期那天的记录id]}}
+    列表接口按日期倒序，早于高水位日期的、或者就是那天且id已记录的，都是上次采集过的
+    本次看到的记录先记在pending里，爬虫正常结束才写回文件，中途出错下次还从原来的高水位开始
+    有数据没写入存储(abort)时这次全部栏目都不更新
+    """
+    def __init__(self, path):
+        self.path = path
+        self.marks = {}
+        self.pending = {}
+        self.failed = set()
+        self.aborted = False
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.marks = json.load(f)
+
+    @classmethod
+    def from_settings(cls, settings, spider_name):
+        return cls(os.path.join(settings.get('WATERMARK_DIR'), f'{spider_name}.json'))
+
+    def has_mark(self, catalog):
+        return catalog in self.marks
+
+    def is_seen(self, catalog, cf_jdrq, _id):
+        mark = self.marks.get(catalog)
+        if not mark or not cf_jdrq:
+            return False
+        if cf_jdrq < mark['cf_jdrq']:
+            return True
+        return cf_jdrq == mark['cf_jdrq'] and _id in mark['ids']
+
+    def track(self, catalog, cf_jdrq, _id):
+        """ 记录本次看到的记录，只保留最新日期那天的id """
+        if not cf_jdrq or catalog in self.failed or self.aborted:
+            return
+        mark = self.pending.setdefault(catalog, {'cf_jdrq': cf_jdrq, 'ids': set()})
+        if cf_jdrq > mark['cf_jdrq']:
+            mark['cf_jdrq'] = cf_jdrq
+            mark['ids'] = set()
+        if cf_jdrq == mark['cf_jdrq']:
+            mark['ids'].add(_id)
+
+    def discard(self, catalog):
+        """ 栏目有列表页没采集成功，这次不更新它的高水位 """
+        self.failed.add(catalog)
+        self.pending.pop(catalog, None)
+
+    def abort(self):
+        """ 有数据没写入存储，这次所有栏目都不更新高水位 """
+        if not self.aborted:
+            logger.warning('有数据没写入存储，这次不更新高水位')
+        self.aborted = True
+        self.pending = {}
+
+    def commit(self):
+        """ 合并本次的记录写回文件 """
+        for catalog, mark in self.pending.items():
+            old = self.marks.get(catalog)
+            if old and old['cf_jdrq'] > mark['cf_jdrq']:
+                continue
+            ids = set(mark['ids'])
+            if old and old['cf_jdrq'] == mark['cf_jdrq']:
+                ids.update(old['ids'])
+            self.marks[catalog] = {'cf_jdrq': mark['cf_jdrq'], 'ids': sorted(ids)}
+        self.pending = {}
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.marks, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class IncrementalSpiderMixin(object):
+    """
+    爬虫混入类，增量采集
+    列表解析时用track_record记录每条记录，翻页用next_pages：
+    没有高水位的栏目(第一次采集或者-a full_crawl=1)第一页就把剩下的页全部请求
+    有高水位的一页一页往后翻，某一页全是采集过的记录就停
+    列表页产出的详情请求带上栏目(watermark_catalog)，详情请求失败、回调出错或者PDF解析失败，
+    这条记录没有入库，这个栏目这次不更新高水位，下次增量采集还会请求它
+    """
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(IncrementalSpiderMixin, cls).from_crawler(crawler, *args, **kwargs)
+        spider.watermarks = None
+        if crawler.settings.getbool('INCREMENTAL_ENABLED'):
+            spider.watermarks = WatermarkStore.from_settings(crawler.settings, spider.name)
+            if getattr(spider, 'full_crawl', None) in ('1', 'true', 'True'):
+                spider.watermarks.marks = {}
+            crawler.signals.connect(spider.commit_watermarks, signal=signals.spider_closed)
+            crawler.signals.connect(spider.detail_callback_error, signal=signals.spider_error)
+        return spider
+
+    def track_record(self, catalog, cf_jdrq, row):
+        """
+        记录列表里的一条记录
+        :param catalog: 栏目
+        :param cf_jdrq: 记录日期
+        :param row: 列表接口返回的原始记录，用来生成记录id
+        :return: 没采集过返回True
+        """
+        if self.watermarks is None:
+            return True
+        cf_jdrq = (cf_jdrq or '').strip()
+        _id = record_id(row)
+        self.watermarks.track(catalog, cf_jdrq, _id)
+        return not self.watermarks.is_seen(catalog, cf_jdrq, _id)
+
+    def next_pages(self, response, catalog, page_count, fresh):
+        """
+        接下来要请求的页码
+        :param response: 当前列表页，meta里的page是当前页码，没有就是第一页
+        :param catalog: 栏目
+        :param page_count: 总页数
+        :param fresh: 当前页没采集过的记录数
+        :return: 页码列表，请求时meta带上{'is_first': False, 'page': 页码}
+        """
+        page = response.meta.get('page', 1)
+        if self.watermarks is None or not self.watermarks.has_mark(catalog):
+            if response.meta.get('is_first', True):
+                return range(2, page_count + 1)
+            return []
+        if not fresh:
+            logger.info(f'{catalog}: 第{page}页都已采集过，停止翻页')
+            return []
+        return [page + 1] if page < page_count else []
+
+    def watch_details(self, catalog, output):
+        """ 列表页产出的详情请求带上栏目，没有errback的加上detail_failed """
+        if self.watermarks is None:
+            return output
+        watched = []
+        for i in output:
+            if isinstance(i, Request) and not i.dont_filter and 'catalog' not in i.meta:
+                i.meta['watermark_catalog'] = catalog
+                if i.errback is None:
+                    i = i.replace(errback=self.detail_failed)
+            watched.append(i)
+        return watched
+
+    def discard_detail(self, meta):
+        """ 详情没有产出数据，它的栏目这次不更新高水位 """
+        catalog = meta.get('watermark_catalog')
+        if self.watermarks is None or catalog is None or catalog in self.watermarks.failed:
+            return
+        logger.info(f'{catalog}: 有详情没有采集成功，这次不更新高水位')
+        self.watermarks.discard(catalog)
+
+    def detail_failed(self, failure):
+        logger.error(f'详情请求失败{failure.request.url}: {repr(failure.value)}')
+        self.discard_detail(failure.request.meta)
+
+    def detail_callback_error(self, failure, response, spider):
+        if spider is self:
+            self.discard_detail(response.meta)
+
+    def commit_watermarks(self, spider, reason):
+        if reason != 'finished':
+            logger.info(f'爬虫结束原因{reason}，不更新高水位')
+            return
+        if self.watermarks.aborted:
+            logger.info('有数据没写入存储，不更新高水位')
+            return
+        self.watermarks.commit()
+        logger.info(f'高水位已更新:{self.watermarks.path}')
@@ -1,14 +1,30 @@
 # -*- coding: utf-8 -*-
 from scrapy import cmdline
 
+# PDF解析进程池用spawn启动子进程，子进程会重新导入这个文件，不能直接执行
+if __name__ == '__main__':
+    # 深圳证券交易所
+    cmdline.execute('scrapy crawl shenzhen_stock'.split())
+    # 上海证券交易所
+    # cmdline.execute('scrapy crawl shanghai_stock'.split())
+    # 全国中小企业股份转让系统
+    # cmdline.execute('scrapy crawl national_stock'.split())
 
-# 深圳证券交易所
-cmdline.execute('scrapy crawl shenzhen_stock'.split())
-# 上海证券交易所
-# cmdline.execute('scrapy crawl shanghai_stock'.split())
-# 全国中小企业股份转让系统
-# cmdline.execute('scrapy crawl national_stock'.split())
+    # cmdline.execute("scrapy crawlall".split())
+    # 忽略高水位全量采集
+    # cmdline.execute("scrapy crawlall -a full_crawl=1".split())
+    # 清空url跑全部任务
+    # cmdline.execute("scrapy crawlall -a deltafetch_reset=1".split())
+    # 录制详情页样本(期望字段人工核对后提交)
+    # cmdline.execute("scrapy extractbench --record shenzhen_stock".split())
+    # 离线跑样本，统计解析速度和字段准确率，跟上次结果对比
+    # cmdline.execute("scrapy extractbench -o bench.json --compare bench_last.json".split())
 
-# cmdline.execute("scrapy crawlall".split())
-# 清空url跑全部任务
-# cmdline.execute("scrapy crawlall -a deltafetch_reset=1".split())
\ No newline at end of file
+    # 本地文件(STORAGE_SINK=jsonl/parquet)批量写入ES
+    # cmdline.execute("scrapy loadsink".split())
+
+    # 本地段文件队列(STORAGE_SINK=spool)持续写入ES，跟采集同时跑
+    # cmdline.execute("scrapy tailspool".split())
+
+    # 数据质量报告，按sj_bs_bj、xxly、sj_type、sj_ztxx统计
+    # cmdline.execute("scrapy qualityreport -x 浙江省法院公开网-限制招投标".split())
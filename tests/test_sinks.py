@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pytest.importorskip('pyarrow')
+pytest.importorskip('scrapy')
+pytest.importorskip('twisted')
+
+from bourse.utils.sinks import ParquetSink, read_sink_file, sink_files
+
+
+def read_all(directory):
+    rows = {}
+    for path in sink_files(directory):
+        rows.update(read_sink_file(path))
+    return rows
+
+
+def test_parquet_mixed_keys(tmp_path):
+    written = []
+    sink = ParquetSink(directory=str(tmp_path), name='test', max_bytes=1 << 30, batch_docs=2,
+                       on_written=lambda batch, result, cost: written.extend(result['created']))
+    # 第一批: 第二条才有b，cf_wsh全是None
+    sink.add('1', {'a': 1, 'cf_wsh': None})
+    sink.add('2', {'a': 2, 'b': 'x', 'cf_wsh': None})
+    # 第二批: cf_wsh有字符串，新字段img_url，a有小数
+    sink.add('3', {'a': 3, 'cf_wsh': '深证上(2019)1号', 'img_url': 'http://example.com/1.png'})
+    sink.add('4', {'a': 4.5, 'b': 'y'})
+    sink.close()
+
+    assert sorted(written) == ['1', '2', '3', '4']
+    assert read_all(str(tmp_path)) == {
+        '1': {'a': 1},
+        '2': {'a': 2, 'b': 'x'},
+        '3': {'a': 3, 'cf_wsh': '深证上(2019)1号', 'img_url': 'http://example.com/1.png'},
+        '4': {'a': 4.5, 'b': 'y'},
+    }
+
+
+def test_parquet_type_conflict(tmp_path):
+    sink = ParquetSink(directory=str(tmp_path), name='test', max_bytes=1 << 30, batch_docs=1,
+                       on_written=lambda batch, result, cost: None)
+    sink.add('1', {'nsrlx': 1})
+    sink.add('2', {'nsrlx': '法人'})
+    sink.close()
+
+    assert read_all(str(tmp_path)) == {'1': {'nsrlx': 1}, '2': {'nsrlx': '法人'}}
+
+
+def test_parquet_mixed_types_in_batch(tmp_path):
+    sink = ParquetSink(directory=str(tmp_path), name='test', max_bytes=1 << 30, batch_docs=3,
+                       on_written=lambda batch, result, cost: None)
+    # 同一批里nsrlx有整数和字符串，bz有字符串和列表，ext是字典，cf_wsh是像JSON的字符串
+    sink.add('1', {'nsrlx': 1, 'bz': '正常', 'cf_wsh': '[1]'})
+    sink.add('2', {'nsrlx': '法人', 'bz': ['a', 'b'], 'ext': {'page': 2}, 'cf_wsh': '"x"'})
+    sink.add('3', {'nsrlx': '12', 'bz': '{"a": 1}', 'ext': None})
+    sink.close()
+
+    assert read_all(str(tmp_path)) == {
+        '1': {'nsrlx': 1, 'bz': '正常', 'cf_wsh': '[1]'},
+        '2': {'nsrlx': '法人', 'bz': ['a', 'b'], 'ext': {'page': 2}, 'cf_wsh': '"x"'},
+        '3': {'nsrlx': '12', 'bz': '{"a": 1}'},
+    }